@@ -0,0 +1,135 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Coroutine, Dict, List, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Shares one in-flight computation between concurrent callers with the same key.
+
+    The first caller for a key runs ``factory()`` as a task; callers arriving
+    while it runs await the same task and get its result or exception. The
+    task is shielded, so a caller that goes away does not cancel it for the
+    others. The key is released when the task finishes: later callers start
+    a new computation and are expected to look in a cache first.
+    """
+
+    def __init__(self) -> None:
+        self._flights: Dict[str, asyncio.Task] = {}
+        self.started = 0
+        self.shared = 0
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._flights
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    def tasks(self) -> List[asyncio.Task]:
+        return list(self._flights.values())
+
+    async def run(self, key: str, factory: Callable[[], Coroutine[Any, Any, T]]) -> Tuple[T, bool]:
+        """Result of the flight for ``key`` and whether another caller started it."""
+        task = self._flights.get(key)
+        shared = task is not None
+        if task is None:
+            task = asyncio.create_task(factory())
+            self._flights[key] = task
+            task.add_done_callback(lambda finished: self._finish(key, finished))
+            self.started += 1
+        else:
+            self.shared += 1
+        return await asyncio.shield(task), shared
+
+    def _finish(self, key: str, task: asyncio.Task) -> None:
+        if self._flights.get(key) is task:
+            del self._flights[key]
+        # Retrieves the exception of a flight whose callers have all gone away, so it is not reported as lost.
+        if not task.cancelled():
+            task.exception()
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, retry_after: float):
+        self.retry_after = retry_after
+        super().__init__(f"admission refused, retry after {retry_after:.1f}s")
+
+
+class TokenBucketLimiter:
+    """Per-client token buckets with a bounded wait.
+
+    Each client earns ``rate`` tokens per second up to ``burst``. A request
+    that finds too few tokens reserves them anyway (the balance goes
+    negative) and sleeps until they have accrued, so a client's waiting
+    requests are admitted in arrival order at its rate. The request is
+    rejected instead when that wait would exceed ``max_wait`` or
+    ``max_queue`` requests are already waiting; ``AdmissionRejected`` carries
+    the seconds until it would be admitted. Costs above ``burst`` are charged
+    as ``burst``. Buckets are kept for the ``max_clients`` most recently seen
+    clients; the limits apply per process.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: float,
+        max_wait: float = 10.0,
+        max_queue: int = 256,
+        max_clients: int = 10000,
+    ):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self.max_clients = max_clients
+        self._buckets: OrderedDict[str, Tuple[float, float]] = OrderedDict()
+        self.waiting = 0
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+
+    def _balance(self, client: str, now: float) -> float:
+        tokens, updated = self._buckets.pop(client, (self.burst, now))
+        return min(self.burst, tokens + (now - updated) * self.rate)
+
+    def _store(self, client: str, tokens: float, now: float) -> None:
+        self._buckets[client] = (tokens, now)
+        while len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+
+    async def acquire(self, client: str, cost: float = 1.0) -> float:
+        """Takes ``cost`` tokens from the client's bucket, waiting for them if needed; returns the seconds waited."""
+        cost = min(cost, self.burst)
+        now = time.monotonic()
+        tokens = self._balance(client, now)
+        wait = (cost - tokens) / self.rate if tokens < cost else 0.0
+        if wait and (wait > self.max_wait or self.waiting >= self.max_queue):
+            self._store(client, tokens, now)
+            self.rejected += 1
+            raise AdmissionRejected(wait)
+        self._store(client, tokens - cost, now)
+        if not wait:
+            self.admitted += 1
+            return 0.0
+        self.queued += 1
+        self.waiting += 1
+        try:
+            await asyncio.sleep(wait)
+        except asyncio.CancelledError:
+            now = time.monotonic()
+            self._store(client, min(self.burst, self._balance(client, now) + cost), now)
+            raise
+        finally:
+            self.waiting -= 1
+        return wait
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "clients": len(self._buckets),
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+        }
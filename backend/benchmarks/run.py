@@ -0,0 +1,215 @@
+"""Backend benchmark suite.
+
+Run from the backend directory::
+
+    python -m benchmarks.run --sizes 10 100 1000 10000 100000
+    python -m benchmarks.run --compare benchmarks/results/<previous>.json
+
+Every run writes a JSON file with per-stage timings to ``benchmarks/results``.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+from benchmarks.stub_llm import StubServer, build_reply
+from benchmarks.topology import generate_topology
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+
+def measure(fn: Callable[[], Any], min_time: float, max_repeats: int) -> Dict[str, float]:
+    samples: List[float] = []
+    started = time.perf_counter()
+    while len(samples) < max_repeats and (not samples or time.perf_counter() - started < min_time):
+        begin = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - begin)
+    return summarize(samples)
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    return {
+        "repeats": len(ordered),
+        "min_ms": round(ordered[0] * 1000, 3),
+        "median_ms": round(statistics.median(ordered) * 1000, 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+    }
+
+
+def variant(payload: Dict[str, Any], index: int) -> Dict[str, Any]:
+    """``payload`` with a distinct first node name, so concurrent requests do not share one upstream call."""
+    nodes = list(payload["nodes"])
+    if nodes:
+        nodes[0] = dict(nodes[0], name=f"{nodes[0]['name']} #{index}")
+    return dict(payload, nodes=nodes)
+
+
+async def measure_e2e(main: Any, payload: Dict[str, Any], requests: int, concurrency: int) -> Dict[str, Dict[str, float]]:
+    import httpx
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as http:
+        async def one(body: Dict[str, Any]) -> float:
+            begin = time.perf_counter()
+            response = await http.post("/api/analyze", json=body)
+            response.raise_for_status()
+            return time.perf_counter() - begin
+
+        sequential = [await one(payload) for _ in range(requests)]
+        begin = time.perf_counter()
+        burst = await asyncio.gather(*(one(variant(payload, index)) for index in range(concurrency)))
+        elapsed = time.perf_counter() - begin
+
+    results = {"analyze_e2e": summarize(sequential), "analyze_burst": summarize(list(burst))}
+    results["analyze_burst"]["concurrency"] = concurrency
+    results["analyze_burst"]["throughput_rps"] = round(concurrency / elapsed, 2)
+    return results
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: List[Dict[str, Any]], baseline_path: Path, tolerance: float) -> int:
+    baseline = {
+        (row["stage"], row["size"]): row for row in json.loads(baseline_path.read_text(encoding="utf-8"))["results"]
+    }
+    regressions = 0
+    print(f"\nComparison with {baseline_path} (tolerance x{tolerance}):")
+    for row in current:
+        previous = baseline.get((row["stage"], row["size"]))
+        if not previous or not previous["median_ms"]:
+            continue
+        factor = row["median_ms"] / previous["median_ms"]
+        flag = "REGRESSION" if factor > tolerance else ""
+        regressions += bool(flag)
+        print(f"  {row['stage']:<22} {row['size']:>7}  {previous['median_ms']:>10.3f} -> {row['median_ms']:>10.3f} ms  x{factor:.2f} {flag}")
+    return regressions
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000, 100000])
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--avg-degree", type=float, default=3.0)
+    parser.add_argument("--coverage", type=float, default=0.6)
+    parser.add_argument("--quantum", action="store_true")
+    parser.add_argument("--fstec", action="store_true")
+    parser.add_argument("--min-time", type=float, default=0.5, help="seconds to keep repeating each stage")
+    parser.add_argument("--max-repeats", type=int, default=50)
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="stub upstream latency in seconds")
+    parser.add_argument("--llm-recommendations", type=int, default=10)
+    parser.add_argument("--llm-graph-nodes", type=int, default=20)
+    parser.add_argument("--e2e-max-size", type=int, default=10000, help="largest size run end to end")
+    parser.add_argument("--e2e-requests", type=int, default=5)
+    parser.add_argument("--e2e-concurrency", type=int, default=20)
+    parser.add_argument("--out", type=Path, default=None)
+    parser.add_argument("--compare", type=Path, default=None, help="previous results file")
+    parser.add_argument("--tolerance", type=float, default=1.25)
+    args = parser.parse_args(argv)
+
+    stub = StubServer(
+        latency=args.llm_latency,
+        recommendations=args.llm_recommendations,
+        graph_nodes=args.llm_graph_nodes,
+    )
+    with stub:
+        os.environ["LLM_BASE_URL"] = stub.base_url
+        os.environ.setdefault("OPENROUTER_API_KEY", "benchmark")
+        os.environ["ANALYSIS_CACHE_SIZE"] = "0"
+        os.environ["SIMILARITY_REUSE"] = "false"
+        os.environ["ADMISSION_RATE"] = "0"
+        os.environ.pop("ANALYSIS_CACHE_DB", None)
+        import main as backend
+        import scoring
+
+        reply = build_reply(args.llm_recommendations, args.llm_graph_nodes)
+        rows: List[Dict[str, Any]] = []
+        e2e_payloads: List[tuple] = []
+
+        def record(stage: str, size: int, stats: Dict[str, float]) -> None:
+            rows.append({"stage": stage, "size": size, **stats})
+            print(f"{stage:<22} {size:>7}  median {stats['median_ms']:>10.3f} ms  ({stats['repeats']} runs)")
+
+        for size in args.sizes:
+            payload = generate_topology(
+                size,
+                seed=args.seed,
+                avg_degree=args.avg_degree,
+                coverage=args.coverage,
+                quantum=args.quantum,
+                fstec=args.fstec,
+            )
+            request = backend.AnalysisRequest.model_validate(payload)
+            threat = request.threat_model
+            flags = (threat.is_fstec_compliant, threat.has_large_pd_storage, scoring.is_quantum_threat(threat))
+            nodes = request.compact_nodes()
+            local = scoring.score_request(request)
+            timing = {"min_time": args.min_time, "max_repeats": args.max_repeats}
+
+            record("validate", size, measure(lambda: backend.AnalysisRequest.model_validate(payload), **timing))
+            record("extract_connections", size, measure(lambda: scoring.extract_connections(nodes), **timing))
+            record("evaluate_security", size, measure(lambda: scoring.evaluate_security(nodes, *flags), **timing))
+            record(
+                "evaluate_columnar",
+                size,
+                measure(
+                    lambda: scoring.evaluate_security_columnar(nodes, *flags, with_details=False, with_ideal=False),
+                    **timing,
+                ),
+            )
+            record("evaluate_grouped", size, measure(lambda: scoring.evaluate_security_grouped(nodes, *flags), **timing))
+            record("build_prompt", size, measure(lambda: backend.build_user_prompt(request, *local), **timing))
+            record("parse_response", size, measure(lambda: backend.merge_llm_result(request, local[0], local[1], reply), **timing))
+
+            if size <= args.e2e_max_size:
+                e2e_payloads.append((size, payload))
+
+        # One event loop for every end-to-end run: the pooled upstream client
+        # keeps connections bound to the loop that opened them.
+        async def run_e2e() -> None:
+            for size, payload in e2e_payloads:
+                for stage, stats in (await measure_e2e(backend, payload, args.e2e_requests, args.e2e_concurrency)).items():
+                    record(stage, size, stats)
+
+        asyncio.run(run_e2e())
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "revision": git_revision(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "args": {key: str(value) if isinstance(value, Path) else value for key, value in vars(args).items()},
+            "upstream_requests": stub.app.state.requests,
+        },
+        "results": rows,
+    }
+    out = args.out or RESULTS_DIR / f"bench-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"\nResults written to {out}")
+
+    if args.compare:
+        return 1 if compare(rows, args.compare, args.tolerance) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+import asyncio
+import json
+import socket
+import threading
+import time
+from typing import Any, Dict, Sequence
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+def build_reply(recommendations: int = 10, graph_nodes: int = 20) -> str:
+    nodes = [{"id": f"a{i}", "data": {"label": f"asset {i}"}, "type": "vulnerable"} for i in range(graph_nodes)]
+    edges = [
+        {"id": f"e{i}", "source": f"a{i}", "target": f"a{i + 1}", "label": "lateral movement"}
+        for i in range(graph_nodes - 1)
+    ]
+    body = {
+        "score": 42,
+        "summary": "Synthetic assessment produced by the benchmark stub.",
+        "recommendations": [f"Synthetic recommendation {i}" for i in range(recommendations)],
+        "attack_graph": {"nodes": nodes, "edges": edges},
+    }
+    return "Here is the analysis:\n```json\n" + json.dumps(body, ensure_ascii=False) + "\n```"
+
+
+def create_app(
+    latency: float = 0.5,
+    recommendations: int = 10,
+    graph_nodes: int = 20,
+    chunk_size: int = 64,
+    model_latency: Dict[str, float] | None = None,
+    failing_models: Sequence[str] = (),
+) -> FastAPI:
+    """OpenAI-compatible ``/chat/completions`` stand-in with fixed latency and reply size.
+
+    ``model_latency`` overrides the latency per requested model and models in
+    ``failing_models`` answer with HTTP 503, to simulate a degraded upstream.
+    """
+    app = FastAPI()
+    reply = build_reply(recommendations, graph_nodes)
+    app.state.requests = 0
+    app.state.model_requests = {}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        payload: Dict[str, Any] = await request.json()
+        app.state.requests += 1
+        prompt_chars = sum(len(message.get("content") or "") for message in payload.get("messages", []))
+        usage = {
+            "prompt_tokens": prompt_chars // 3 + 1,
+            "completion_tokens": len(reply) // 3 + 1,
+            "total_tokens": prompt_chars // 3 + len(reply) // 3 + 2,
+        }
+        created = int(time.time())
+        model = payload.get("model", "stub")
+        app.state.model_requests[model] = app.state.model_requests.get(model, 0) + 1
+        delay = (model_latency or {}).get(model, latency)
+        if model in failing_models:
+            await asyncio.sleep(delay)
+            return JSONResponse({"error": {"message": f"{model} is unavailable"}}, status_code=503)
+
+        if payload.get("stream"):
+            async def chunks():
+                step = delay / max(1, len(reply) // chunk_size)
+                for start in range(0, len(reply), chunk_size):
+                    await asyncio.sleep(step)
+                    chunk = {
+                        "id": "stub",
+                        "object": "chat.completion.chunk",
+                        "created": created,
+                        "model": model,
+                        "choices": [{"index": 0, "delta": {"content": reply[start:start + chunk_size]}, "finish_reason": None}],
+                    }
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                if (payload.get("stream_options") or {}).get("include_usage"):
+                    final = {"id": "stub", "object": "chat.completion.chunk", "created": created, "model": model}
+                    yield f"data: {json.dumps(dict(final, choices=[], usage=usage))}\n\n"
+                yield "data: [DONE]\n\n"
+
+            return StreamingResponse(chunks(), media_type="text/event-stream")
+
+        await asyncio.sleep(delay)
+        return {
+            "id": "stub",
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+            "usage": usage,
+        }
+
+    return app
+
+
+class StubServer:
+    """Runs the stub app with uvicorn in a background thread on a free local port."""
+
+    def __init__(self, **options: Any):
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            self.port = probe.getsockname()[1]
+        self.app = create_app(**options)
+        self.server = uvicorn.Server(uvicorn.Config(self.app, host="127.0.0.1", port=self.port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/v1"
+
+    def __enter__(self) -> "StubServer":
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.server.should_exit = True
+        self.thread.join(timeout=5)
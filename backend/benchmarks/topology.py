@@ -0,0 +1,86 @@
+import random
+from typing import Any, Dict, List
+
+DEFAULT_TYPE_MIX = {
+    "pc": 0.45,
+    "user": 0.2,
+    "switch": 0.1,
+    "router": 0.05,
+    "printer": 0.08,
+    "wifi_ap": 0.07,
+    "firewall": 0.05,
+}
+
+
+def generate_topology(
+    size: int,
+    seed: int = 0,
+    avg_degree: float = 3.0,
+    coverage: float = 0.6,
+    type_mix: Dict[str, float] | None = None,
+    quantum: bool = False,
+    fstec: bool = False,
+) -> Dict[str, Any]:
+    """Seeded synthetic ``AnalysisRequest`` payload.
+
+    ``coverage`` is the probability that each optional control is configured
+    on a node, ``avg_degree`` the expected number of links per node (links are
+    drawn mostly between neighbouring ids to mimic segmented networks).
+    """
+    rnd = random.Random(seed)
+    mix = type_mix or DEFAULT_TYPE_MIX
+    types = list(mix)
+    weights = [mix[name] for name in types]
+    nodes: List[Dict[str, Any]] = []
+
+    for index in range(size):
+        node_type = rnd.choices(types, weights)[0]
+        node: Dict[str, Any] = {"id": f"n{index}", "type": node_type, "name": f"{node_type.upper()}-{index:06d}"}
+        if rnd.random() < 0.8:
+            node["weight"] = float(rnd.randint(1, 10))
+        if rnd.random() < coverage:
+            node["antivirus"] = rnd.choice(["Kaspersky Endpoint Security", "Defender", "QuantumShield EDR"])
+        if rnd.random() < coverage:
+            node["encryption"] = ["AES-256"] + (["Kyber"] if quantum and rnd.random() < 0.1 else [])
+        if rnd.random() < coverage:
+            node["vpn"] = rnd.choice(["WireGuard", "ViPNet TLS", "IPsec"])
+        node["auth_type"] = rnd.choice(["password", "FIDO2 token", "OTP"]) if rnd.random() < coverage else "password"
+        if node_type == "wifi_ap" or rnd.random() < 0.05:
+            strong = rnd.random() < coverage
+            node["wifi"] = {
+                "password": "CorrectHorseBattery!42" if strong else "12345",
+                "encryption": "WPA3-Enterprise" if strong else "WPA2-PSK",
+            }
+        node["security_policy"] = {
+            "password_hashed": rnd.random() < coverage,
+            "backup_frequency": rnd.choice(["daily", "weekly", "monthly"]) if rnd.random() < coverage else "none",
+        }
+        if rnd.random() < 0.1:
+            node["personal_data"] = {"enabled": True, "count": rnd.randint(10, 100000)}
+        if rnd.random() < 0.02:
+            node["professional_software"] = [rnd.choice(["ELK SIEM", "Veeam Backup", "1C", "MS Office"])]
+        if node_type == "firewall" and rnd.random() < coverage:
+            node["firewall_type"] = "NGFW"
+        nodes.append(node)
+
+    for index, node in enumerate(nodes):
+        links = set()
+        for _ in range(int(avg_degree / 2 + rnd.random())):
+            if rnd.random() < 0.8:
+                target = index + rnd.randint(1, 16)
+            else:
+                target = rnd.randrange(size)
+            if target < size and target != index:
+                links.add(f"n{target}")
+        node["connections"] = sorted(links)
+
+    return {
+        "nodes": nodes,
+        "threat_model": {
+            "quantum_capability": "QuantumAttack" if quantum else "UsualAttack",
+            "budget_usd": 1_000_000,
+            "has_error_correction": True,
+            "is_fstec_compliant": fstec,
+            "has_large_pd_storage": True,
+        },
+    }
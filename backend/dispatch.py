@@ -0,0 +1,162 @@
+import asyncio
+import time
+from collections import Counter, deque
+from typing import Awaitable, Callable, Dict, List, Sequence, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker.
+
+    Opens after ``failure_threshold`` failures in a row and rejects calls for
+    ``reset_timeout`` seconds. After that a single trial call is let through
+    (half-open); its outcome closes the breaker or opens it again.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.state = self.CLOSED
+        self.failures = 0
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def release(self) -> None:
+        """Gives back a trial call that was cancelled before it had an outcome."""
+        if self.state == self.HALF_OPEN:
+            self.state = self.OPEN
+
+
+class ChainExhausted(Exception):
+    def __init__(self, errors: List[Tuple[str, BaseException]], skipped: List[str]):
+        self.errors = errors
+        self.skipped = skipped
+        parts = [f"{model}: {type(error).__name__}: {error}" for model, error in errors]
+        parts += [f"{model}: circuit open" for model in skipped]
+        super().__init__("; ".join(parts) or "no models configured")
+
+
+class ModelChain:
+    """Ordered model list called with hedged requests.
+
+    ``call(attempt)`` starts ``attempt(model)`` on the first healthy model.
+    When it has not finished after the hedge delay, the next healthy model is
+    started as well, and a failed attempt starts the next one right away. The
+    first attempt to return wins and the others are cancelled. Models whose
+    breaker is open are skipped.
+
+    With a fixed ``hedge_delay`` of ``None`` the delay follows the
+    ``hedge_quantile`` of recent successful latencies, but never drops below
+    ``min_hedge_delay``; until ``min_samples`` latencies are known
+    ``initial_hedge_delay`` is used.
+    """
+
+    def __init__(
+        self,
+        models: Sequence[str],
+        hedge_delay: float | None = None,
+        failure_threshold: int = 3,
+        reset_timeout: float = 30.0,
+        hedge_quantile: float = 0.95,
+        min_hedge_delay: float = 2.0,
+        initial_hedge_delay: float = 20.0,
+        min_samples: int = 20,
+        window: int = 200,
+    ):
+        self.models = list(dict.fromkeys(models))
+        self.fixed_hedge_delay = hedge_delay
+        self.hedge_quantile = hedge_quantile
+        self.min_hedge_delay = min_hedge_delay
+        self.initial_hedge_delay = initial_hedge_delay
+        self.min_samples = min_samples
+        self.breakers = {model: CircuitBreaker(failure_threshold, reset_timeout) for model in self.models}
+        self.latencies: deque[float] = deque(maxlen=window)
+        self.hedges: Counter[str] = Counter()
+        self.wins: Counter[str] = Counter()
+        self.exhausted = 0
+
+    def hedge_delay(self) -> float:
+        if self.fixed_hedge_delay is not None:
+            return self.fixed_hedge_delay
+        if len(self.latencies) < self.min_samples:
+            return self.initial_hedge_delay
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(self.hedge_quantile * len(ordered)))
+        return max(self.min_hedge_delay, ordered[index])
+
+    def breaker_states(self) -> Dict[str, str]:
+        return {model: breaker.state for model, breaker in self.breakers.items()}
+
+    async def call(self, attempt: Callable[[str], Awaitable[T]]) -> Tuple[str, T]:
+        remaining = iter(self.models)
+        running: Dict[asyncio.Task, Tuple[str, float]] = {}
+        errors: List[Tuple[str, BaseException]] = []
+        skipped: List[str] = []
+
+        def launch(hedge: bool) -> bool:
+            for model in remaining:
+                if not self.breakers[model].allow():
+                    skipped.append(model)
+                    continue
+                if hedge:
+                    self.hedges[model] += 1
+                running[asyncio.ensure_future(attempt(model))] = (model, time.perf_counter())
+                return True
+            return False
+
+        launch(hedge=False)
+        try:
+            while running:
+                done, _ = await asyncio.wait(
+                    running,
+                    timeout=self.hedge_delay(),
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    launch(hedge=True)
+                    continue
+                winner: Tuple[str, T] | None = None
+                failed = 0
+                for task in done:
+                    model, started = running.pop(task)
+                    error = task.exception()
+                    if error is not None:
+                        self.breakers[model].record_failure()
+                        errors.append((model, error))
+                        failed += 1
+                        continue
+                    self.breakers[model].record_success()
+                    self.latencies.append(time.perf_counter() - started)
+                    if winner is None:
+                        winner = model, task.result()
+                if winner is not None:
+                    self.wins[winner[0]] += 1
+                    return winner
+                for _ in range(failed):
+                    launch(hedge=False)
+        finally:
+            for task, (model, _) in running.items():
+                task.cancel()
+                self.breakers[model].release()
+        self.exhausted += 1
+        raise ChainExhausted(errors, skipped)
@@ -0,0 +1,154 @@
+import heapq
+from itertools import chain
+from typing import Dict, Iterable, List, Sequence, Set, Tuple
+
+import numpy as np
+
+
+class CSRGraph:
+    """Directed weighted graph stored as compressed sparse row arrays.
+
+    ``indptr[v]:indptr[v + 1]`` slices ``indices``/``weights`` to the outgoing
+    edges of vertex ``v``. Python list copies of the arrays are kept for the
+    scalar-heavy search loops, where list indexing is much cheaper than
+    indexing NumPy arrays element by element.
+    """
+
+    def __init__(self, size: int, sources: np.ndarray, targets: np.ndarray, weights: np.ndarray):
+        order = np.argsort(sources, kind="stable")
+        self.size = size
+        self.indices = targets[order].astype(np.int64)
+        self.weights = weights[order].astype(np.float64)
+        counts = np.bincount(sources, minlength=size)
+        self.indptr = np.zeros(size + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.indptr[1:])
+        self._indptr = self.indptr.tolist()
+        self._indices = self.indices.tolist()
+        self._weights = self.weights.tolist()
+
+    @classmethod
+    def from_edges(
+        cls,
+        size: int,
+        edges: Iterable[Tuple[int, int, float]],
+    ) -> "CSRGraph":
+        edge_array = np.array(list(edges), dtype=np.float64).reshape(-1, 3)
+        return cls(
+            size,
+            edge_array[:, 0].astype(np.int64),
+            edge_array[:, 1].astype(np.int64),
+            edge_array[:, 2],
+        )
+
+    @property
+    def edge_count(self) -> int:
+        return len(self._indices)
+
+    def neighbours(self, vertex: int) -> List[int]:
+        return self._indices[self._indptr[vertex]:self._indptr[vertex + 1]]
+
+    def edge_weight(self, source: int, target: int) -> float:
+        for offset in range(self._indptr[source], self._indptr[source + 1]):
+            if self._indices[offset] == target:
+                return self._weights[offset]
+        raise KeyError((source, target))
+
+    def dijkstra(
+        self,
+        source: int,
+        targets: Set[int] | None = None,
+        stop_count: int = 1,
+        banned_vertices: Set[int] | None = None,
+        banned_edges: Set[Tuple[int, int]] | None = None,
+    ) -> Tuple[List[float], List[int]]:
+        """Single-source shortest paths; returns ``(distance, predecessor)`` lists.
+
+        Unreachable vertices keep an infinite distance and predecessor ``-1``.
+        When ``targets`` is given the search stops as soon as ``stop_count`` of
+        them are settled, so only their distances are guaranteed final.
+        """
+        inf = float("inf")
+        distance = [inf] * self.size
+        predecessor = [-1] * self.size
+        indptr, indices, weights = self._indptr, self._indices, self._weights
+        banned_vertices = banned_vertices or set()
+        banned_edges = banned_edges or set()
+        remaining = stop_count if targets else -1
+        distance[source] = 0.0
+        heap = [(0.0, source)]
+        while heap:
+            cost, vertex = heapq.heappop(heap)
+            if cost > distance[vertex]:
+                continue
+            if targets and vertex in targets:
+                remaining -= 1
+                if remaining == 0:
+                    break
+            for offset in range(indptr[vertex], indptr[vertex + 1]):
+                neighbour = indices[offset]
+                if neighbour in banned_vertices:
+                    continue
+                if banned_edges and (vertex, neighbour) in banned_edges:
+                    continue
+                candidate = cost + weights[offset]
+                if candidate < distance[neighbour]:
+                    distance[neighbour] = candidate
+                    predecessor[neighbour] = vertex
+                    heapq.heappush(heap, (candidate, neighbour))
+        return distance, predecessor
+
+    def k_shortest_paths(self, source: int, target: int, k: int) -> List[Tuple[float, List[int]]]:
+        """Yen's algorithm for the ``k`` cheapest loopless paths from ``source`` to ``target``."""
+        distance, predecessor = self.dijkstra(source, {target})
+        if distance[target] == float("inf"):
+            return []
+        found: List[Tuple[float, List[int]]] = [(distance[target], trace_path(predecessor, target))]
+        candidates: List[Tuple[float, List[int]]] = []
+        seen: Set[Tuple[int, ...]] = {tuple(found[0][1])}
+
+        while len(found) < k:
+            previous = found[-1][1]
+            for spur_index in range(len(previous) - 1):
+                spur_node = previous[spur_index]
+                root = previous[:spur_index + 1]
+                banned_edges = {
+                    (path[spur_index], path[spur_index + 1])
+                    for _, path in found
+                    if len(path) > spur_index + 1 and path[:spur_index + 1] == root
+                }
+                spur_distance, spur_predecessor = self.dijkstra(
+                    spur_node,
+                    {target},
+                    banned_vertices=set(root[:-1]),
+                    banned_edges=banned_edges,
+                )
+                if spur_distance[target] == float("inf"):
+                    continue
+                path = root[:-1] + trace_path(spur_predecessor, target)
+                key = tuple(path)
+                if key in seen:
+                    continue
+                seen.add(key)
+                heapq.heappush(candidates, (self.path_cost(path), path))
+            if not candidates:
+                break
+            found.append(heapq.heappop(candidates))
+        return found
+
+    def path_cost(self, path: Sequence[int]) -> float:
+        return sum(self.edge_weight(a, b) for a, b in zip(path, path[1:]))
+
+
+def trace_path(predecessor: List[int], target: int) -> List[int]:
+    path = [target]
+    while predecessor[path[-1]] != -1:
+        path.append(predecessor[path[-1]])
+    path.reverse()
+    return path
+
+
+def index_edges(ids: Sequence[str], pairs: Iterable[Tuple[str, str]]) -> Tuple[Dict[str, int], np.ndarray]:
+    """Maps string ids to vertex numbers and returns the ``(m, 2)`` edge array."""
+    position = {node_id: index for index, node_id in enumerate(ids)}
+    flat = np.fromiter(map(position.__getitem__, chain.from_iterable(pairs)), dtype=np.int64)
+    return position, flat.reshape(-1, 2)
@@ -0,0 +1,315 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, Iterable, List
+
+
+class AnalysisHistory:
+    """Indexed SQLite store of past analyses.
+
+    Each analysis keeps its site, topology hash, scores and finding codes in
+    indexed columns; the full result is stored zlib-compressed in a separate
+    table keyed by its content hash, so repeated identical results (cache
+    hits) share one payload. Listing, diffing and trend queries only touch
+    the indexes and the small ``analyses``/``analysis_findings`` rows.
+    Analyses older than ``retention_seconds`` are purged every
+    ``purge_every`` records.
+    """
+
+    def __init__(self, db_path: str, retention_seconds: float = 365 * 86400.0, purge_every: int = 500):
+        self.retention_seconds = retention_seconds
+        self.purge_every = purge_every
+        self._lock = threading.Lock()
+        self._since_purge = 0
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA foreign_keys=ON")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS analysis_payloads (
+                hash TEXT PRIMARY KEY, data BLOB NOT NULL, raw_size INTEGER NOT NULL
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS analyses (
+                id INTEGER PRIMARY KEY,
+                site TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                topology_hash TEXT NOT NULL,
+                threat_model TEXT NOT NULL,
+                score INTEGER,
+                local_score INTEGER,
+                mode TEXT NOT NULL,
+                source TEXT NOT NULL,
+                model TEXT,
+                node_count INTEGER NOT NULL,
+                payload_hash TEXT NOT NULL REFERENCES analysis_payloads (hash)
+            );
+            CREATE INDEX IF NOT EXISTS analyses_site_time
+                ON analyses (site, created_at, score, local_score);
+            CREATE INDEX IF NOT EXISTS analyses_time ON analyses (created_at, score, local_score);
+            CREATE INDEX IF NOT EXISTS analyses_topology ON analyses (topology_hash, created_at);
+            CREATE INDEX IF NOT EXISTS analyses_payload ON analyses (payload_hash);
+            CREATE TABLE IF NOT EXISTS analysis_findings (
+                analysis_id INTEGER NOT NULL REFERENCES analyses (id) ON DELETE CASCADE,
+                code TEXT NOT NULL,
+                site TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (analysis_id, code)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS analysis_findings_site_time
+                ON analysis_findings (site, created_at, code);
+            CREATE INDEX IF NOT EXISTS analysis_findings_time ON analysis_findings (created_at, code);
+            """
+        )
+        self._db.commit()
+
+    def record(
+        self,
+        site: str,
+        topology_hash: str,
+        threat_model: Dict[str, Any],
+        result: Dict[str, Any],
+        source: str,
+        node_count: int,
+        created_at: float | None = None,
+    ) -> int:
+        created_at = time.time() if created_at is None else created_at
+        raw = json.dumps(result, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        payload_hash = hashlib.sha256(raw).hexdigest()
+        local_score = result.get("local_score") or {}
+        codes = sorted(set(local_score.get("finding_codes") or []))
+        # Compression runs outside the lock; it dominates the cost for large results.
+        data = zlib.compress(raw, 6)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR IGNORE INTO analysis_payloads (hash, data, raw_size) VALUES (?, ?, ?)",
+                (payload_hash, data, len(raw)),
+            )
+            cursor = self._db.execute(
+                "INSERT INTO analyses (site, created_at, topology_hash, threat_model, score, local_score, "
+                "mode, source, model, node_count, payload_hash) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    site,
+                    created_at,
+                    topology_hash,
+                    json.dumps(threat_model, ensure_ascii=False, sort_keys=True),
+                    result.get("score"),
+                    local_score.get("value"),
+                    result.get("mode", "llm"),
+                    source,
+                    result.get("model"),
+                    node_count,
+                    payload_hash,
+                ),
+            )
+            analysis_id = cursor.lastrowid
+            self._db.executemany(
+                "INSERT INTO analysis_findings (analysis_id, code, site, created_at) VALUES (?, ?, ?, ?)",
+                [(analysis_id, code, site, created_at) for code in codes],
+            )
+            self._since_purge += 1
+            if self._since_purge >= self.purge_every:
+                self._purge(time.time() - self.retention_seconds)
+            self._db.commit()
+        return analysis_id
+
+    def list(
+        self,
+        site: str,
+        limit: int = 50,
+        before: float | None = None,
+        since: float | None = None,
+    ) -> List[Dict[str, Any]]:
+        """Newest first; pass the last ``created_at`` as ``before`` for the next page."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, created_at, topology_hash, score, local_score, mode, source, model, node_count "
+                "FROM analyses WHERE site = ? AND created_at < ? AND created_at >= ? "
+                "ORDER BY created_at DESC LIMIT ?",
+                (site, float("inf") if before is None else before, since or 0.0, limit),
+            ).fetchall()
+            codes = self._codes([row[0] for row in rows])
+        return [
+            {
+                "id": analysis_id,
+                "created_at": created_at,
+                "topology_hash": topology_hash,
+                "score": score,
+                "local_score": local_score,
+                "mode": mode,
+                "source": source,
+                "model": model,
+                "node_count": node_count,
+                "finding_codes": codes.get(analysis_id, []),
+            }
+            for analysis_id, created_at, topology_hash, score, local_score, mode, source, model, node_count in rows
+        ]
+
+    def get(self, analysis_id: int, with_result: bool = True) -> Dict[str, Any] | None:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT a.site, a.created_at, a.topology_hash, a.threat_model, a.score, a.local_score, a.mode, "
+                "a.source, a.model, a.node_count, p.data FROM analyses a "
+                "JOIN analysis_payloads p ON p.hash = a.payload_hash WHERE a.id = ?",
+                (analysis_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            codes = self._codes([analysis_id]).get(analysis_id, [])
+        site, created_at, topology_hash, threat_model, score, local_score, mode, source, model, node_count, data = row
+        analysis = {
+            "id": analysis_id,
+            "site": site,
+            "created_at": created_at,
+            "topology_hash": topology_hash,
+            "threat_model": json.loads(threat_model),
+            "score": score,
+            "local_score": local_score,
+            "mode": mode,
+            "source": source,
+            "model": model,
+            "node_count": node_count,
+            "finding_codes": codes,
+        }
+        if with_result:
+            analysis["result"] = json.loads(zlib.decompress(data))
+        return analysis
+
+    def diff(self, base_id: int, target_id: int) -> Dict[str, Any] | None:
+        base = self.get(base_id, with_result=False)
+        target = self.get(target_id, with_result=False)
+        if base is None or target is None:
+            return None
+
+        def delta(key: str) -> int | None:
+            if base[key] is None or target[key] is None:
+                return None
+            return target[key] - base[key]
+
+        return {
+            "base": base,
+            "target": target,
+            "score_delta": delta("score"),
+            "local_score_delta": delta("local_score"),
+            "node_count_delta": delta("node_count"),
+            "topology_changed": base["topology_hash"] != target["topology_hash"],
+            "threat_model_changed": base["threat_model"] != target["threat_model"],
+            "findings_added": sorted(set(target["finding_codes"]) - set(base["finding_codes"])),
+            "findings_removed": sorted(set(base["finding_codes"]) - set(target["finding_codes"])),
+            "findings_kept": sorted(set(base["finding_codes"]) & set(target["finding_codes"])),
+        }
+
+    def trends(
+        self,
+        site: str | None = None,
+        since: float | None = None,
+        until: float | None = None,
+        bucket_seconds: float = 86400.0,
+        top_codes: int = 10,
+    ) -> Dict[str, Any]:
+        """Per-bucket score statistics and finding prevalence, for one site or all of them."""
+        since = since or 0.0
+        until = time.time() if until is None else until
+        scope, params = ("site = ? AND ", [site]) if site is not None else ("", [])
+        window = [*params, since, until]
+        with self._lock:
+            buckets = self._db.execute(
+                "SELECT CAST(created_at / ? AS INTEGER) AS bucket, COUNT(*), AVG(score), MIN(score), MAX(score), "
+                f"AVG(local_score) FROM analyses WHERE {scope}created_at >= ? AND created_at < ? "
+                "GROUP BY bucket ORDER BY bucket",
+                (bucket_seconds, *window),
+            ).fetchall()
+            total = sum(row[1] for row in buckets)
+            codes = self._db.execute(
+                f"SELECT code, COUNT(*) AS hits FROM analysis_findings WHERE {scope}created_at >= ? AND created_at < ? "
+                "GROUP BY code ORDER BY hits DESC, code LIMIT ?",
+                (*window, top_codes),
+            ).fetchall()
+            code_buckets = self._db.execute(
+                "SELECT CAST(created_at / ? AS INTEGER) AS bucket, code, COUNT(*) FROM analysis_findings "
+                f"WHERE {scope}created_at >= ? AND created_at < ? AND code IN ({','.join('?' * len(codes))}) "
+                "GROUP BY bucket, code",
+                (bucket_seconds, *window, *(code for code, _ in codes)),
+            ).fetchall()
+
+        per_bucket: Dict[int, Dict[str, int]] = {}
+        for bucket, code, hits in code_buckets:
+            per_bucket.setdefault(bucket, {})[code] = hits
+        return {
+            "site": site,
+            "since": since,
+            "until": until,
+            "bucket_seconds": bucket_seconds,
+            "analyses": total,
+            "buckets": [
+                {
+                    "start": bucket * bucket_seconds,
+                    "analyses": count,
+                    "avg_score": rounded(avg_score),
+                    "min_score": min_score,
+                    "max_score": max_score,
+                    "avg_local_score": rounded(avg_local),
+                    "finding_rates": {
+                        code: round(hits / count, 4) for code, hits in sorted(per_bucket.get(bucket, {}).items())
+                    },
+                }
+                for bucket, count, avg_score, min_score, max_score, avg_local in buckets
+            ],
+            "top_findings": [
+                {"code": code, "analyses": hits, "rate": round(hits / total, 4)} for code, hits in codes
+            ],
+        }
+
+    def sites(self, limit: int = 100) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT site, COUNT(*), MAX(created_at) FROM analyses GROUP BY site ORDER BY site LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [{"site": site, "analyses": count, "last_analysis_at": last} for site, count, last in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            analyses = self._db.execute("SELECT COUNT(*) FROM analyses").fetchone()[0]
+            payloads, stored, raw = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0), COALESCE(SUM(raw_size), 0) FROM analysis_payloads"
+            ).fetchone()
+        return {
+            "analyses": analyses,
+            "payloads": payloads,
+            "payload_bytes": stored,
+            "payload_raw_bytes": raw,
+            "compression_ratio": round(raw / stored, 2) if stored else 0.0,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def _codes(self, analysis_ids: Iterable[int]) -> Dict[int, List[str]]:
+        ids = list(analysis_ids)
+        codes: Dict[int, List[str]] = {}
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            rows = self._db.execute(
+                f"SELECT analysis_id, code FROM analysis_findings WHERE analysis_id IN ({','.join('?' * len(chunk))}) "
+                "ORDER BY analysis_id, code",
+                chunk,
+            ).fetchall()
+            for analysis_id, code in rows:
+                codes.setdefault(analysis_id, []).append(code)
+        return codes
+
+    def _purge(self, cutoff: float) -> None:
+        self._since_purge = 0
+        self._db.execute("DELETE FROM analyses WHERE created_at < ?", (cutoff,))
+        self._db.execute(
+            "DELETE FROM analysis_payloads WHERE NOT EXISTS "
+            "(SELECT 1 FROM analyses WHERE analyses.payload_hash = analysis_payloads.hash)"
+        )
+
+
+def rounded(value: float | None) -> float | None:
+    return None if value is None else round(value, 2)
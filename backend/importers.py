@@ -0,0 +1,357 @@
+import codecs
+import csv
+import json
+import xml.etree.ElementTree as ElementTree
+from typing import Any, AsyncIterable, AsyncIterator, Callable, Dict, List, Tuple
+
+FORMATS = ("ndjson", "csv", "nmap")
+CONTENT_TYPES = {
+    "application/x-ndjson": "ndjson",
+    "application/ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    "application/json-seq": "ndjson",
+    "text/csv": "csv",
+    "application/csv": "csv",
+    "application/xml": "nmap",
+    "text/xml": "nmap",
+}
+
+# CSV headers that name nested or aliased node fields; other headers are used as is.
+CSV_COLUMNS = {
+    "wifi_password": "wifi.password",
+    "wifi_encryption": "wifi.encryption",
+    "password_hashed": "security_policy.password_hashed",
+    "backup_frequency": "security_policy.backup_frequency",
+    "personal_data": "personal_data.enabled",
+    "personal_data_enabled": "personal_data.enabled",
+    "personal_data_count": "personal_data.count",
+    "software": "professional_software",
+    "ip": "aliases",
+    "address": "aliases",
+}
+LIST_FIELDS = {"encryption", "professional_software", "connections", "aliases"}
+LIST_SEPARATORS = (";", "|")
+
+# nmap osclass types and the node types they are imported as; anything else is a "pc".
+NMAP_DEVICE_TYPES = {
+    "router": "router",
+    "firewall": "firewall",
+    "switch": "switch",
+    "printer": "printer",
+    "print server": "printer",
+    "wap": "wifi_ap",
+    "bridge": "switch",
+}
+NMAP_VPN_SERVICES = {
+    "isakmp": "IPsec VPN",
+    "ipsec-nat-t": "IPsec VPN",
+    "openvpn": "OpenVPN",
+    "wireguard": "WireGuard",
+    "pptp": "PPTP VPN",
+}
+NMAP_ENCRYPTED_SERVICES = {"https": "TLS", "ssh": "SSH", "imaps": "TLS", "pop3s": "TLS", "ldaps": "TLS"}
+
+
+class ImportLimitExceeded(Exception):
+    pass
+
+
+def detect_format(content_type: str | None) -> str | None:
+    if not content_type:
+        return None
+    return CONTENT_TYPES.get(content_type.split(";", 1)[0].strip().lower())
+
+
+async def iter_lines(chunks: AsyncIterable[bytes], max_line_bytes: int) -> AsyncIterator[Tuple[int, str]]:
+    """Splits a byte stream into numbered text lines, holding at most one partial line."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    pending = ""
+    number = 0
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        lines = pending.split("\n")
+        pending = lines.pop()
+        if len(pending) > max_line_bytes:
+            raise ImportLimitExceeded(f"line {number + len(lines) + 1} exceeds {max_line_bytes} bytes")
+        for line in lines:
+            number += 1
+            yield number, line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending.strip():
+        yield number + 1, pending.rstrip("\r")
+
+
+async def ndjson_records(
+    chunks: AsyncIterable[bytes], max_line_bytes: int
+) -> AsyncIterator[Tuple[str, Dict[str, Any] | Exception]]:
+    async for number, line in iter_lines(chunks, max_line_bytes):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield f"line {number}", e
+            continue
+        if not isinstance(record, dict):
+            yield f"line {number}", ValueError("expected a JSON object")
+            continue
+        yield f"line {number}", record
+
+
+def csv_row(header: List[str], values: List[str]) -> Dict[str, Any]:
+    record: Dict[str, Any] = {}
+    for column, value in zip(header, values):
+        value = value.strip()
+        if not column or not value:
+            continue
+        if column in LIST_FIELDS:
+            separator = next((sep for sep in LIST_SEPARATORS if sep in value), LIST_SEPARATORS[0])
+            value = [item.strip() for item in value.split(separator) if item.strip()]
+        target = record
+        *parents, leaf = column.split(".")
+        for parent in parents:
+            target = target.setdefault(parent, {})
+        target[leaf] = value
+    return record
+
+
+async def csv_records(
+    chunks: AsyncIterable[bytes], max_line_bytes: int
+) -> AsyncIterator[Tuple[str, Dict[str, Any] | Exception]]:
+    header: List[str] | None = None
+    pending: List[str] = []
+    first = 0
+    async for number, line in iter_lines(chunks, max_line_bytes):
+        if not pending:
+            first = number
+        pending.append(line)
+        # A quoted field may span lines; a row is complete once its quotes are balanced.
+        if sum(part.count('"') for part in pending) % 2:
+            if sum(map(len, pending)) > max_line_bytes:
+                raise ImportLimitExceeded(f"row at line {first} exceeds {max_line_bytes} bytes")
+            continue
+        text, pending = "\n".join(pending), []
+        if not text.strip():
+            continue
+        try:
+            values = next(csv.reader([text]))
+        except csv.Error as e:
+            yield f"line {first}", e
+            continue
+        if header is None:
+            header = [column.strip().lower() for column in values]
+            header = [CSV_COLUMNS.get(column, column) for column in header]
+            continue
+        if len(values) > len(header):
+            yield f"line {first}", ValueError(f"{len(values)} fields for {len(header)} columns")
+            continue
+        yield f"line {first}", csv_row(header, values)
+    if pending:
+        yield f"line {first}", ValueError("unterminated quoted field")
+
+
+def nmap_host(host: ElementTree.Element) -> Dict[str, Any] | None:
+    status = host.find("status")
+    if status is not None and status.get("state") != "up":
+        return None
+    addresses = {}
+    for address in host.iterfind("address"):
+        addresses.setdefault(address.get("addrtype"), address.get("addr"))
+    hostnames = [name.get("name") for name in host.iterfind("hostnames/hostname") if name.get("name")]
+    node_id = addresses.get("ipv4") or addresses.get("ipv6") or (hostnames[0] if hostnames else None)
+    if node_id is None:
+        return None
+
+    record: Dict[str, Any] = {
+        "id": node_id,
+        "name": hostnames[0] if hostnames else node_id,
+        "type": "pc",
+        "aliases": [alias for alias in [*addresses.values(), *hostnames] if alias and alias != node_id],
+    }
+    osmatch = host.find("os/osmatch")
+    if osmatch is not None:
+        record["os"] = osmatch.get("name")
+        osclass = osmatch.find("osclass")
+        if osclass is not None:
+            record["type"] = NMAP_DEVICE_TYPES.get((osclass.get("type") or "").lower(), "pc")
+
+    encryption, software = set(), set()
+    for port in host.iterfind("ports/port"):
+        state = port.find("state")
+        service = port.find("service")
+        if state is None or state.get("state") != "open" or service is None:
+            continue
+        name = (service.get("name") or "").lower()
+        if name in NMAP_VPN_SERVICES:
+            record.setdefault("vpn", NMAP_VPN_SERVICES[name])
+        if service.get("tunnel") == "ssl":
+            encryption.add("TLS")
+        elif name in NMAP_ENCRYPTED_SERVICES:
+            encryption.add(NMAP_ENCRYPTED_SERVICES[name])
+        product = service.get("product")
+        if product:
+            software.add(f"{product} {service.get('version')}" if service.get("version") else product)
+        if name in ("wifi", "capwap-control"):
+            record["type"] = "wifi_ap"
+    record["encryption"] = sorted(encryption)
+    record["professional_software"] = sorted(software)
+
+    # The hop before the host in a traceroute is the device it is attached to.
+    hops = [hop.get("ipaddr") for hop in host.iterfind("trace/hop") if hop.get("ipaddr")]
+    hops = [hop for hop in hops if hop != node_id]
+    if hops:
+        record["connections"] = [hops[-1]]
+    return record
+
+
+async def nmap_records(chunks: AsyncIterable[bytes]) -> AsyncIterator[Tuple[str, Dict[str, Any] | Exception]]:
+    """Yields one record per ``<host>`` of an nmap XML report, dropping each host once it is read."""
+    parser = ElementTree.XMLPullParser(events=("start", "end"))
+    root: ElementTree.Element | None = None
+    count = 0
+
+    def drain() -> List[Tuple[str, Dict[str, Any] | Exception]]:
+        nonlocal root, count
+        records = []
+        for event, element in parser.read_events():
+            if event == "start":
+                if root is None:
+                    root = element
+                continue
+            if element.tag != "host":
+                continue
+            count += 1
+            try:
+                record = nmap_host(element)
+            except Exception as e:
+                records.append((f"host {count}", e))
+            else:
+                if record is not None:
+                    records.append((f"host {count}", record))
+            element.clear()
+            if root is not None and element in root:
+                root.remove(element)
+        return records
+
+    try:
+        async for chunk in chunks:
+            parser.feed(chunk)
+            for item in drain():
+                yield item
+        parser.close()
+        for item in drain():
+            yield item
+    except ElementTree.ParseError as e:
+        raise ValueError(f"invalid nmap XML: {e}") from e
+
+
+def format_records(
+    fmt: str, chunks: AsyncIterable[bytes], max_line_bytes: int
+) -> AsyncIterator[Tuple[str, Dict[str, Any] | Exception]]:
+    if fmt == "ndjson":
+        return ndjson_records(chunks, max_line_bytes)
+    if fmt == "csv":
+        return csv_records(chunks, max_line_bytes)
+    if fmt == "nmap":
+        return nmap_records(chunks)
+    raise ValueError(f"unknown import format {fmt!r}, expected one of {', '.join(FORMATS)}")
+
+
+def describe_error(error: ValueError) -> str:
+    """One-line message for an error, listing each field of a pydantic ``ValidationError``."""
+    details = getattr(error, "errors", None)
+    if not callable(details):
+        return str(error)
+    return "; ".join(f"{'.'.join(map(str, item['loc'])) or 'record'}: {item['msg']}" for item in details())
+
+
+class TopologyImporter:
+    """Validates inventory records into nodes and links them by id, name or alias.
+
+    ``add`` validates a record with ``validate`` as soon as it is parsed, so
+    only accepted nodes are kept, not the raw input. A record holding only a
+    ``threat_model`` sets the threat model instead. Connections may point to
+    nodes that appear later in the file, so they are resolved in ``finish``
+    through an index of every id, name and alias; references that match no
+    node, or several, are dropped and counted.
+    """
+
+    def __init__(self, validate: Callable[[Dict[str, Any]], Any], max_nodes: int, max_errors: int = 50):
+        self.validate = validate
+        self.max_nodes = max_nodes
+        self.max_errors = max_errors
+        self.nodes: List[Any] = []
+        self.threat_model: Dict[str, Any] | None = None
+        self.errors: List[Dict[str, str]] = []
+        self.records = 0
+        self.rejected = 0
+        self.duplicates = 0
+        self.unresolved = 0
+        self.unresolved_samples: List[str] = []
+        self._aliases: Dict[str, str | None] = {}
+        self._ids: set[str] = set()
+
+    def add(self, location: str, record: Dict[str, Any] | Exception) -> None:
+        self.records += 1
+        if isinstance(record, Exception):
+            self.reject(location, str(record))
+            return
+        if set(record) == {"threat_model"}:
+            self.threat_model = record["threat_model"]
+            return
+        aliases = record.pop("aliases", None) or []
+        try:
+            node = self.validate(record)
+        except ValueError as e:
+            self.reject(location, describe_error(e))
+            return
+        if node.id in self._ids:
+            self.duplicates += 1
+            self.reject(location, f"duplicate node id {node.id!r}")
+            return
+        if len(self.nodes) >= self.max_nodes:
+            raise ImportLimitExceeded(f"more than {self.max_nodes} nodes")
+        self._ids.add(node.id)
+        self.nodes.append(node)
+        for alias in (node.name, *aliases):
+            if isinstance(alias, str) and alias and alias != node.id:
+                # An alias shared by two nodes is ambiguous and resolves to neither.
+                self._aliases[alias] = node.id if self._aliases.get(alias, node.id) == node.id else None
+
+    def reject(self, location: str, error: str) -> None:
+        self.rejected += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"location": location, "error": error})
+
+    def resolve(self, reference: str) -> str | None:
+        if reference in self._ids:
+            return reference
+        return self._aliases.get(reference)
+
+    def finish(self) -> List[Any]:
+        for node in self.nodes:
+            if not node.connections:
+                continue
+            resolved = []
+            for reference in node.connections:
+                target = self.resolve(reference)
+                if target is None:
+                    self.unresolved += 1
+                    if len(self.unresolved_samples) < self.max_errors:
+                        self.unresolved_samples.append(f"{node.id} -> {reference}")
+                elif target != node.id and target not in resolved:
+                    resolved.append(target)
+            node.connections = resolved
+        self._aliases.clear()
+        return self.nodes
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "records": self.records,
+            "nodes": len(self.nodes),
+            "rejected": self.rejected,
+            "duplicates": self.duplicates,
+            "unresolved_connections": self.unresolved,
+            "errors": self.errors,
+            "unresolved_samples": self.unresolved_samples,
+        }
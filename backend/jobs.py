@@ -0,0 +1,175 @@
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Tuple
+
+
+class JobStore:
+    """Persistent job queue in a SQLite table.
+
+    Jobs move from ``queued`` to ``running`` and end as ``done`` or
+    ``failed``. Several processes may share one database: ``claim`` takes the
+    oldest queued job inside a write transaction, and jobs left ``running``
+    for more than ``stale_after`` seconds (their worker died) are queued
+    again, up to ``max_attempts`` runs. Jobs are deduplicated by ``key``:
+    submitting a key that is queued, running or finished less than
+    ``ttl_seconds`` ago returns the existing job. Failed jobs and jobs
+    finished with ``reusable=False`` (a degraded result) are not reused.
+    """
+
+    QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+    def __init__(
+        self,
+        db_path: str,
+        ttl_seconds: float = 86400.0,
+        stale_after: float = 900.0,
+        max_attempts: int = 3,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.stale_after = stale_after
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        # Autocommit mode, transactions are opened explicitly with BEGIN IMMEDIATE.
+        self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, key TEXT NOT NULL, status TEXT NOT NULL, "
+            "payload TEXT NOT NULL, result TEXT, error TEXT, attempts INTEGER NOT NULL DEFAULT 0, "
+            "created_at REAL NOT NULL, started_at REAL, finished_at REAL, reusable INTEGER NOT NULL DEFAULT 1)"
+        )
+        if "reusable" not in {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}:
+            self._db.execute("ALTER TABLE jobs ADD COLUMN reusable INTEGER NOT NULL DEFAULT 1")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_key ON jobs (key, created_at)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+
+    def submit(self, key: str, payload: Dict[str, Any]) -> Tuple[Dict[str, Any], bool]:
+        """Queues a job unless one for ``key`` can be reused; returns ``(job, created)``."""
+        now = time.time()
+        with self._lock, self._transaction():
+            self._db.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND finished_at <= ?",
+                (self.DONE, self.FAILED, now - self.ttl_seconds),
+            )
+            row = self._db.execute(
+                "SELECT id, status, created_at FROM jobs WHERE key = ? AND status != ? AND reusable "
+                "ORDER BY created_at DESC LIMIT 1",
+                (key, self.FAILED),
+            ).fetchone()
+            if row is not None:
+                return {"id": row[0], "status": row[1], "created_at": row[2]}, False
+            job_id = uuid.uuid4().hex
+            self._db.execute(
+                "INSERT INTO jobs (id, key, status, payload, created_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, key, self.QUEUED, json.dumps(payload, ensure_ascii=False), now),
+            )
+            return {"id": job_id, "status": self.QUEUED, "created_at": now}, True
+
+    def claim(self) -> Dict[str, Any] | None:
+        now = time.time()
+        with self._lock, self._transaction():
+            self._db.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, "
+                "error = CASE WHEN attempts >= ? THEN 'worker lost' ELSE error END, "
+                "finished_at = CASE WHEN attempts >= ? THEN ? ELSE finished_at END "
+                "WHERE status = ? AND started_at <= ?",
+                (
+                    self.max_attempts, self.FAILED, self.QUEUED,
+                    self.max_attempts, self.max_attempts, now,
+                    self.RUNNING, now - self.stale_after,
+                ),
+            )
+            row = self._db.execute(
+                "SELECT id, key, payload, created_at FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1",
+                (self.QUEUED,),
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute(
+                "UPDATE jobs SET status = ?, started_at = ?, attempts = attempts + 1 WHERE id = ?",
+                (self.RUNNING, now, row[0]),
+            )
+        return {"id": row[0], "key": row[1], "payload": json.loads(row[2]), "created_at": row[3], "started_at": now}
+
+    def finish(self, job_id: str, result: Any, reusable: bool = True) -> None:
+        self._complete(job_id, self.DONE, json.dumps(result, ensure_ascii=False), None, reusable)
+
+    def fail(self, job_id: str, error: str) -> None:
+        self._complete(job_id, self.FAILED, None, error, False)
+
+    def release(self, job_id: str) -> None:
+        """Puts a job whose worker is shutting down back in the queue."""
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, started_at = NULL, attempts = MAX(attempts - 1, 0) "
+                "WHERE id = ? AND status = ?",
+                (self.QUEUED, job_id, self.RUNNING),
+            )
+
+    def get(self, job_id: str) -> Dict[str, Any] | None:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT status, result, error, attempts, created_at, started_at, finished_at "
+                "FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            status, result, error, attempts, created_at, started_at, finished_at = row
+            job: Dict[str, Any] = {
+                "id": job_id,
+                "status": status,
+                "attempts": attempts,
+                "created_at": created_at,
+                "started_at": started_at,
+                "finished_at": finished_at,
+            }
+            if status == self.QUEUED:
+                job["position"] = self._db.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = ? AND created_at < ?", (self.QUEUED, created_at)
+                ).fetchone()[0]
+        if result is not None:
+            job["result"] = json.loads(result)
+        if error is not None:
+            job["error"] = error
+        return job
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = {status: 0 for status in (self.QUEUED, self.RUNNING, self.DONE, self.FAILED)}
+        counts.update(rows)
+        return counts
+
+    def oldest_queued_age(self) -> float:
+        with self._lock:
+            oldest = self._db.execute(
+                "SELECT MIN(created_at) FROM jobs WHERE status = ?", (self.QUEUED,)
+            ).fetchone()[0]
+        return max(0.0, time.time() - oldest) if oldest is not None else 0.0
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def _complete(self, job_id: str, status: str, result: str | None, error: str | None, reusable: bool) -> None:
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, reusable = ? "
+                "WHERE id = ? AND status = ?",
+                (status, result, error, time.time(), int(reusable), job_id, self.RUNNING),
+            )
+
+    @contextmanager
+    def _transaction(self) -> Iterator[None]:
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
@@ -0,0 +1,284 @@
+import json
+import re
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+try:
+    import orjson
+except ImportError:  # optional, the standard library codec is used instead
+    orjson = None
+
+OBJECT_START = re.compile(r'\{\s*["}]')
+STRUCTURE = re.compile(r'[{}\[\]"]')
+STRING = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+REPAIR_TOKEN = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*(")?|[{}\[\],:]|[^\s{}\[\],:"]+', re.DOTALL)
+CLOSERS = {"{": "}", "[": "]"}
+
+
+def loads(text: str) -> Any:
+    """Decodes JSON with orjson when available; control characters inside strings are tolerated."""
+    if orjson is not None:
+        try:
+            return orjson.loads(text)
+        except ValueError:
+            pass
+    return json.loads(text, strict=False)
+
+
+def iter_object_spans(text: str) -> Iterator[Tuple[int, int, bool]]:
+    """Yields ``(start, end, closed)`` for each top-level ``{...}`` span in ``text``.
+
+    Only brackets and quotes are visited (regex jumps over everything else and
+    over whole string literals), so the scan is a single linear pass. Only a
+    brace followed by a quote or a closing brace starts an object, so braces in
+    prose are skipped; braces inside strings are ignored. An object left open
+    at the end of the text is yielded with ``closed=False``.
+    """
+    candidate = OBJECT_START.search(text)
+    while candidate is not None:
+        start, depth = candidate.start(), 0
+        pos = start
+        while True:
+            match = STRUCTURE.search(text, pos)
+            if match is None:
+                yield start, len(text), False
+                return
+            char = match.group()
+            if char == '"':
+                literal = STRING.match(text, match.start())
+                if literal is None:
+                    yield start, len(text), False
+                    return
+                pos = literal.end()
+                continue
+            depth += 1 if char in "{[" else -1
+            pos = match.end()
+            if depth == 0:
+                yield start, pos, True
+                break
+        candidate = OBJECT_START.search(text, pos)
+
+
+def repair_json(text: str) -> Tuple[str, List[str]]:
+    """Fixes trailing commas and closes a truncated document.
+
+    A truncated document is cut back to the last complete value (dangling
+    keys, half-written strings and numbers are dropped) and the containers
+    still open at that point are closed. Returns the text and the names of
+    the repairs applied.
+    """
+    repairs: List[str] = []
+    stack: List[str] = []
+    expect_key: List[bool] = []
+    dropped: List[int] = []
+    pending_comma = -1
+    cut, cut_depth = 0, 0
+    truncated = False
+
+    for token in REPAIR_TOKEN.finditer(text):
+        char = token.group()[0]
+        if char == '"':
+            if token.group(1) is None:
+                truncated = True
+                break
+            is_key = bool(stack) and stack[-1] == "{" and expect_key[-1]
+            if not is_key:
+                cut, cut_depth = token.end(), len(stack)
+            pending_comma = -1
+        elif char in "{[":
+            stack.append(char)
+            expect_key.append(True)
+            cut, cut_depth = token.end(), len(stack)
+            pending_comma = -1
+        elif char in "}]":
+            if pending_comma >= 0:
+                dropped.append(pending_comma)
+            pending_comma = -1
+            if stack:
+                stack.pop()
+                expect_key.pop()
+            cut, cut_depth = token.end(), len(stack)
+        elif char == ",":
+            if pending_comma >= 0:
+                dropped.append(token.start())
+            else:
+                cut, cut_depth = token.start(), len(stack)
+                pending_comma = token.start()
+            if stack:
+                expect_key[-1] = True
+        elif char == ":":
+            if stack:
+                expect_key[-1] = False
+            pending_comma = -1
+        else:
+            pending_comma = -1
+
+    if stack or truncated:
+        truncated = True
+        end = cut
+        closers = "".join(CLOSERS[opener] for opener in reversed(stack[:cut_depth]))
+    else:
+        end = len(text)
+        closers = ""
+
+    parts: List[str] = []
+    previous = 0
+    for position in dropped:
+        if position >= end:
+            break
+        parts.append(text[previous:position])
+        previous = position + 1
+    parts.append(text[previous:end])
+    if dropped and dropped[0] < end:
+        repairs.append("trailing_comma")
+    if truncated:
+        repairs.append("truncated")
+    return "".join(parts) + closers, repairs
+
+
+def decode_fragment(fragment: str, closed: bool = True) -> Tuple[Any, List[str]]:
+    try:
+        return loads(fragment), []
+    except ValueError:
+        pass
+    repairs: List[str] = []
+    if not closed:
+        stripped = fragment.rstrip()
+        if stripped.endswith("```"):
+            fragment = stripped[:-3]
+            repairs.append("code_fence")
+    repaired, applied = repair_json(fragment)
+    try:
+        return loads(repaired), repairs + applied
+    except ValueError:
+        return None, repairs + applied
+
+
+def extract_json_object(text: str, prefer_keys: Iterable[str] = ()) -> Tuple[Dict[str, Any] | None, List[str]]:
+    """Finds the JSON object in a model reply, repairing common defects.
+
+    Surrounding prose, code fences and stray braces are skipped. The first
+    object containing any of ``prefer_keys`` wins, otherwise the first object
+    that decodes at all. Returns ``(None, [])`` when nothing decodes.
+    """
+    prefer = tuple(prefer_keys)
+    fallback: Tuple[Dict[str, Any] | None, List[str]] = (None, [])
+    for start, end, closed in iter_object_spans(text):
+        value, repairs = decode_fragment(text[start:end], closed)
+        if not isinstance(value, dict):
+            continue
+        if not prefer or any(key in value for key in prefer):
+            return value, repairs
+        if fallback[0] is None:
+            fallback = (value, repairs)
+    return fallback
+
+
+class IncrementalObjectParser:
+    """Consumes a streamed LLM reply and yields top-level fields of the first JSON object.
+
+    Text before the opening brace (prose, code fences) is skipped. Each call to
+    ``feed`` scans only the new characters, tracking string/escape state and
+    nesting depth, and returns the ``(key, value)`` pairs whose values were
+    completed by that chunk. Objects start as in ``iter_object_spans``, and a
+    span that closes without producing a field is ignored.
+    """
+
+    def __init__(self) -> None:
+        self.text = ""
+        self.done = False
+        self._pos = 0
+        self._start = -1
+        self._candidate = -1
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._expect_key = True
+        self._key_start = -1
+        self._key: str | None = None
+        self._value_start = -1
+        self._fields = 0
+
+    @property
+    def object_text(self) -> str | None:
+        if self._start < 0:
+            return None
+        return self.text[self._start:self._pos]
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        completed: List[Tuple[str, Any]] = []
+        if self.done or not chunk:
+            return completed
+        self.text += chunk
+        text = self.text
+        length = len(text)
+        pos = self._pos
+
+        while pos < length:
+            char = text[pos]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._expect_key and self._key_start >= 0:
+                        self._key = loads(text[self._key_start:pos + 1])
+                        self._key_start = -1
+                pos += 1
+                continue
+
+            if self._start < 0:
+                # Same rule as OBJECT_START: the brace must be followed by a quote or "}".
+                if char == "{":
+                    self._candidate = pos
+                elif self._candidate >= 0 and not char.isspace():
+                    if char in '"}':
+                        self._start, self._candidate = self._candidate, -1
+                        self._depth = 1
+                        continue
+                    self._candidate = -1
+                pos += 1
+                continue
+
+            if char == '"':
+                self._in_string = True
+                if self._depth == 1 and self._expect_key:
+                    self._key_start = pos
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._complete_field(text, pos, completed)
+                    pos += 1
+                    if self._fields:
+                        self.done = True
+                        break
+                    self._start = -1
+                    self._expect_key = True
+                    self._key = None
+                    continue
+            elif self._depth == 1:
+                if char == ":" and self._expect_key:
+                    self._expect_key = False
+                    self._value_start = pos + 1
+                elif char == ",":
+                    self._complete_field(text, pos, completed)
+            pos += 1
+
+        self._pos = pos
+        return completed
+
+    def _complete_field(self, text: str, end: int, completed: List[Tuple[str, Any]]) -> None:
+        if self._expect_key or self._key is None:
+            return
+        raw_value = text[self._value_start:end]
+        self._expect_key = True
+        key, self._key = self._key, None
+        try:
+            completed.append((key, loads(raw_value)))
+            self._fields += 1
+        except ValueError:
+            pass
@@ -1,84 +1,331 @@
-﻿from fastapi import FastAPI, HTTPException
+﻿from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
-from typing import List, Any, Dict, Tuple
-from openai import OpenAI
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ConfigDict, Field, field_validator
+from typing import List, Any, AsyncIterator, Dict, Literal, Tuple
+from contextlib import asynccontextmanager, nullcontext
+from concurrent.futures import Executor, ProcessPoolExecutor
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, Timeout
 from dotenv import load_dotenv
+from admission import AdmissionRejected, SingleFlight, TokenBucketLimiter
+from cache import AnalysisCache, canonical_request_key
+from dispatch import ChainExhausted, CircuitBreaker, ModelChain
+from history import AnalysisHistory
+from importers import FORMATS, ImportLimitExceeded, TopologyImporter, detect_format, format_records
+from jobs import JobStore
+from llm_json import IncrementalObjectParser, extract_json_object
+from remediation import RemediationRequest, optimize_remediation
+from scoring import (
+    ATTACK_PATHS_K,
+    TOPOLOGY_RULES,
+    AnalysisRequest,
+    CompactNode,
+    NetworkNode,
+    ThreatModel,
+    analyze_topology,
+    build_base_recommendations,
+    build_local_attack_graph,
+    build_local_result,
+    clamp,
+    current_rules,
+    evaluate_security_sweep,
+    extract_connections,
+    is_quantum_threat,
+    rule_book,
+    score_in_worker,
+    score_request,
+    select_support_controls,
+    sweep_profile_key,
+)
+from sessions import SessionStore, TopologySession
+from similarity import SimilarityIndex
+from telemetry import MetricsRegistry, SamplingProfiler, StageTimer, TimingMiddleware
+from uncertainty import UncertaintyRequest, analyze_uncertainty
+from collections import Counter
+import asyncio
+import httpx
+import multiprocessing
+import numpy as np
 import os
 import json
-import re
+import logging
+import math
+import time
+import zlib
 
 load_dotenv()
-
-app = FastAPI()
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+# LOG_LEVEL=DEBUG also logs the raw LLM responses.
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "WARNING").upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s"
 )
-
-client = OpenAI(
-    base_url="https://openrouter.ai/api/v1",
+logger = logging.getLogger(__name__)
+
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "https://openrouter.ai/api/v1")
+LLM_MODEL = os.getenv("LLM_MODEL", "deepseek/deepseek-v3.2-exp")
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "120"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "64"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+# Comma-separated model chain; the first entry is the primary, later ones serve as hedges and fallbacks.
+LLM_MODELS = [model.strip() for model in os.getenv("LLM_MODELS", LLM_MODEL).split(",") if model.strip()]
+# Seconds before a hedge request is sent; unset follows the p95 of recent upstream latency.
+LLM_HEDGE_DELAY = float(os.environ["LLM_HEDGE_DELAY"]) if os.getenv("LLM_HEDGE_DELAY") else None
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "3"))
+LLM_BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET", "30"))
+LLM_LOCAL_FALLBACK = os.getenv("LLM_LOCAL_FALLBACK", "true").lower() in ("1", "true", "yes")
+
+# The SDK retries connection errors, 408/409/429 and 5xx with exponential backoff.
+client = AsyncOpenAI(
+    base_url=LLM_BASE_URL,
     api_key=os.getenv("OPENROUTER_API_KEY"),
+    timeout=Timeout(LLM_READ_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+    max_retries=LLM_MAX_RETRIES,
+    http_client=DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_CONNECTIONS,
+        ),
+    ),
+)
+llm_slots = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+model_chain = ModelChain(
+    LLM_MODELS,
+    hedge_delay=LLM_HEDGE_DELAY,
+    failure_threshold=LLM_BREAKER_FAILURES,
+    reset_timeout=LLM_BREAKER_RESET,
 )
 
+result_cache = AnalysisCache(
+    max_entries=int(os.getenv("ANALYSIS_CACHE_SIZE", "256")),
+    ttl_seconds=float(os.getenv("ANALYSIS_CACHE_TTL", "3600")),
+    db_path=os.getenv("ANALYSIS_CACHE_DB") or None,
+    max_disk_entries=int(os.getenv("ANALYSIS_CACHE_DISK_SIZE", "10000")),
+)
 
-class PasswordPolicy(BaseModel):
-    min_length: int = 12
-    require_upper: bool = True
-    require_lower: bool = True
-    require_digits: bool = True
-    require_special: bool = True
-
-
-class WifiSettings(BaseModel):
-    password: str | None = None
-    encryption: str | None = None
-
-
-class SecurityPolicy(BaseModel):
-    password_hashed: bool | None = None
-    backup_frequency: str | None = None
-
-
-class PersonalData(BaseModel):
-    enabled: bool | None = None
-    count: int | None = None
+SIMILARITY_REUSE = os.getenv("SIMILARITY_REUSE", "true").lower() in ("1", "true", "yes")
+# Largest feature-space distance at which a stored LLM analysis answers a new request.
+SIMILARITY_MAX_DISTANCE = float(os.getenv("SIMILARITY_MAX_DISTANCE", "0.1"))
+# "skip" answers from the reused analysis only; "defer" also runs the upstream call in the background.
+SIMILARITY_REFRESH = os.getenv("SIMILARITY_REFRESH", "skip")
+SIMILARITY_NODE_TYPES = ("pc", "user", "server", "switch", "router", "firewall", "wifi_ap", "printer")
+SIMILARITY_FACTS = (
+    "endpoint", "antivirus", "disk", "vpn", "mfa", "wifi", "wifi_ok", "hashed", "backup", "firewall_typed", "pd",
+    "pd_protected", "siem", "backup_platform", "pq",
+)
+SIMILARITY_GRAPH_METRICS = (
+    "largest_component_ratio", "articulation_ratio", "largest_segment_ratio", "max_blast_ratio", "mean_blast_ratio",
+)
+SIMILARITY_CODE_BUCKETS = 32
+# A differing threat-model flag alone exceeds any sensible distance limit; one differing finding code adds 0.2.
+SIMILARITY_THREAT_WEIGHT = 1.0
+SIMILARITY_CODE_WEIGHT = 0.2
+similarity_index = SimilarityIndex(
+    4 + 1 + len(SIMILARITY_NODE_TYPES) + 1 + len(SIMILARITY_FACTS) + 3 + len(SIMILARITY_GRAPH_METRICS)
+    + SIMILARITY_CODE_BUCKETS,
+    capacity=int(os.getenv("SIMILARITY_INDEX_SIZE", "2048")),
+)
+background_refreshes: set[asyncio.Task] = set()
+# Upstream analyses in progress by cache key; identical concurrent requests share one.
+analysis_flights = SingleFlight()
+
+# Requests that need a new upstream call are admitted per client at ADMISSION_RATE per second, with
+# bursts of up to ADMISSION_BURST; 0 disables admission control.
+ADMISSION_RATE = float(os.getenv("ADMISSION_RATE", "0.5"))
+ADMISSION_BURST = float(os.getenv("ADMISSION_BURST", "10"))
+# A request waits at most ADMISSION_MAX_WAIT seconds for its tokens, with at most ADMISSION_QUEUE_SIZE
+# requests waiting at once; beyond that it is answered with 429 and Retry-After.
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "10"))
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "256"))
+# Header identifying the client, e.g. X-Forwarded-For behind a proxy that sets it; unset uses the peer address.
+ADMISSION_CLIENT_HEADER = os.getenv("ADMISSION_CLIENT_HEADER") or None
+admission = TokenBucketLimiter(
+    ADMISSION_RATE,
+    ADMISSION_BURST,
+    max_wait=ADMISSION_MAX_WAIT,
+    max_queue=ADMISSION_QUEUE_SIZE,
+    max_clients=int(os.getenv("ADMISSION_MAX_CLIENTS", "10000")),
+)
 
+JOBS_DB = os.getenv("JOBS_DB", "jobs.db")
+# Processes running the local scoring of queued jobs; 0 scores them in a thread of the web process.
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Jobs processed at once by each web process; the LLM stage is I/O bound, so this exceeds JOB_WORKERS.
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", "8"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+job_store = JobStore(
+    JOBS_DB,
+    ttl_seconds=float(os.getenv("JOB_TTL", "86400")),
+    stale_after=float(os.getenv("JOB_STALE_AFTER", "900")),
+)
+job_wakeup = asyncio.Event()
+job_executor: Executor | None = None
 
-class NetworkNode(BaseModel):
-    id: str
-    type: str
-    name: str
-    weight: float | None = None
-    os: str | None = None
-    antivirus: str | None = None
-    encryption: List[str] = Field(default_factory=list)
-    vpn: str | None = None
-    wifi: WifiSettings | None = None
-    security_policy: SecurityPolicy | None = None
-    personal_data: PersonalData | None = None
-    professional_software: List[str] = Field(default_factory=list)
-    connections: List[str] = Field(default_factory=list)
-    auth_type: str | None = None
-    firewall_type: str | None = None
-    access_level: int | None = None
-    password_policy: PasswordPolicy | None = None
+HISTORY_ENABLED = os.getenv("HISTORY_ENABLED", "true").lower() in ("1", "true", "yes")
+analysis_history = AnalysisHistory(
+    os.getenv("HISTORY_DB", "history.db"),
+    retention_seconds=float(os.getenv("HISTORY_RETENTION_DAYS", "365")) * 86400,
+)
+history_writes: set[asyncio.Task] = set()
 
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() in ("1", "true", "yes")
+# The sampler needs the GIL, so CPU-bound code is sampled at most once per switch interval (5 ms by default).
+PROFILING_INTERVAL = float(os.getenv("PROFILING_INTERVAL_MS", "5")) / 1000
 
-class ThreatModel(BaseModel):
-    quantum_capability: str
-    budget_usd: int
-    has_error_correction: bool
-    is_fstec_compliant: bool = False
-    has_large_pd_storage: bool = False
+metrics_registry = MetricsRegistry()
+http_request_seconds = metrics_registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency.", ("method", "route", "status")
+)
+stage_seconds = metrics_registry.histogram(
+    "analysis_stage_duration_seconds", "Analysis pipeline stage latency.", ("endpoint", "stage")
+)
+analysis_requests_total = metrics_registry.counter(
+    "analysis_requests_total", "Analyses by endpoint and result source.", ("endpoint", "source")
+)
+llm_request_seconds = metrics_registry.histogram(
+    "llm_request_duration_seconds", "Upstream LLM call latency.", ("model", "outcome")
+)
+llm_errors_total = metrics_registry.counter(
+    "llm_errors_total", "Failed upstream LLM calls by exception type.", ("model", "error")
+)
+llm_tokens_total = metrics_registry.counter(
+    "llm_tokens_total", "Tokens reported by the upstream LLM.", ("model", "kind")
+)
+llm_response_repairs_total = metrics_registry.counter(
+    "llm_response_repairs_total", "Repairs applied to malformed LLM JSON.", ("repair",)
+)
+metrics_registry.callback(
+    "llm_hedged_requests_total",
+    "Hedge requests sent to a model while an earlier one was still pending.",
+    "counter",
+    lambda: {(model,): count for model, count in model_chain.hedges.items()},
+    ("model",),
+)
+metrics_registry.callback(
+    "llm_chain_wins_total",
+    "Analyses answered by each model of the chain.",
+    "counter",
+    lambda: {(model,): count for model, count in model_chain.wins.items()},
+    ("model",),
+)
+metrics_registry.callback(
+    "llm_chain_exhausted_total", "Analyses for which every model failed or was skipped.", "counter", lambda: model_chain.exhausted
+)
+metrics_registry.callback(
+    "llm_circuit_state",
+    "Circuit breaker state per model (0 closed, 1 half-open, 2 open).",
+    "gauge",
+    lambda: {
+        (model,): (CircuitBreaker.CLOSED, CircuitBreaker.HALF_OPEN, CircuitBreaker.OPEN).index(state)
+        for model, state in model_chain.breaker_states().items()
+    },
+    ("model",),
+)
+metrics_registry.callback(
+    "llm_hedge_delay_seconds", "Current delay before a hedge request is sent.", "gauge", model_chain.hedge_delay
+)
+jobs_submitted_total = metrics_registry.counter(
+    "jobs_submitted_total", "Job submissions by whether a new job was queued.", ("result",)
+)
+job_wait_seconds = metrics_registry.histogram("job_wait_seconds", "Time jobs spent queued before a worker took them.")
+job_run_seconds = metrics_registry.histogram("job_run_seconds", "Job processing time by outcome.", ("outcome",))
+metrics_registry.callback(
+    "jobs", "Jobs in the queue by status.", "gauge", lambda: {(status,): count for status, count in job_store.counts().items()}, ("status",)
+)
+metrics_registry.callback(
+    "job_oldest_queued_age_seconds", "Age of the oldest queued job.", "gauge", job_store.oldest_queued_age
+)
+import_records_total = metrics_registry.counter(
+    "import_records_total", "Imported inventory records by format and outcome.", ("format", "outcome")
+)
+history_records_total = metrics_registry.counter(
+    "history_records_total", "Analyses written to the history store by outcome.", ("outcome",)
+)
+metrics_registry.callback(
+    "analysis_cache_lookups_total",
+    "Analysis cache lookups by result.",
+    "counter",
+    lambda: {
+        (result,): result_cache.stats()[key]
+        for result, key in (("memory_hit", "memory_hits"), ("disk_hit", "disk_hits"), ("miss", "misses"))
+    },
+    ("result",),
+)
+metrics_registry.callback(
+    "similarity_lookups_total",
+    "Similarity index lookups by whether a stored analysis was reused.",
+    "counter",
+    lambda: {("reused",): similarity_index.reuses, ("miss",): similarity_index.lookups - similarity_index.reuses},
+    ("result",),
+)
+metrics_registry.callback(
+    "analysis_flights_in_progress",
+    "Upstream analyses in progress; identical concurrent requests share one.",
+    "gauge",
+    lambda: len(analysis_flights),
+)
+metrics_registry.callback(
+    "analysis_flights_shared_total", "Requests that joined an upstream analysis already in progress.", "counter", lambda: analysis_flights.shared
+)
+metrics_registry.callback(
+    "admission_requests_total",
+    "Upstream admission decisions: admitted at once, admitted after waiting, rejected.",
+    "counter",
+    lambda: {(outcome,): getattr(admission, outcome) for outcome in ("admitted", "queued", "rejected")},
+    ("outcome",),
+)
+metrics_registry.callback(
+    "admission_waiting", "Requests waiting for admission tokens.", "gauge", lambda: admission.waiting
+)
+metrics_registry.callback(
+    "analysis_cache_evictions_total", "Analysis cache evictions.", "counter", lambda: result_cache.evictions
+)
+metrics_registry.callback(
+    "analysis_cache_entries",
+    "Analysis cache entries by tier.",
+    "gauge",
+    lambda: {(tier,): result_cache.stats()[f"{tier}_entries"] for tier in ("memory", "disk")},
+    ("tier",),
+)
 
 
-class AnalysisRequest(BaseModel):
-    nodes: List[NetworkNode]
-    threat_model: ThreatModel
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    global job_executor
+    if JOB_WORKERS > 0:
+        # Forking a process that already runs threads and an event loop is unsafe, so workers are spawned.
+        job_executor = ProcessPoolExecutor(JOB_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    runners = [asyncio.create_task(job_runner()) for _ in range(JOB_CONCURRENCY)]
+    yield
+    for runner in runners:
+        runner.cancel()
+    await asyncio.gather(*runners, return_exceptions=True)
+    if job_executor is not None:
+        job_executor.shutdown(cancel_futures=True)
+        job_executor = None
+    await asyncio.gather(*history_writes, return_exceptions=True)
+    for task in background_refreshes:
+        task.cancel()
+    await asyncio.gather(*background_refreshes, return_exceptions=True)
+    flights = analysis_flights.tasks()
+    for task in flights:
+        task.cancel()
+    await asyncio.gather(*flights, return_exceptions=True)
+    await client.close()
+    result_cache.close()
+    job_store.close()
+    analysis_history.close()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+app.add_middleware(TimingMiddleware, histogram=http_request_seconds)
 
 
 SYSTEM_PROMPT = """You are a cyber/quantum resilience analyst with deep knowledge of:
@@ -97,576 +344,1467 @@ Always respond with a VALID JSON object and nothing else. Use this strict schema
 }
 If you cannot fill some field, keep it an empty list/array."""
 
-ENDPOINT_TYPES = {"pc", "user"}
-STRONG_WIFI_PREFIXES = ("wpa2", "wpa3")
-SIEM_KEYWORDS = ("siem", "soc", "xdr", "elk", "observ")
-BACKUP_KEYWORDS = ("veeam", "backup", "snapshot", "replica")
-SUPPORT_CONTROLS_DEFAULT = {
-    "antivirus": "QuantumShield EDR",
-    "disk_encryption": "Full-disk AES-256",
-    "vpn": "ZeroTrust VPN",
-    "mfa": "FIDO2 token",
-    "wifi_password": "StrongPass!2025",
-    "wifi_encryption": "WPA3-Enterprise",
-    "firewall": "Next-Generation Firewall",
-}
-SUPPORT_CONTROLS_FSTEK = {
-    "antivirus": "Kaspersky Endpoint Security",
-    "disk_encryption": "ViPNet Client",
-    "vpn": "ViPNet TLS",
-    "mfa": "Rutoken ECP",
-    "wifi_password": "StrongPass!2025",
-    "wifi_encryption": "WPA3-Enterprise",
-    "firewall": "ViPNet Coordinator NGFW",
-}
-SUPPORT_CONTROLS_QUANTUM = {
-    "antivirus": "EDR with PQC hardening",
-    "disk_encryption": "Hybrid AES-256 + PQC (Kyber)",
-    "vpn": "Post-Quantum VPN (Kyber/Dilithium)",
-    "mfa": "FIDO2 token",
-    "wifi_password": "VeryStrongPass!2025#PQC",
-    "wifi_encryption": "WPA3-Enterprise (192-bit)",
-    "firewall": "NGFW with TLS1.3 + PQC roadmap",
-}
-SUPPORT_CONTROLS_QUANTUM_FSTEK = {
-    "antivirus": "Kaspersky Endpoint Security (ПАК)",
-    "disk_encryption": "ViPNet Client (ГОСТ+PQC)",
-    "vpn": "ViPNet TLS c PQ-профилем",
-    "mfa": "Rutoken ECP 2.0",
-    "wifi_password": "VeryStrongPass!2025#PQC",
-    "wifi_encryption": "WPA3-Enterprise (192-bit)",
-    "firewall": "ViPNet Coordinator NGFW",
-}
-GENERAL_RECOMMENDATIONS = {
-    "antivirus_missing": "Install certified endpoint protection (EDR/antivirus) on every workstation.",
-    "disk_missing": "Encrypt disks on workstations and servers (full-disk AES-256).",
-    "vpn_missing": "Introduce secure VPN/Zero-Trust access for remote segments.",
-    "mfa_missing": "Protect privileged accounts with MFA or hardware tokens.",
-    "wifi_insecure": "Switch Wi-Fi to WPA3-Enterprise and set strong passwords.",
-    "wifi_quantum_weak": "For quantum-capable adversaries use WPA3-Enterprise (192-bit) and long random passphrases.",
-    "password_plain": "Hash stored passwords and forbid plaintext credential storage.",
-    "backup_missing": "Schedule daily offline backups stored in an isolated network.",
-    "firewall_unknown": "Deploy an NGFW/WAF and document traffic segmentation.",
-    "firewall_absent": "Add a perimeter firewall to separate internal segments.",
-    "siem_missing": "Deploy SIEM/SOC to aggregate logs from all systems.",
-    "personal_data_unprotected": "Encrypt personal data stores and restrict access to them.",
-    "pqc_missing": "Adopt hybrid post-quantum crypto (Kyber/Dilithium) for VPN and data at rest.",
-}
-FSTEK_RECOMMENDATIONS = {
-    "antivirus_missing": "Разверните Kaspersky Endpoint Security или другой сертифицированный ФСТЭК EDR.",
-    "disk_missing": "Зашифруйте рабочие станции с помощью ViPNet Client / Secret Disk (ФСТЭК).",
-    "vpn_missing": "Организуйте защищённый канал на ViPNet TLS или Континент.",
-    "mfa_missing": "Включите Rutoken/JaCarta для администраторов и критичных ролей.",
-    "wifi_insecure": "Настройте Wi-Fi в режиме WPA3-Enterprise с сертификатами ФСТЭК.",
-    "wifi_quantum_weak": "Для квантовых угроз переведите Wi‑Fi в WPA3-Enterprise (192-bit) и используйте длинные случайные ключи.",
-    "password_plain": "Храните пароли только в зашифрованном виде и контролируйте управление ключами.",
-    "backup_missing": "Настройте ежедневные оффлайн-копии с контролем ФСТЭК.",
-    "firewall_unknown": "Замените МЭ на ViPNet Coordinator NGFW или аналог, имеющий сертификат.",
-    "firewall_absent": "Добавьте сертифицированный ФСТЭК межсетевой экран между сегментами.",
-    "siem_missing": "Разверните ФСТЭК-сертифицированный SIEM/SOC (ОКБ САПР, РусГидро и т.д.).",
-    "personal_data_unprotected": "Защитите ПДн ViPNet-шифрованием и аппаратными токенами доступа.",
-    "pqc_missing": "Используйте гибридные ГОСТ+PQC профили в ViPNet TLS/Client для защиты трафика и хранилищ.",
-}
+scoring_rules = rule_book()
 
 
-def clamp(value: float, low: float = 0.0, high: float = 100.0) -> float:
-    return max(low, min(high, value))
+SESSION_TTL = float(os.getenv("SESSION_TTL", "3600"))
+SESSION_MAX = int(os.getenv("SESSION_MAX", "256"))
+session_store = SessionStore(SESSION_TTL, SESSION_MAX)
 
 
-def extract_connections(nodes: List[NetworkNode]) -> List[Tuple[str, str]]:
-    known_ids = {node.id for node in nodes}
-    result: set[Tuple[str, str]] = set()
-    for node in nodes:
-        for target in node.connections or []:
-            if target not in known_ids or target == node.id:
-                continue
-            pair = tuple(sorted((node.id, target)))
-            result.add(pair)
-    return sorted(result)
-
-
-def is_wifi_secure(wifi: WifiSettings | None) -> bool:
-    if not wifi:
-        return False
-    if not wifi.password or len(wifi.password) < 8:
-        return False
-    if not wifi.encryption:
-        return False
-    encryption = wifi.encryption.lower()
-    return any(prefix in encryption for prefix in STRONG_WIFI_PREFIXES)
-
-
-def is_wifi_quantum_ready(wifi: WifiSettings | None) -> bool:
-    if not wifi:
-        return False
-    if not wifi.password or len(wifi.password) < 12:
-        return False
-    if not wifi.encryption:
-        return False
-    enc = wifi.encryption.lower()
-    return "wpa3" in enc and ("192" in enc or "enterprise" in enc)
-
-
-def has_pq_encryption(values: List[str]) -> bool:
-    normalized = [v.lower() for v in values]
-    return any("kyber" in v or "post-quantum" in v or "pqc" in v or "pq" in v for v in normalized)
-
-
-def normalize_backup(freq: str | None) -> str:
-    if not freq:
-        return "none"
-    freq = freq.strip().lower()
-    if freq == "daily":
-        return "daily"
-    if freq == "weekly":
-        return "weekly"
-    if freq == "monthly":
-        return "monthly"
-    return "none"
-
-
-def ensure_security_policy(node_dict: Dict[str, Any]) -> Dict[str, Any]:
-    node_dict["security_policy"] = {
-        "password_hashed": True,
-        "backup_frequency": "daily",
-    }
-    return node_dict
+def record_llm_call(model: str, started: float, error: BaseException | None) -> None:
+    if error is None:
+        outcome = "ok"
+    elif isinstance(error, asyncio.CancelledError):
+        outcome = "cancelled"
+    else:
+        outcome = "error"
+        llm_errors_total.inc(model=model, error=type(error).__name__)
+    llm_request_seconds.observe(time.perf_counter() - started, model=model, outcome=outcome)
+
+
+def record_usage(model: str, usage: Any, prompt_chars: int) -> None:
+    if usage is None:
+        return
+    llm_tokens_total.inc(usage.prompt_tokens or 0, model=model, kind="prompt")
+    llm_tokens_total.inc(usage.completion_tokens or 0, model=model, kind="completion")
+    if usage.prompt_tokens:
+        token_estimator.observe(prompt_chars, usage.prompt_tokens)
+
+
+async def request_completion(user_prompt: str, model: str = LLM_MODEL) -> str:
+    async with llm_slots:
+        started, error = time.perf_counter(), None
+        try:
+            response = await client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": user_prompt},
+                ],
+                temperature=0.1,
+                max_tokens=3000,
+            )
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            record_llm_call(model, started, error)
+    record_usage(model, response.usage, len(SYSTEM_PROMPT) + len(user_prompt))
+    return (response.choices[0].message.content or "").strip()
+
+
+async def stream_completion(user_prompt: str, model: str = LLM_MODEL) -> AsyncIterator[str]:
+    async with llm_slots:
+        started, error = time.perf_counter(), None
+        try:
+            stream = await client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": user_prompt},
+                ],
+                temperature=0.1,
+                max_tokens=3000,
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+            async for chunk in stream:
+                if chunk.usage:
+                    record_usage(model, chunk.usage, len(SYSTEM_PROMPT) + len(user_prompt))
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            record_llm_call(model, started, error)
+
+
+def request_cache_key(request: AnalysisRequest, variant: str = "") -> str:
+    return canonical_request_key(
+        [node.as_dict() for node in request.compact_nodes()],
+        request.threat_model.model_dump(),
+        salt=",".join(model_chain.models) + scoring_rules.version + variant,
+    )
 
 
-def apply_ideal_defaults(node_dict: Dict[str, Any], controls: Dict[str, str]) -> Dict[str, Any]:
-    ideal = dict(node_dict)
-    ideal["weight"] = 10.0
-    ensure_security_policy(ideal)
-    ideal["wifi"] = {
-        "password": controls["wifi_password"],
-        "encryption": controls["wifi_encryption"],
-    }
-    return ideal
+PROMPT_STYLE = os.getenv("PROMPT_STYLE", "compact")
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "6000"))
+PROMPT_CLASS_MEMBERS = int(os.getenv("PROMPT_CLASS_MEMBERS", "20"))
+PROMPT_RUBRIC = (
+    "Оцени с учётом: наличие NGFW/WAF (отсутствие сильно снижает балл), сегментации и SIEM, ежедневных бэкапов, "
+    "MFA/EDR/дискового шифрования на конечных точках, Wi‑Fi не ниже WPA3-Enterprise; для квантовых угроз — гибридные PQC (Kyber/Dilithium) для VPN/хранилищ и WPA3-Enterprise 192-bit. "
+    "При отсутствии критичных контролей (firewall/SIEM/backup/MFA/Wi‑Fi защита) итоговый балл должен быть значительно ниже, чем при их наличии."
+)
+PROMPT_QUANTUM_CLAUSE = (
+    "Если выбран QuantumAttack — финальный балл не должен быть выше, чем при классической атаке для той же конфигурации. "
+    "Штрафуй за наследованные шифры (WPA2, старые VPN), отсутствие PQC/гибридного шифрования и короткие пароли. "
+    "Если выбран UsualAttack — оцени по классическим требованиям, без штрафов за отсутствие PQC."
+)
+PROMPT_FSTEK_CLAUSE = "Все рекомендации должны соответствовать требованиям ФСТЭК."
 
 
-def software_contains(values: List[str], keywords: Tuple[str, ...]) -> bool:
-    normalized = [v.lower() for v in values]
-    return any(any(keyword in value for keyword in keywords) for value in normalized)
+class TokenEstimator:
+    """Character-based prompt token estimate calibrated on reported usage.
 
+    Starts from a fixed characters-per-token ratio and moves it towards the
+    ratio observed in each upstream response (exponential moving average).
+    """
 
-def evaluate_security(
-    nodes: List[NetworkNode],
-    fstec_only: bool = False,
-    pd_sensitive: bool = False,
-    quantum_mode: bool = False,
-) -> Tuple[Dict[str, Any], List[Dict[str, Any]], List[Tuple[str, str]]]:
-    if not nodes:
-        metrics = {
-            "value": 0,
-            "weight_ratio": 0.0,
-            "connection_ratio": 0.0,
-            "control_details": [],
-            "findings": [],
-            "finding_codes": [],
-        }
-        return metrics, [], []
+    def __init__(self, chars_per_token: float = 3.0, smoothing: float = 0.2):
+        self.chars_per_token = chars_per_token
+        self.smoothing = smoothing
+        self.samples = 0
+
+    def estimate(self, text: str) -> int:
+        return int(len(text) / self.chars_per_token) + 1
+
+    def observe(self, chars: int, tokens: int) -> None:
+        if chars <= 0 or tokens <= 0:
+            return
+        self.samples += 1
+        self.chars_per_token += self.smoothing * (chars / tokens - self.chars_per_token)
+
+
+token_estimator = TokenEstimator()
+
+
+def describe_threat(threat: ThreatModel) -> str:
+    return (
+        f"Quantum capability: {threat.quantum_capability}, "
+        f"Error correction: {threat.has_error_correction}, "
+        f"FSTEK: {threat.is_fstec_compliant}, "
+        f"Large PD store: {threat.has_large_pd_storage}"
+    )
 
-    unique_edges = extract_connections(nodes)
-    total_nodes = len(nodes)
-    max_edges = total_nodes * (total_nodes - 1) // 2
-    connection_ratio = 1.0 if max_edges == 0 else min(1.0, len(unique_edges) / max_edges)
 
-    total_weight = sum((node.weight if node.weight is not None else 5.0) for node in nodes)
-    max_weight = max(total_nodes * 10.0, 1.0)
-    weight_ratio = min(1.0, total_weight / max_weight)
+def compose_user_prompt(threat: ThreatModel, infrastructure: List[str], score: int, payload_json: str) -> str:
+    extra_clause = PROMPT_FSTEK_CLAUSE if threat.is_fstec_compliant else ""
+    return (
+        f"Текущая инфраструктура:\n{chr(10).join(infrastructure) if infrastructure else 'узлы отсутствуют'}\n\n"
+        f"Модель угроз: {describe_threat(threat)}. {extra_clause}\n"
+        f"{PROMPT_RUBRIC}\n{PROMPT_QUANTUM_CLAUSE}\n"
+        f"Локальная модель оценила стойкость в {score} баллов. Проверь расчёт, при необходимости скорректируй и верни JSON строго по схеме.\n"
+        f"Подробные данные:\n`json\n{payload_json}\n`"
+    )
 
-    base_weight_component = weight_ratio * 45.0
-    base_connection_component = connection_ratio * 25.0
 
-    control_adjustments = 0.0
-    control_details: List[str] = [
-        f"+{base_weight_component:.1f} from current node weights",
-        f"+{base_connection_component:.1f} from link density",
+def build_user_prompt(
+    request: AnalysisRequest,
+    metrics: Dict[str, Any],
+    ideal_nodes: List[Dict[str, Any]],
+    connection_pairs: List[Tuple[str, str]],
+) -> str:
+    if PROMPT_STYLE == "full":
+        return build_full_user_prompt(request, metrics, ideal_nodes, connection_pairs)
+    return build_compact_user_prompt(request, metrics, ideal_nodes, connection_pairs)
+
+
+def build_full_user_prompt(
+    request: AnalysisRequest,
+    metrics: Dict[str, Any],
+    ideal_nodes: List[Dict[str, Any]],
+    connection_pairs: List[Tuple[str, str]],
+) -> str:
+    nodes = request.compact_nodes()
+    nodes_desc = [
+        f"- {node.name} ({node.type}): weight={node.weight or 'n/a'}, AV={'yes' if node.antivirus else 'no'}, VPN={'yes' if node.vpn else 'no'}, links={len(node.connections or [])}"
+        for node in nodes
     ]
-    finding_texts: set[str] = set()
-    finding_codes: set[str] = set()
-    ideal_nodes: List[Dict[str, Any]] = []
-    if quantum_mode and fstec_only:
-        controls = SUPPORT_CONTROLS_QUANTUM_FSTEK
-    elif quantum_mode:
-        controls = SUPPORT_CONTROLS_QUANTUM
-    elif fstec_only:
-        controls = SUPPORT_CONTROLS_FSTEK
-    else:
-        controls = SUPPORT_CONTROLS_DEFAULT
 
-    firewall_present = any(node.type == "firewall" for node in nodes)
-    siem_present = False
-    backup_platform_present = False
+    payload = {
+        "local_score": metrics,
+        "nodes": [node.as_dict() for node in nodes],
+        "ideal_nodes": ideal_nodes,
+        "connections": [{"source": a, "target": b} for a, b in connection_pairs],
+        "threat_model": request.threat_model.model_dump(),
+        "fstec_mode": request.threat_model.is_fstec_compliant,
+    }
+    payload_json = json.dumps(payload, ensure_ascii=False, indent=2)
+    return compose_user_prompt(request.threat_model, nodes_desc, metrics["value"], payload_json)
+
 
+NODE_CONFIG_FIELDS = tuple(
+    field for field in CompactNode.__slots__ if field not in ("id", "name", "connections", "password_policy")
+)
+
+
+def node_config(node: CompactNode) -> Dict[str, Any]:
+    config: Dict[str, Any] = {}
+    for key in NODE_CONFIG_FIELDS:
+        value = getattr(node, key)
+        if value is None:
+            continue
+        if isinstance(value, tuple):
+            value = {field: item for field, item in zip(value._fields, value) if item is not None}
+        elif isinstance(value, list):
+            if not value:
+                continue
+            value = list(value)
+        config[key] = value
+    wifi = config.get("wifi")
+    if wifi and "password" in wifi:
+        wifi["password_length"] = len(wifi.pop("password") or "")
+    return config
+
+
+def node_fingerprint(node: CompactNode) -> str:
+    return json.dumps(node_config(node), ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+
+def group_node_classes(nodes: List[CompactNode]) -> List[Tuple[Dict[str, Any], List[CompactNode]]]:
+    classes: Dict[str, Tuple[Dict[str, Any], List[CompactNode]]] = {}
     for node in nodes:
-        ideal = apply_ideal_defaults(node.model_dump(mode="python"), controls)
-        ideal.setdefault("professional_software", node.professional_software or [])
-        ideal.setdefault("connections", node.connections or [])
-        ideal.setdefault("encryption", node.encryption or [])
-
-        normalized_soft = [s.lower() for s in node.professional_software or []]
-        if software_contains(normalized_soft, SIEM_KEYWORDS):
-            siem_present = True
-        if software_contains(normalized_soft, BACKUP_KEYWORDS):
-            backup_platform_present = True
-
-        is_endpoint = node.type in ENDPOINT_TYPES
-
-        if is_endpoint:
-            if node.antivirus:
-                control_adjustments += 8
-                control_details.append(f"+8 {node.name}: endpoint protected")
-            else:
-                control_adjustments -= 12
-                control_details.append(f"-12 {node.name}: antivirus missing")
-                finding_texts.add("Install certified endpoint protection")
-                finding_codes.add("antivirus_missing")
-            ideal["antivirus"] = controls["antivirus"]
-
-            if node.encryption:
-                control_adjustments += 6
-                control_details.append(f"+6 {node.name}: disk encryption enabled")
-            else:
-                control_adjustments -= 8
-                control_details.append(f"-8 {node.name}: disk encryption missing")
-                finding_texts.add("Enable disk encryption on endpoints")
-                finding_codes.add("disk_missing")
-            ideal["encryption"] = [controls["disk_encryption"]]
-
-            if node.vpn:
-                control_adjustments += 4
-                control_details.append(f"+4 {node.name}: VPN in place")
-            else:
-                control_adjustments -= 4
-                control_details.append(f"-4 {node.name}: no VPN for remote access")
-                finding_texts.add("Provide secure VPN/ZeroTrust access")
-                finding_codes.add("vpn_missing")
-            ideal["vpn"] = controls["vpn"]
-
-            auth_value = (node.auth_type or "").lower()
-            has_mfa = any(keyword in auth_value for keyword in ("token", "fido", "usb", "otp", "face", "bio"))
-            if has_mfa:
-                control_adjustments += 6
-                control_details.append(f"+6 {node.name}: MFA enabled")
-            else:
-                control_adjustments -= 4
-                control_details.append(f"-4 {node.name}: MFA missing")
-                finding_texts.add("Add MFA/hardware tokens for operators")
-                finding_codes.add("mfa_missing")
-            ideal["auth_type"] = controls["mfa"]
-
-        wifi_secure = is_wifi_secure(node.wifi)
-        wifi_quantum = is_wifi_quantum_ready(node.wifi)
-        if node.type == "wifi_ap" or node.wifi:
-            if quantum_mode:
-                if wifi_quantum:
-                    control_adjustments += 6
-                    control_details.append(f"+6 {node.name}: Wi‑Fi PQC-ready (WPA3-Enterprise)")
-                else:
-                    control_adjustments -= 14
-                    control_details.append(f"-14 {node.name}: Wi‑Fi не готов к квантовым угрозам")
-                    finding_texts.add("Switch Wi-Fi to WPA3 with strong password")
-                    finding_codes.add("wifi_quantum_weak")
-            else:
-                if wifi_secure:
-                    control_adjustments += 5
-                    control_details.append(f"+5 {node.name}: Wi‑Fi защищён")
-                else:
-                    control_adjustments -= 10
-                    control_details.append(f"-10 {node.name}: Wi‑Fi небезопасен")
-                    finding_texts.add("Switch Wi-Fi to WPA3 with strong password")
-                    finding_codes.add("wifi_insecure")
-            ideal["wifi"] = {
-                "password": controls["wifi_password"],
-                "encryption": controls["wifi_encryption"],
-            }
-
-        policy = node.security_policy
-        if policy and policy.password_hashed:
-            control_adjustments += 4
-            control_details.append(f"+4 {node.name}: пароли хэшируются")
-        else:
-            control_adjustments -= 6
-            control_details.append(f"-6 {node.name}: пароли хранятся открыто")
-            finding_texts.add("Hash passwords and protect credential store")
-            finding_codes.add("password_plain")
-            ensure_security_policy(ideal)
-
-        backup_freq = normalize_backup((policy.backup_frequency if policy else None))
-        if backup_freq == "daily":
-            control_adjustments += 7
-            control_details.append(f"+7 {node.name}: daily backups")
-        elif backup_freq == "weekly":
-            control_adjustments += 5
-            control_details.append(f"+5 {node.name}: weekly backups")
-        elif backup_freq == "monthly":
-            control_adjustments += 3
-            control_details.append(f"+3 {node.name}: monthly backups")
+        fingerprint = node_fingerprint(node)
+        if fingerprint not in classes:
+            classes[fingerprint] = (node_config(node), [])
+        classes[fingerprint][1].append(node)
+    return sorted(classes.values(), key=lambda entry: -len(entry[1]))
+
+
+def summarize_control_details(control_details: List[str]) -> Dict[str, int]:
+    summary: Dict[str, int] = {}
+    for line in control_details:
+        points, _, rest = line.partition(" ")
+        if ": " in rest:
+            line = f"{points} {rest.rsplit(': ', 1)[1]}"
+        summary[line] = summary.get(line, 0) + 1
+    return summary
+
+
+def summarize_topology(nodes: List[CompactNode], connection_pairs: List[Tuple[str, str]]) -> Dict[str, Any]:
+    degree: Counter[str] = Counter()
+    for a, b in connection_pairs:
+        degree[a] += 1
+        degree[b] += 1
+    total = len(nodes)
+    return {
+        "nodes": total,
+        "edges": len(connection_pairs),
+        "types": dict(Counter(node.type for node in nodes)),
+        "isolated": sum(1 for node in nodes if not degree[node.id]),
+        "max_degree": max(degree.values(), default=0),
+        "avg_degree": round(2 * len(connection_pairs) / total, 2) if total else 0.0,
+    }
+
+
+def build_compact_user_prompt(
+    request: AnalysisRequest,
+    metrics: Dict[str, Any],
+    ideal_nodes: List[Dict[str, Any]],
+    connection_pairs: List[Tuple[str, str]],
+    token_budget: int = PROMPT_TOKEN_BUDGET,
+) -> str:
+    """User prompt with nodes grouped into identically configured classes.
+
+    The payload replaces per-node dumps with classes, per-node control lines
+    with aggregated counts and ideal nodes with the target controls. When the
+    estimated size (system prompt included) exceeds ``token_budget`` detail is
+    dropped step by step: the edge list, then class member ids, then the
+    smallest classes, which are folded into one remainder entry.
+    """
+    threat = request.threat_model
+    quantum_mode = is_quantum_threat(threat)
+    nodes = request.compact_nodes()
+    classes = group_node_classes(nodes)
+    local_score = {key: value for key, value in metrics.items() if key != "control_details"}
+    local_score["control_summary"] = summarize_control_details(metrics.get("control_details", []))
+    base_payload = {
+        "local_score": local_score,
+        "topology": summarize_topology(nodes, connection_pairs),
+        "ideal_controls": select_support_controls(threat.is_fstec_compliant, quantum_mode),
+        "ideal_support_nodes": [node["name"] for node in ideal_nodes if str(node.get("id", "")).startswith("ideal-")],
+        "threat_model": threat.model_dump(),
+        "fstec_mode": threat.is_fstec_compliant,
+    }
+
+    def render(member_limit: int, with_edges: bool, class_limit: int) -> str:
+        node_classes = []
+        lines = []
+        for config, members in classes[:class_limit]:
+            entry: Dict[str, Any] = {"count": len(members), "config": config}
+            if member_limit:
+                entry["members"] = [node.id for node in members[:member_limit]]
+            node_classes.append(entry)
+            lines.append(
+                f"- {len(members)}× {config['type']}: weight={config.get('weight', 'n/a')}, "
+                f"AV={'yes' if config.get('antivirus') else 'no'}, VPN={'yes' if config.get('vpn') else 'no'}, "
+                f"e.g. {members[0].name}"
+            )
+        rest = classes[class_limit:]
+        if rest:
+            node_classes.append({
+                "count": sum(len(members) for _, members in rest),
+                "classes": len(rest),
+                "types": dict(Counter(config["type"] for config, _ in rest)),
+            })
+            lines.append(f"- ещё {node_classes[-1]['count']} узлов в {len(rest)} мелких классах")
+        payload = dict(base_payload, node_classes=node_classes)
+        if with_edges:
+            payload["edges"] = [f"{a}~{b}" for a, b in connection_pairs]
+        payload_json = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+        return compose_user_prompt(threat, lines, metrics["value"], payload_json)
+
+    def fits(prompt: str) -> bool:
+        return token_estimator.estimate(SYSTEM_PROMPT + prompt) <= token_budget
+
+    for member_limit, with_edges in ((PROMPT_CLASS_MEMBERS, True), (PROMPT_CLASS_MEMBERS, False), (3, False), (0, False)):
+        prompt = render(member_limit, with_edges, len(classes))
+        if fits(prompt):
+            return prompt
+
+    low, high = 1, len(classes)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if fits(render(0, False, middle)):
+            low = middle
         else:
-            control_adjustments -= 10
-            control_details.append(f"-10 {node.name}: no backup strategy")
-            finding_texts.add("Configure daily offline backups")
-            finding_codes.add("backup_missing")
-            ensure_security_policy(ideal)
-
-        if node.type == "firewall":
-            firewall_present = True
-            if node.firewall_type:
-                control_adjustments += 8
-                control_details.append(f"+8 {node.name}: firewall type defined")
-            else:
-                control_adjustments -= 12
-                control_details.append(f"-12 {node.name}: firewall class unknown")
-                finding_texts.add("Deploy NGFW/WAF with proper classification")
-                finding_codes.add("firewall_unknown")
-            ideal["firewall_type"] = controls["firewall"]
-
-        if node.personal_data and node.personal_data.enabled:
-            if node.encryption or wifi_secure or (policy and policy.password_hashed):
-                control_adjustments += 3
-                control_details.append(f"+3 {node.name}: персональные данные защищены")
-            else:
-                control_adjustments -= 12
-                control_details.append(f"-12 {node.name}: персональные данные не защищены")
-                finding_texts.add("Encrypt and limit access to personal data")
-                finding_codes.add("personal_data_unprotected")
-                ideal["encryption"] = [controls["disk_encryption"]]
-                ideal["auth_type"] = controls["mfa"]
-
-        ideal_nodes.append(ideal)
-
-    support_nodes: List[Dict[str, Any]] = []
-    endpoint_ids = [node.id for node in nodes]
-
-    if not firewall_present:
-        control_adjustments -= 20
-        control_details.append("-20 No perimeter firewall in the architecture")
-        finding_texts.add("Add a perimeter firewall between network segments")
-        finding_codes.add("firewall_absent")
-        support_nodes.append({
-            "id": "ideal-firewall",
-            "type": "firewall",
-            "name": "Ideal NGFW",
-            "firewall_type": controls["firewall"],
-            "weight": 10.0,
-            "connections": endpoint_ids,
-            "professional_software": ["Segmentation", "IPS"],
-            "security_policy": {"password_hashed": True, "backup_frequency": "daily"},
-        })
+            high = middle - 1
+    return render(0, False, low)
 
-    if not siem_present:
-        control_adjustments -= 12
-        control_details.append("-12 No SIEM/SOC collecting events")
-        finding_texts.add("Deploy SIEM/SOC to aggregate logs")
-        finding_codes.add("siem_missing")
-        support_nodes.append({
-            "id": "ideal-siem",
-            "type": "pc",
-            "name": "Central SIEM",
-            "weight": 10.0,
-            "professional_software": ["Managed SIEM", "SOAR"],
-            "connections": endpoint_ids,
-            "security_policy": {"password_hashed": True, "backup_frequency": "daily"},
-        })
 
-    if not backup_platform_present:
-        control_adjustments -= 10
-        control_details.append("-10 No dedicated backup appliance")
-        finding_texts.add("Deploy a dedicated backup appliance")
-        finding_codes.add("backup_missing")
-        support_nodes.append({
-            "id": "ideal-backup",
-            "type": "pc",
-            "name": "Backup Appliance",
-            "weight": 10.0,
-            "professional_software": ["Veeam", "Snapshot"],
-            "connections": endpoint_ids,
-            "security_policy": {"password_hashed": True, "backup_frequency": "daily"},
-        })
+LLM_RESPONSE_KEYS = ("score", "summary", "recommendations", "attack_graph")
 
-    if pd_sensitive and not any(node.personal_data and node.personal_data.enabled for node in nodes):
-        support_nodes.append({
-            "id": "ideal-pd-store",
-            "type": "pc",
-            "name": "Protected PD storage",
-            "weight": 10.0,
-            "personal_data": {"enabled": True, "count": 1000},
-            "encryption": [controls["disk_encryption"]],
-            "connections": endpoint_ids,
-            "security_policy": {"password_hashed": True, "backup_frequency": "daily"},
-        })
 
-    ideal_nodes.extend(support_nodes)
-
-    if quantum_mode and not any(has_pq_encryption(node.encryption) for node in nodes):
-        control_adjustments -= 8
-        control_details.append("-8 Нет гибридного постквантового шифрования")
-        finding_texts.add("Adopt hybrid post-quantum crypto (Kyber/Dilithium)")
-        finding_codes.add("pqc_missing")
-        ideal_nodes.append({
-            "id": "ideal-pq-gateway",
-            "type": "pc",
-            "name": "PQ Crypto Gateway",
-            "weight": 10.0,
-            "encryption": [controls["disk_encryption"]],
-            "vpn": controls["vpn"],
-            "connections": endpoint_ids,
-            "security_policy": {"password_hashed": True, "backup_frequency": "daily"},
-        })
+class LLMAttackGraph(BaseModel):
+    model_config = ConfigDict(extra="allow")
 
-    topology_bonus = 0.0
-    if total_nodes > 2:
-        if connection_ratio >= 0.6:
-            topology_bonus = 5.0
-        elif connection_ratio < 0.2:
-            topology_bonus = -5.0
-    if topology_bonus:
-        control_adjustments += topology_bonus
-        control_details.append(f"{topology_bonus:+} network topology factor")
-
-    total_score = clamp(base_weight_component + base_connection_component + control_adjustments)
-
-    metrics = {
-        "value": round(total_score),
-        "weight_ratio": round(weight_ratio, 2),
-        "connection_ratio": round(connection_ratio, 2),
-        "control_details": control_details,
-        "topology_bonus": topology_bonus,
-        "findings": sorted(finding_texts),
-        "finding_codes": sorted(finding_codes),
-    }
-    return metrics, ideal_nodes, unique_edges
+    nodes: List[Dict[str, Any]] = []
+    edges: List[Dict[str, Any]] = []
 
+    @field_validator("nodes", mode="before")
+    @classmethod
+    def keep_nodes(cls, value: Any) -> List[Any]:
+        return [item for item in value if isinstance(item, dict) and "id" in item] if isinstance(value, list) else []
 
-def build_fstek_recommendations(finding_codes: List[str]) -> List[str]:
-    recs = [FSTEK_RECOMMENDATIONS[code] for code in finding_codes if code in FSTEK_RECOMMENDATIONS]
-    if not recs:
-        recs.append("Сохраняйте актуальные сертификаты ФСТЭК и подтверждайте соответствие ежегодно.")
-    return recs[:10]
+    @field_validator("edges", mode="before")
+    @classmethod
+    def keep_edges(cls, value: Any) -> List[Any]:
+        if not isinstance(value, list):
+            return []
+        return [item for item in value if isinstance(item, dict) and "source" in item and "target" in item]
 
 
-def build_general_recommendations(finding_codes: List[str]) -> List[str]:
-    seen: List[str] = []
-    for code in finding_codes:
-        text = GENERAL_RECOMMENDATIONS.get(code)
-        if text and text not in seen:
-            seen.append(text)
-    return seen
+class LLMAnalysis(BaseModel):
+    """Response schema of the model; malformed fields fall back to defaults instead of failing."""
 
+    score: int | None = None
+    summary: str = "Описание отсутствует"
+    recommendations: List[str] = []
+    attack_graph: LLMAttackGraph = Field(default_factory=LLMAttackGraph)
+    ideal_graph: Any = None
 
-@app.post("/api/analyze")
-async def analyze(request: AnalysisRequest):
+    @field_validator("score", mode="before")
+    @classmethod
+    def coerce_score(cls, value: Any) -> int | None:
+        try:
+            return int(float(value))
+        except (TypeError, ValueError, OverflowError):
+            return None
+
+    @field_validator("summary", mode="before")
+    @classmethod
+    def coerce_summary(cls, value: Any) -> str:
+        return "Описание отсутствует" if value is None else str(value)
+
+    @field_validator("recommendations", mode="before")
+    @classmethod
+    def coerce_recommendations(cls, value: Any) -> List[str]:
+        if not isinstance(value, list):
+            value = [value]
+        return [str(item) for item in value if item]
+
+    @field_validator("attack_graph", mode="before")
+    @classmethod
+    def coerce_attack_graph(cls, value: Any) -> Dict[str, Any]:
+        return value if isinstance(value, dict) else {}
+
+
+def merge_llm_result(
+    request: AnalysisRequest,
+    metrics: Dict[str, Any],
+    ideal_nodes: List[Dict[str, Any]],
+    raw: str,
+) -> Dict[str, Any]:
     fstec_mode = request.threat_model.is_fstec_compliant
-    metrics, ideal_nodes, connection_pairs = evaluate_security(
-        request.nodes,
-        fstec_only=fstec_mode,
-        pd_sensitive=request.threat_model.has_large_pd_storage,
-        quantum_mode=bool(
-            request.threat_model.quantum_capability
-            and request.threat_model.quantum_capability.lower().startswith("quantum")
-        ),
-    )
+    data, repairs = extract_json_object(raw, LLM_RESPONSE_KEYS)
+    if data is None:
+        raise ValueError("JSON не найден в ответе модели")
+    for repair in repairs:
+        llm_response_repairs_total.inc(repair=repair)
+
+    analysis = LLMAnalysis.model_validate(data)
+    llm_score = metrics["value"] if analysis.score is None else analysis.score
+    summary = analysis.summary
+    llm_recommendations = analysis.recommendations
+    attack_graph = analysis.attack_graph.model_dump()
+
+    base_recs = build_base_recommendations(metrics, fstec_mode)
+
+    if fstec_mode:
+        recommendations = base_recs
+    else:
+        merged: List[str] = []
+        for rec in base_recs + llm_recommendations:
+            if rec and rec not in merged:
+                merged.append(rec)
+        recommendations = merged[:10]
+
+    result = {
+        "score": llm_score,
+        "summary": summary,
+        "recommendations": recommendations,
+        "attack_graph": attack_graph,
+        "local_score": metrics,
+        "ideal_nodes": ideal_nodes,
+        "threat_model": request.threat_model.model_dump(),
+    }
 
+    if "ideal_graph" in analysis.model_fields_set:
+        result["ideal_graph"] = analysis.ideal_graph
+
+    return result
+
+
+async def complete_analysis(
+    request: AnalysisRequest,
+    cache_key: str,
+    local: Tuple[Dict[str, Any], List[Dict[str, Any]], List[Tuple[str, str]]],
+    timer: StageTimer | None = None,
+    features: np.ndarray | None = None,
+) -> Dict[str, Any]:
+    timer = timer or StageTimer(stage_seconds, endpoint="analyze")
+    metrics, ideal_nodes, connection_pairs = local
+    with timer.stage("serialize_payload"):
+        user_prompt = build_user_prompt(request, metrics, ideal_nodes, connection_pairs)
+
+    async def attempt(model: str) -> Tuple[Dict[str, Any], float]:
+        raw = await request_completion(user_prompt, model)
+        logger.debug("Raw LLM response from %s:\n%s", model, raw)
+        started = time.perf_counter()
+        # A reply without a usable JSON object fails the attempt, so the next model gets a chance.
+        return merge_llm_result(request, metrics, ideal_nodes, raw), time.perf_counter() - started
+
+    started = time.perf_counter()
+    model, (result, parse_seconds) = await model_chain.call(attempt)
+    timer.record("llm_call", time.perf_counter() - started - parse_seconds)
+    timer.record("parse_merge", parse_seconds)
+    result["model"] = model
+    result_cache.set(cache_key, result)
+    remember_analysis(request, cache_key, metrics, result, features)
+    return result
+
+
+def similarity_features(request: AnalysisRequest, metrics: Dict[str, Any]) -> np.ndarray:
+    """Feature vector of an analysed request for ``similarity_index``.
+
+    Threat-model flags, the local score, the node-type histogram, the share
+    of nodes passing each control fact, graph statistics and the finding
+    codes (hashed into ``SIMILARITY_CODE_BUCKETS``). Ratios are in 0..1, so
+    a single added workstation moves a mid-sized topology only slightly.
+    """
     threat = request.threat_model
-    threat_desc = (
-        f"Quantum capability: {threat.quantum_capability}, "
-        f"Error correction: {threat.has_error_correction}, "
-        f"FSTEK: {threat.is_fstec_compliant}, "
-        f"Large PD store: {threat.has_large_pd_storage}"
+    nodes = request.compact_nodes()
+    size = max(len(nodes), 1)
+    rules = current_rules(threat.is_fstec_compliant, is_quantum_threat(threat))
+    columns = rules.columns([rules.facts(node) for node in nodes])
+    coverage = []
+    for name in SIMILARITY_FACTS:
+        column = columns.get(name)
+        if column is None or not len(column):
+            coverage.append(0.0)
+        elif name in rules.choices:
+            coverage.append(float(column.mean()) / max(len(rules.choices[name]) - 1, 1))
+        else:
+            coverage.append(float(column.mean()))
+    types = Counter(node.type for node in nodes)
+    topology = metrics.get("topology") or {}
+    codes = np.zeros(SIMILARITY_CODE_BUCKETS)
+    for code in metrics["finding_codes"]:
+        codes[zlib.crc32(code.encode("utf-8")) % SIMILARITY_CODE_BUCKETS] = 1.0
+    flags = (is_quantum_threat(threat), threat.is_fstec_compliant, threat.has_large_pd_storage, threat.has_error_correction)
+    return np.concatenate([
+        np.array(flags, dtype=np.float64) * SIMILARITY_THREAT_WEIGHT,
+        [metrics["value"] / 100.0],
+        [types.get(name, 0) / size for name in SIMILARITY_NODE_TYPES],
+        [sum(count for name, count in types.items() if name not in SIMILARITY_NODE_TYPES) / size],
+        coverage,
+        [
+            metrics.get("connection_ratio", 0.0),
+            min(topology.get("mean_degree", 0.0) / 10.0, 1.0),
+            float(np.log10(len(nodes) + 1)) / 6.0,
+        ],
+        [float(topology.get(name, 0.0)) for name in SIMILARITY_GRAPH_METRICS],
+        codes * SIMILARITY_CODE_WEIGHT,
+    ])
+
+
+def remember_analysis(
+    request: AnalysisRequest,
+    cache_key: str,
+    metrics: Dict[str, Any],
+    result: Dict[str, Any],
+    features: np.ndarray | None = None,
+) -> None:
+    """Adds an LLM result to ``similarity_index`` under the request's site.
+
+    The model's own recommendations are kept apart from the local ones.
+    """
+    if not SIMILARITY_REUSE:
+        return
+    local_recommendations = set(build_base_recommendations(metrics, request.threat_model.is_fstec_compliant))
+    similarity_index.add(
+        cache_key,
+        similarity_features(request, metrics) if features is None else features,
+        {
+            "score": result["score"],
+            "local_value": metrics["value"],
+            "finding_codes": metrics["finding_codes"],
+            "summary": result["summary"],
+            "attack_graph": result["attack_graph"],
+            "recommendations": [rec for rec in result["recommendations"] if rec not in local_recommendations],
+            "model": result.get("model"),
+        },
+        group=request.site or "default",
     )
 
-    nodes_desc = [
-        f"- {node.name} ({node.type}): weight={node.weight or 'n/a'}, AV={'yes' if node.antivirus else 'no'}, VPN={'yes' if node.vpn else 'no'}, links={len(node.connections or [])}"
-        for node in request.nodes
+
+def restrict_attack_graph(graph: Dict[str, Any], node_ids: set[str]) -> Dict[str, Any]:
+    """``graph`` without the nodes whose ids are not in ``node_ids`` and the edges touching them."""
+    nodes = [node for node in graph.get("nodes", []) if node.get("id") in node_ids]
+    edges = [
+        edge for edge in graph.get("edges", []) if edge.get("source") in node_ids and edge.get("target") in node_ids
     ]
+    return dict(graph, nodes=nodes, edges=edges)
+
+
+def reuse_analysis(
+    request: AnalysisRequest,
+    local: Tuple[Dict[str, Any], List[Dict[str, Any]], List[Tuple[str, str]]],
+    features: np.ndarray,
+) -> Tuple[Dict[str, Any] | None, Dict[str, Any]]:
+    """Result built from the nearest stored LLM analysis if it is within ``SIMILARITY_MAX_DISTANCE``.
+
+    Only analyses of the same site are candidates. The stored summary is
+    kept, and so is the stored attack graph, restricted to node ids of the
+    fresh request. The score keeps the model's correction of the local score
+    it saw, applied to the fresh local score; recommendations, ``local_score``
+    and ``ideal_nodes`` are rebuilt from the fresh local evaluation. Returns
+    the result (None without a match) and the reuse report.
+    """
+    match = similarity_index.nearest(features, request.site or "default")
+    reused = match is not None and match[0] <= SIMILARITY_MAX_DISTANCE
+    similarity_index.record(reused)
+    report: Dict[str, Any] = {
+        "reused": reused,
+        "distance": round(match[0], 4) if match is not None else None,
+        "max_distance": SIMILARITY_MAX_DISTANCE,
+        "reuse_rate": round(similarity_index.reuse_rate(), 4),
+    }
+    if not reused:
+        return None, report
 
-    payload = {
+    _, _, stored = match
+    metrics, ideal_nodes, _ = local
+    fstec_mode = request.threat_model.is_fstec_compliant
+    codes, stored_codes = set(metrics["finding_codes"]), set(stored["finding_codes"])
+    report.update(
+        score_delta=metrics["value"] - stored["local_value"],
+        findings_added=sorted(codes - stored_codes),
+        findings_removed=sorted(stored_codes - codes),
+    )
+    recommendations = build_base_recommendations(metrics, fstec_mode)
+    if not fstec_mode:
+        for rec in stored["recommendations"]:
+            if rec and rec not in recommendations:
+                recommendations.append(rec)
+        recommendations = recommendations[:10]
+    result = {
+        "score": round(clamp(stored["score"] + metrics["value"] - stored["local_value"])),
+        "summary": stored["summary"],
+        "recommendations": recommendations,
+        "attack_graph": restrict_attack_graph(stored["attack_graph"], {node.id for node in request.compact_nodes()}),
         "local_score": metrics,
-        "nodes": [node.model_dump(mode="python") for node in request.nodes],
         "ideal_nodes": ideal_nodes,
-        "connections": [{"source": a, "target": b} for a, b in connection_pairs],
         "threat_model": request.threat_model.model_dump(),
-        "fstec_mode": fstec_mode,
+        "model": stored["model"],
     }
-    payload_json = json.dumps(payload, ensure_ascii=False, indent=2)
+    return result, report
+
+
+def schedule_refresh(
+    request: AnalysisRequest,
+    cache_key: str,
+    local: Tuple[Dict[str, Any], List[Dict[str, Any]], List[Tuple[str, str]]],
+    features: np.ndarray,
+) -> None:
+    """Runs the upstream call for a reused request in the background, so later requests get its own analysis."""
+
+    async def refresh() -> None:
+        try:
+            await analysis_flights.run(
+                cache_key,
+                lambda: complete_analysis(request, cache_key, local, StageTimer(stage_seconds, endpoint="refresh"), features),
+            )
+        except Exception:
+            logger.exception("Deferred analysis failed")
+
+    task = asyncio.create_task(refresh())
+    background_refreshes.add(task)
+    task.add_done_callback(background_refreshes.discard)
+
+
+def client_key(http_request: Request) -> str:
+    if ADMISSION_CLIENT_HEADER:
+        value = http_request.headers.get(ADMISSION_CLIENT_HEADER)
+        if value:
+            return value.split(",")[0].strip()
+    return http_request.client.host if http_request.client else "unknown"
+
+
+async def admit(client: str | None, endpoint: str, cost: float = 1.0) -> None:
+    """Waits for the client's admission to the upstream; raises 429 with Retry-After when the wait would be too long."""
+    if client is None or ADMISSION_RATE <= 0:
+        return
+    try:
+        await admission.acquire(client, cost)
+    except AdmissionRejected as e:
+        retry_after = max(math.ceil(e.retry_after), 1)
+        analysis_requests_total.inc(endpoint=endpoint, source="rejected")
+        raise HTTPException(
+            status_code=429,
+            detail=f"Too many analyses from this client, retry in {retry_after} s",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+
+def fallback_result(
+    request: AnalysisRequest,
+    local: Tuple[Dict[str, Any], List[Dict[str, Any]], List[Tuple[str, str]]],
+    error: ChainExhausted,
+) -> Dict[str, Any]:
+    logger.warning("All models failed, serving the local result: %s", error)
+    return dict(build_local_result(request, local), llm_error=str(error))
+
+
+def topology_hash(request: AnalysisRequest) -> str:
+    return canonical_request_key([node.as_dict() for node in request.compact_nodes()], {})
 
-    extra_clause = "Все рекомендации должны соответствовать требованиям ФСТЭК." if fstec_mode else ""
-    quantum_clause = (
-        "Если выбран QuantumAttack — финальный балл не должен быть выше, чем при классической атаке для той же конфигурации. "
-        "Штрафуй за наследованные шифры (WPA2, старые VPN), отсутствие PQC/гибридного шифрования и короткие пароли. "
-        "Если выбран UsualAttack — оцени по классическим требованиям, без штрафов за отсутствие PQC."
+
+def store_history(request: AnalysisRequest, result: Dict[str, Any], source: str) -> None:
+    try:
+        analysis_history.record(
+            request.site or "default",
+            topology_hash(request),
+            request.threat_model.model_dump(),
+            result,
+            source,
+            len(request.nodes),
+        )
+        history_records_total.inc(outcome="ok")
+    except Exception:
+        logger.exception("History write failed")
+        history_records_total.inc(outcome="error")
+
+
+def record_history(request: AnalysisRequest, result: Dict[str, Any], source: str) -> None:
+    """Writes the analysis to the history store in a worker thread, off the response path."""
+    if not HISTORY_ENABLED:
+        return
+    task = asyncio.create_task(asyncio.to_thread(store_history, request, result, source))
+    history_writes.add(task)
+    task.add_done_callback(history_writes.discard)
+
+
+@app.post("/api/score")
+async def score(request: AnalysisRequest, min_score: int | None = None, group_classes: bool = False):
+    metrics, _, _ = score_request(request, group_classes)
+    result = {"score": metrics["value"], "local_score": metrics}
+    if min_score is not None:
+        result["passed"] = metrics["value"] >= min_score
+    return result
+
+
+def compare_sweep(request: AnalysisRequest, include_ideal: bool = False) -> Dict[str, Any]:
+    """Comparison matrix of ``evaluate_security_sweep`` against the request's own threat model."""
+    threat = request.threat_model
+    current = sweep_profile_key(is_quantum_threat(threat), threat.is_fstec_compliant, threat.has_large_pd_storage)
+    variants = evaluate_security_sweep(request.compact_nodes())
+    baseline = next(variant["metrics"] for variant in variants if variant["profile"] == current)
+    baseline_codes = set(baseline["finding_codes"])
+    raised_under: Dict[str, List[str]] = {}
+    profiles: List[Dict[str, Any]] = []
+    for variant in variants:
+        metrics = variant["metrics"]
+        codes = set(metrics["finding_codes"])
+        for code in metrics["finding_codes"]:
+            raised_under.setdefault(code, []).append(variant["profile"])
+        entry = {
+            "profile": variant["profile"],
+            "quantum_mode": variant["quantum_mode"],
+            "fstec_only": variant["fstec_only"],
+            "pd_sensitive": variant["pd_sensitive"],
+            "score": metrics["value"],
+            "delta": metrics["value"] - baseline["value"],
+            "findings_added": sorted(codes - baseline_codes),
+            "findings_removed": sorted(baseline_codes - codes),
+            "local_score": metrics,
+        }
+        if include_ideal:
+            entry["ideal_nodes"] = variant["ideal_nodes"]
+        profiles.append(entry)
+    return {
+        "current_profile": current,
+        "profiles": profiles,
+        "common_findings": sorted(code for code, where in raised_under.items() if len(where) == len(variants)),
+        # Finding codes raised under some profiles only, with those profiles.
+        "profile_findings": {code: where for code, where in sorted(raised_under.items()) if len(where) < len(variants)},
+    }
+
+
+def build_sweep_prompt(request: AnalysisRequest, comparison: Dict[str, Any]) -> str:
+    rows = [
+        f"- {entry['profile']}: {entry['score']} баллов; находки: {', '.join(entry['local_score']['finding_codes']) or 'нет'}"
+        for entry in comparison["profiles"]
+    ]
+    return (
+        f"Одна и та же инфраструктура ({len(request.nodes)} узлов) оценена локальной моделью во всех профилях "
+        "(quantum — квантовый нарушитель, fstec — требования ФСТЭК, pd — крупное хранилище ПДн, default — ни одного):\n"
+        + "\n".join(rows)
+        + f"\nТекущий профиль: {comparison['current_profile']}.\n"
+        "В summary кратко объясни, чем различаются профили и какие контроли дают разницу в баллах; "
+        "в recommendations — меры, закрывающие находки сразу в нескольких профилях. "
+        "score — балл текущего профиля, attack_graph оставь пустым. Верни JSON строго по схеме."
     )
-    rubric = (
-        "Оцени с учётом: наличие NGFW/WAF (отсутствие сильно снижает балл), сегментации и SIEM, ежедневных бэкапов, "
-        "MFA/EDR/дискового шифрования на конечных точках, Wi‑Fi не ниже WPA3-Enterprise; для квантовых угроз — гибридные PQC (Kyber/Dilithium) для VPN/хранилищ и WPA3-Enterprise 192-bit. "
-        "При отсутствии критичных контролей (firewall/SIEM/backup/MFA/Wi‑Fi защита) итоговый балл должен быть значительно ниже, чем при их наличии."
+
+
+@app.post("/api/sweep")
+async def sweep(request: AnalysisRequest, http_request: Request, include_ideal: bool = False, summarize: bool = False):
+    """Scores the topology under every threat profile; ``summarize`` adds one LLM summary of the differences."""
+    cache_key = request_cache_key(request, "sweep+ideal" if include_ideal else "sweep")
+    if summarize:
+        cached = result_cache.get(cache_key)
+        if cached is not None:
+            analysis_requests_total.inc(endpoint="sweep", source="cache")
+            return cached
+        await admit(client_key(http_request), "sweep")
+    result = await asyncio.to_thread(compare_sweep, request, include_ideal)
+    if not summarize:
+        analysis_requests_total.inc(endpoint="sweep", source="local")
+        return result
+
+    user_prompt = build_sweep_prompt(request, result)
+
+    async def attempt(model: str) -> Dict[str, Any]:
+        raw = await request_completion(user_prompt, model)
+        parsed, _ = extract_json_object(raw, prefer_keys=("summary",))
+        if parsed is None or not isinstance(parsed.get("summary"), str):
+            raise ValueError("no summary in the model reply")
+        recommendations = parsed.get("recommendations")
+        return {
+            "summary": parsed["summary"],
+            "recommendations": [str(item) for item in recommendations][:10] if isinstance(recommendations, list) else [],
+        }
+
+    try:
+        model, summary = await model_chain.call(attempt)
+    except ChainExhausted as e:
+        if not LLM_LOCAL_FALLBACK:
+            logger.exception("All models failed")
+            analysis_requests_total.inc(endpoint="sweep", source="error")
+            raise HTTPException(status_code=500, detail=f"LLM failed: {str(e)}")
+        logger.warning("All models failed, serving the sweep without a summary: %s", e)
+        analysis_requests_total.inc(endpoint="sweep", source="fallback")
+        return dict(result, llm_error=str(e))
+    result.update(summary, model=model)
+    result_cache.set(cache_key, result)
+    analysis_requests_total.inc(endpoint="sweep", source="llm")
+    return result
+
+
+@app.post("/api/remediation/optimize")
+async def remediation_optimize(request: RemediationRequest):
+    return await asyncio.to_thread(optimize_remediation, request)
+
+
+@app.post("/api/uncertainty")
+async def uncertainty(request: UncertaintyRequest):
+    try:
+        return await asyncio.to_thread(analyze_uncertainty, request)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+@app.post("/api/attack-paths")
+async def attack_paths(request: AnalysisRequest, k: int = Query(ATTACK_PATHS_K, ge=1, le=50)):
+    nodes = request.compact_nodes()
+    return build_local_attack_graph(
+        nodes,
+        extract_connections(nodes),
+        quantum_mode=is_quantum_threat(request.threat_model),
+        k=k,
     )
 
-    user_prompt = (
-        f"Текущая инфраструктура:\n{chr(10).join(nodes_desc) if nodes_desc else 'узлы отсутствуют'}\n\n"
-        f"Модель угроз: {threat_desc}. {extra_clause}\n"
-        f"{rubric}\n{quantum_clause}\n"
-        f"Локальная модель оценила стойкость в {metrics['value']} баллов. Проверь расчёт, при необходимости скорректируй и верни JSON строго по схеме.\n"
-        f"Подробные данные:\n`json\n{payload_json}\n`"
+
+@app.post("/api/topology")
+async def topology_analytics(request: AnalysisRequest, include_nodes: bool = True):
+    """Components, segments, choke points, bridges, centrality and blast radius of the topology."""
+
+    def analyze() -> Dict[str, Any]:
+        nodes = request.compact_nodes()
+        connection_pairs = extract_connections(nodes)
+        analysis = analyze_topology(nodes, connection_pairs)
+        result: Dict[str, Any] = {"summary": analysis.summary(), "bridges": analysis.bridge_ids()}
+        if include_nodes:
+            result["nodes"] = analysis.node_metrics()
+        return result
+
+    return await asyncio.to_thread(analyze)
+
+
+async def offload_scoring(
+    request: AnalysisRequest,
+    group_classes: bool,
+    with_result: bool = False,
+) -> Tuple[Tuple[Dict[str, Any], List[Dict[str, Any]], List[Tuple[str, str]]], Dict[str, Any] | None]:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        job_executor, score_in_worker, request.compact_nodes(), request.threat_model, group_classes, with_result
     )
 
+
+async def run_analysis(
+    request: AnalysisRequest,
+    mode: str,
+    group_classes: bool,
+    timer: StageTimer,
+    use_cache: bool = True,
+    endpoint: str = "analyze",
+    offload: bool = False,
+    client: str | None = None,
+) -> Tuple[Dict[str, Any], str]:
+    """Result and its source for one analysis.
+
+    A cache miss that is not answered by similarity reuse needs an upstream
+    call. Identical requests share the call already in progress (source
+    "coalesced"); otherwise the ``client`` has to pass admission first.
+    Without ``use_cache`` the call is neither cached nor shared.
+    """
+    if mode == "local":
+        if offload:
+            with timer.stage("evaluate_security"):
+                _, result = await offload_scoring(request, group_classes, with_result=True)
+            return result, "local"
+        with timer.stage("evaluate_security"):
+            local = score_request(request, group_classes)
+        with timer.stage("local_result"):
+            return build_local_result(request, local), "local"
+
+    with timer.stage("cache_lookup"):
+        cache_key = request_cache_key(request, "classes" if group_classes else "")
+        cached = result_cache.get(cache_key) if use_cache else None
+    if cached is not None:
+        return cached, "cache"
+
+    with timer.stage("evaluate_security"):
+        local = (await offload_scoring(request, group_classes))[0] if offload else score_request(request, group_classes)
+    features, reuse = None, None
+    if SIMILARITY_REUSE and use_cache:
+        with timer.stage("similarity_lookup"):
+            features = similarity_features(request, local[0])
+            reused, reuse = reuse_analysis(request, local, features)
+        if reused is not None:
+            if SIMILARITY_REFRESH == "defer":
+                schedule_refresh(request, cache_key, local, features)
+            return dict(reused, reuse=reuse), "reuse"
+    if not (use_cache and cache_key in analysis_flights):
+        await admit(client, endpoint)
     try:
-        response = client.chat.completions.create(
-            model="deepseek/deepseek-v3.2-exp",
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": user_prompt},
-            ],
-            temperature=0.1,
-            max_tokens=3000,
+        started = time.perf_counter()
+        if use_cache:
+            result, shared = await analysis_flights.run(
+                cache_key, lambda: complete_analysis(request, cache_key, local, timer, features)
+            )
+        else:
+            result, shared = await complete_analysis(request, cache_key, local, timer, features), False
+        if shared:
+            timer.record("coalesced_wait", time.perf_counter() - started)
+        return (result if reuse is None else dict(result, reuse=reuse)), "coalesced" if shared else "llm"
+    except ChainExhausted as e:
+        if not LLM_LOCAL_FALLBACK:
+            logger.exception("All models failed")
+            analysis_requests_total.inc(endpoint=endpoint, source="error")
+            raise HTTPException(status_code=500, detail=f"LLM failed: {str(e)}")
+        with timer.stage("local_result"):
+            return fallback_result(request, local, e), "fallback"
+    except Exception as e:
+        logger.exception("Analysis failed")
+        analysis_requests_total.inc(endpoint=endpoint, source="error")
+        raise HTTPException(status_code=500, detail=f"LLM failed: {str(e)}")
+
+
+@app.post("/api/analyze")
+async def analyze(
+    request: AnalysisRequest,
+    http_request: Request,
+    response: Response,
+    mode: Literal["llm", "local"] = "llm",
+    group_classes: bool = False,
+    profile: bool = False,
+):
+    if profile and not PROFILING_ENABLED:
+        raise HTTPException(status_code=403, detail="Profiling is disabled, set PROFILING_ENABLED=true")
+
+    timer = StageTimer(stage_seconds, endpoint="analyze")
+    received_at = http_request.scope.get("received_at")
+    if received_at is not None:
+        timer.record("request_parse", time.perf_counter() - received_at)
+
+    profiler = SamplingProfiler(PROFILING_INTERVAL) if profile else None
+    with profiler or nullcontext():
+        result, source = await run_analysis(
+            request, mode, group_classes, timer, use_cache=not profile, client=client_key(http_request)
+        )
+    analysis_requests_total.inc(endpoint="analyze", source=source)
+    record_history(request, result, source)
+    response.headers["Server-Timing"] = timer.server_timing()
+    if profiler is not None:
+        return dict(result, profile=dict(profiler.report(), timings=timer.timings))
+    return result
+
+
+async def job_runner() -> None:
+    while True:
+        job_wakeup.clear()
+        job = await asyncio.to_thread(job_store.claim)
+        if job is None:
+            try:
+                await asyncio.wait_for(job_wakeup.wait(), JOB_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        await execute_job(job)
+
+
+async def execute_job(job: Dict[str, Any]) -> None:
+    job_wait_seconds.observe(max(0.0, job["started_at"] - job["created_at"]))
+    payload = job["payload"]
+    started, outcome = time.perf_counter(), "failed"
+    try:
+        request = AnalysisRequest.model_validate(payload["request"])
+        result, source = await run_analysis(
+            request,
+            payload["mode"],
+            payload["group_classes"],
+            StageTimer(stage_seconds, endpoint="jobs"),
+            endpoint="jobs",
+            offload=True,
         )
+        # A local result served because every model failed is not handed to later identical jobs.
+        await asyncio.to_thread(job_store.finish, job["id"], result, source != "fallback")
+        analysis_requests_total.inc(endpoint="jobs", source=source)
+        record_history(request, result, source)
+        outcome = "done"
+    except asyncio.CancelledError:
+        job_store.release(job["id"])
+        outcome = "released"
+        raise
+    except HTTPException as e:
+        await asyncio.to_thread(job_store.fail, job["id"], str(e.detail))
+    except Exception as e:
+        logger.exception("Job %s failed", job["id"])
+        await asyncio.to_thread(job_store.fail, job["id"], str(e))
+    finally:
+        job_run_seconds.observe(time.perf_counter() - started, outcome=outcome)
 
-        raw = response.choices[0].message.content.strip()
-        print("\n=== RAW LLM RESPONSE ===\n", raw, "\n======================\n")
 
-        json_match = re.search(r"\{.*\}", raw, re.DOTALL)
-        if not json_match:
-            raise ValueError("JSON не найден в ответе модели")
+async def enqueue_job(request: AnalysisRequest, response: Response, mode: str, group_classes: bool) -> Dict[str, Any]:
+    key = request_cache_key(request, f"job:{mode}:{'classes' if group_classes else ''}:{request.site or ''}")
+    payload = {"request": request.payload(), "mode": mode, "group_classes": group_classes}
+    job, created = await asyncio.to_thread(job_store.submit, key, payload)
+    jobs_submitted_total.inc(result="queued" if created else "deduplicated")
+    if created:
+        job_wakeup.set()
+    response.headers["Location"] = f"/api/jobs/{job['id']}"
+    return {"id": job["id"], "status": job["status"], "deduplicated": not created}
 
-        data = json.loads(json_match.group(0))
 
-        llm_score = int(data.get("score", metrics["value"]))
-        summary = str(data.get("summary", "Описание отсутствует"))
-        llm_recommendations = data.get("recommendations", [])
-        if not isinstance(llm_recommendations, list):
-            llm_recommendations = [str(llm_recommendations)]
-        attack_graph = data.get("attack_graph", {"nodes": [], "edges": []})
+@app.post("/api/jobs", status_code=202)
+async def submit_job(
+    request: AnalysisRequest,
+    response: Response,
+    mode: Literal["llm", "local"] = "llm",
+    group_classes: bool = False,
+):
+    return await enqueue_job(request, response, mode, group_classes)
 
-        base_recs = build_fstek_recommendations(metrics.get("finding_codes", [])) if fstec_mode else build_general_recommendations(metrics.get("finding_codes", []))
 
-        if fstec_mode:
-            recommendations = base_recs
-        else:
-            merged: List[str] = []
-            for rec in base_recs + llm_recommendations:
-                if rec and rec not in merged:
-                    merged.append(rec)
-            recommendations = merged[:10]
-
-        result = {
-            "score": llm_score,
-            "summary": summary,
-            "recommendations": recommendations,
-            "attack_graph": attack_graph,
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await asyncio.to_thread(job_store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+STREAMED_FIELDS = ("score", "summary", "recommendations", "attack_graph")
+
+
+def sse_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/api/analyze/stream")
+async def analyze_stream(request: AnalysisRequest, http_request: Request):
+    cache_key = request_cache_key(request)
+    cached = result_cache.get(cache_key)
+    if cached is None:
+        # Streams are not coalesced: every stream needs its own upstream call.
+        await admit(client_key(http_request), "stream")
+    fstec_mode = request.threat_model.is_fstec_compliant
+
+    async def emit():
+        if cached is not None:
+            analysis_requests_total.inc(endpoint="stream", source="cache")
+            record_history(request, cached, "cache")
+            yield sse_event("result", cached)
+            return
+
+        metrics, ideal_nodes, connection_pairs = score_request(request)
+        yield sse_event("local", {
             "local_score": metrics,
             "ideal_nodes": ideal_nodes,
+            "recommendations": build_base_recommendations(metrics, fstec_mode),
             "threat_model": request.threat_model.model_dump(),
+        })
+
+        # Streams are not hedged: partial fields reach the client as they arrive, so another
+        # model is only tried while the failed one has not produced any output yet.
+        errors: List[Tuple[str, BaseException]] = []
+        skipped: List[str] = []
+        try:
+            user_prompt = build_user_prompt(request, metrics, ideal_nodes, connection_pairs)
+            for model in model_chain.models:
+                breaker = model_chain.breakers[model]
+                if not breaker.allow():
+                    skipped.append(model)
+                    continue
+                parser = IncrementalObjectParser()
+                chunks: List[str] = []
+                try:
+                    async for chunk in stream_completion(user_prompt, model):
+                        chunks.append(chunk)
+                        for key, value in parser.feed(chunk):
+                            if key in STREAMED_FIELDS:
+                                yield sse_event(key, value)
+                    raw = "".join(chunks).strip()
+                    logger.debug("Raw LLM response from %s:\n%s", model, raw)
+                    result = merge_llm_result(request, metrics, ideal_nodes, raw)
+                except Exception as e:
+                    breaker.record_failure()
+                    if chunks:
+                        raise
+                    errors.append((model, e))
+                    continue
+                except BaseException:
+                    breaker.release()
+                    raise
+                breaker.record_success()
+                model_chain.wins[model] += 1
+                result["model"] = model
+                result_cache.set(cache_key, result)
+                analysis_requests_total.inc(endpoint="stream", source="llm")
+                record_history(request, result, "llm")
+                yield sse_event("result", result)
+                return
+
+            model_chain.exhausted += 1
+            exhausted = ChainExhausted(errors, skipped)
+            if not LLM_LOCAL_FALLBACK:
+                raise exhausted
+            analysis_requests_total.inc(endpoint="stream", source="fallback")
+            result = fallback_result(request, (metrics, ideal_nodes, connection_pairs), exhausted)
+            record_history(request, result, "fallback")
+            yield sse_event("result", result)
+        except Exception as e:
+            logger.exception("Streamed analysis failed")
+            analysis_requests_total.inc(endpoint="stream", source="error")
+            yield sse_event("error", {"detail": f"LLM failed: {str(e)}"})
+
+    return StreamingResponse(
+        emit(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+class TopologyEdit(BaseModel):
+    op: Literal["add_node", "remove_node", "update_node", "add_connection", "remove_connection"]
+    node: NetworkNode | None = None
+    node_id: str | None = None
+    source: str | None = None
+    target: str | None = None
+
+
+class TopologyPatch(BaseModel):
+    edits: List[TopologyEdit]
+
+
+def get_session(session_id: str) -> TopologySession:
+    session = session_store.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return session
+
+
+@app.post("/api/sessions")
+async def create_session(request: AnalysisRequest, topology_rules: bool = False):
+    """Opens an editable session; ``topology_rules`` adds the graph rules at the cost of a full traversal per edit."""
+    session = TopologySession(request.threat_model, topology_rules)
+    for node in request.compact_nodes():
+        try:
+            session.add_node(node)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    session_id = session_store.add(session)
+    return {
+        "session_id": session_id,
+        "local_score": session.metrics(with_details=True),
+        "node_count": len(session.nodes),
+        "edge_count": len(session.edges),
+        "topology_rules": session.topology_rules,
+    }
+
+
+@app.get("/api/sessions/{session_id}")
+async def read_session(session_id: str):
+    session = get_session(session_id)
+    return {
+        "session_id": session_id,
+        "local_score": session.metrics(with_details=True),
+        "node_count": len(session.nodes),
+        "edge_count": len(session.edges),
+        "topology_rules": session.topology_rules,
+        "threat_model": session.threat_model.model_dump(),
+    }
+
+
+@app.patch("/api/sessions/{session_id}")
+async def patch_session(session_id: str, patch: TopologyPatch):
+    """Applies edits in order; on a failing edit the earlier ones stay applied."""
+    session = get_session(session_id)
+    before = session.metrics()
+    for index, edit in enumerate(patch.edits):
+        try:
+            if edit.op == "add_node" and edit.node:
+                session.add_node(edit.node)
+            elif edit.op == "update_node" and edit.node:
+                session.update_node(edit.node)
+            elif edit.op == "remove_node" and edit.node_id:
+                session.remove_node(edit.node_id)
+            elif edit.op in ("add_connection", "remove_connection") and edit.source and edit.target:
+                if edit.op == "add_connection":
+                    session.add_connection(edit.source, edit.target)
+                else:
+                    session.remove_connection(edit.source, edit.target)
+            else:
+                raise ValueError(f"Missing fields for {edit.op}")
+        except KeyError as e:
+            raise HTTPException(status_code=404, detail=f"Edit {index}: unknown node {e.args[0]}")
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Edit {index}: {e}")
+
+    after = session.metrics()
+    return {
+        "value": after["value"],
+        "previous_value": before["value"],
+        "delta": after["value"] - before["value"],
+        "findings_added": sorted(set(after["finding_codes"]) - set(before["finding_codes"])),
+        "findings_removed": sorted(set(before["finding_codes"]) - set(after["finding_codes"])),
+        "finding_codes": after["finding_codes"],
+        "node_count": len(session.nodes),
+        "edge_count": len(session.edges),
+    }
+
+
+@app.delete("/api/sessions/{session_id}")
+async def delete_session(session_id: str):
+    if not session_store.remove(session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {"status": "deleted"}
+
+
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "500"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+
+
+class BatchAnalysisRequest(BaseModel):
+    items: List[Dict[str, Any]]
+    max_concurrency: int | None = Field(default=None, ge=1)
+    stream: bool = False
+
+
+@app.post("/api/analyze/batch")
+async def analyze_batch(batch: BatchAnalysisRequest, http_request: Request):
+    if len(batch.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Batch is limited to {BATCH_MAX_ITEMS} items")
+
+    results: List[Dict[str, Any] | None] = [None] * len(batch.items)
+    pending: List[Tuple[int, AnalysisRequest, str, Any, np.ndarray | None]] = []
+    for index, item in enumerate(batch.items):
+        try:
+            request = AnalysisRequest.model_validate(item)
+            cache_key = request_cache_key(request)
+            cached = result_cache.get(cache_key)
+            if cached is not None:
+                analysis_requests_total.inc(endpoint="batch", source="cache")
+                record_history(request, cached, "cache")
+                results[index] = {"index": index, "status": "ok", "cached": True, "result": cached}
+                continue
+            local = score_request(request)
+            features = None
+            if SIMILARITY_REUSE:
+                features = similarity_features(request, local[0])
+                reused, reuse = reuse_analysis(request, local, features)
+                if reused is not None:
+                    result = dict(reused, reuse=reuse)
+                    analysis_requests_total.inc(endpoint="batch", source="reuse")
+                    record_history(request, result, "reuse")
+                    results[index] = {"index": index, "status": "ok", "cached": False, "result": result}
+                    continue
+            pending.append((index, request, cache_key, local, features))
+        except Exception as e:
+            results[index] = {"index": index, "status": "error", "error": str(e)}
+
+    # The batch is admitted once, for the upstream calls it starts; a large batch costs a full bucket.
+    starting = {cache_key for _, _, cache_key, _, _ in pending if cache_key not in analysis_flights}
+    if starting:
+        await admit(client_key(http_request), "batch", len(starting))
+
+    limit = min(batch.max_concurrency or BATCH_MAX_CONCURRENCY, BATCH_MAX_CONCURRENCY)
+    slots = asyncio.Semaphore(limit)
+
+    async def run_item(
+        index: int, request: AnalysisRequest, cache_key: str, local: Any, features: np.ndarray | None
+    ) -> Dict[str, Any]:
+        async with slots:
+            try:
+                result, shared = await analysis_flights.run(
+                    cache_key,
+                    lambda: complete_analysis(request, cache_key, local, StageTimer(stage_seconds, endpoint="batch"), features),
+                )
+                source = "coalesced" if shared else "llm"
+                analysis_requests_total.inc(endpoint="batch", source=source)
+                record_history(request, result, source)
+                return {"index": index, "status": "ok", "cached": False, "result": result}
+            except ChainExhausted as e:
+                if not LLM_LOCAL_FALLBACK:
+                    logger.exception("All models failed for batch item %d", index)
+                    analysis_requests_total.inc(endpoint="batch", source="error")
+                    return {"index": index, "status": "error", "error": f"LLM failed: {str(e)}"}
+                analysis_requests_total.inc(endpoint="batch", source="fallback")
+                result = fallback_result(request, local, e)
+                record_history(request, result, "fallback")
+                return {"index": index, "status": "ok", "cached": False, "result": result}
+            except Exception as e:
+                logger.exception("Batch item %d failed", index)
+                analysis_requests_total.inc(endpoint="batch", source="error")
+                return {"index": index, "status": "error", "error": f"LLM failed: {str(e)}"}
+
+    tasks = [asyncio.create_task(run_item(*entry)) for entry in pending]
+
+    if batch.stream:
+        async def emit():
+            try:
+                for item in results:
+                    if item is not None:
+                        yield json.dumps(item, ensure_ascii=False) + "\n"
+                for finished in asyncio.as_completed(tasks):
+                    yield json.dumps(await finished, ensure_ascii=False) + "\n"
+            finally:
+                for task in tasks:
+                    task.cancel()
+
+        return StreamingResponse(emit(), media_type="application/x-ndjson")
+
+    for item in await asyncio.gather(*tasks):
+        results[item["index"]] = item
+    failed = sum(1 for item in results if item["status"] == "error")
+    return {"total": len(results), "succeeded": len(results) - failed, "failed": failed, "items": results}
+
+
+IMPORT_MAX_NODES = int(os.getenv("IMPORT_MAX_NODES", "200000"))
+IMPORT_MAX_LINE_BYTES = int(os.getenv("IMPORT_MAX_LINE_BYTES", "1048576"))
+
+
+@app.post("/api/import")
+async def import_topology(
+    http_request: Request,
+    response: Response,
+    format: Literal["ndjson", "csv", "nmap"] | None = None,
+    target: Literal["topology", "score", "analyze", "job"] = "score",
+    mode: Literal["llm", "local"] = "local",
+    threat_model: str | None = Query(None, description="ThreatModel as JSON, overrides a threat_model record in the file"),
+    site: str | None = Query(None, min_length=1, max_length=200),
+    strict: bool = False,
+    group_classes: bool = False,
+):
+    """Imports an NDJSON, CSV or nmap XML inventory, parsed while the body streams in."""
+    fmt = format or detect_format(http_request.headers.get("content-type"))
+    if fmt is None:
+        raise HTTPException(
+            status_code=415, detail=f"Set ?format= to one of {', '.join(FORMATS)} or send a matching Content-Type"
+        )
+
+    timer = StageTimer(stage_seconds, endpoint="import")
+    importer = TopologyImporter(NetworkNode.model_validate, IMPORT_MAX_NODES)
+    with timer.stage("import_parse"):
+        try:
+            async for location, record in format_records(fmt, http_request.stream(), IMPORT_MAX_LINE_BYTES):
+                importer.add(location, record)
+        except ImportLimitExceeded as e:
+            import_records_total.inc(format=fmt, outcome="too_large")
+            raise HTTPException(status_code=413, detail=f"Import is too large: {e}")
+        except ValueError as e:
+            import_records_total.inc(format=fmt, outcome="invalid")
+            raise HTTPException(status_code=400, detail=str(e))
+        nodes = importer.finish()
+    stats = dict(importer.stats(), format=fmt)
+    import_records_total.inc(len(nodes), format=fmt, outcome="accepted")
+    import_records_total.inc(importer.rejected, format=fmt, outcome="rejected")
+    if strict and importer.rejected:
+        raise HTTPException(status_code=422, detail={"message": "Import has invalid records", "import": stats})
+    if not nodes:
+        raise HTTPException(status_code=422, detail={"message": "Import contains no valid nodes", "import": stats})
+
+    threat: ThreatModel | None = None
+    if threat_model or importer.threat_model is not None:
+        try:
+            threat = ThreatModel.model_validate(json.loads(threat_model) if threat_model else importer.threat_model)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=f"Invalid threat_model: {e}")
+    if target == "topology":
+        return {
+            "import": stats,
+            "nodes": [node.model_dump(exclude_none=True) for node in nodes],
+            "threat_model": threat.model_dump() if threat is not None else None,
         }
+    if threat is None:
+        raise HTTPException(
+            status_code=400, detail="threat_model is required: pass it as a query parameter or a threat_model record"
+        )
 
-        if "ideal_graph" in data:
-            result["ideal_graph"] = data["ideal_graph"]
+    request = AnalysisRequest(nodes=nodes, threat_model=threat, site=site)
+    if target == "job":
+        response.status_code = 202
+        return dict(await enqueue_job(request, response, mode, group_classes), **{"import": stats})
+    if target == "score":
+        with timer.stage("evaluate_security"):
+            metrics, _, _ = await asyncio.to_thread(score_request, request, group_classes)
+        response.headers["Server-Timing"] = timer.server_timing()
+        return {"score": metrics["value"], "local_score": metrics, "import": stats}
+
+    result, source = await run_analysis(request, mode, group_classes, timer, endpoint="import", offload=True)
+    analysis_requests_total.inc(endpoint="import", source=source)
+    record_history(request, result, source)
+    response.headers["Server-Timing"] = timer.server_timing()
+    return dict(result, **{"import": stats})
+
+
+@app.get("/api/cache/stats")
+def cache_stats():
+    return dict(
+        result_cache.stats(),
+        similarity=similarity_index.stats(),
+        in_flight=len(analysis_flights),
+        admission=admission.stats(),
+    )
 
-        return result
 
-    except Exception as e:
-        print("ERROR:", str(e))
-        raise HTTPException(status_code=500, detail=f"LLM failed: {str(e)}")
+HISTORY_BUCKETS = {"hour": 3600.0, "day": 86400.0, "week": 7 * 86400.0}
+
+
+@app.get("/api/history")
+async def history_list(
+    site: str = "default",
+    limit: int = Query(50, ge=1, le=1000),
+    before: float | None = None,
+    since: float | None = None,
+):
+    items = await asyncio.to_thread(analysis_history.list, site, limit, before, since)
+    return {
+        "site": site,
+        "items": items,
+        "next_before": items[-1]["created_at"] if len(items) == limit else None,
+    }
+
+
+@app.get("/api/history/sites")
+async def history_sites(limit: int = Query(100, ge=1, le=10000)):
+    sites, stats = await asyncio.gather(
+        asyncio.to_thread(analysis_history.sites, limit), asyncio.to_thread(analysis_history.stats)
+    )
+    return {"sites": sites, "storage": stats}
+
+
+@app.get("/api/history/diff")
+async def history_diff(base: int, target: int):
+    diff = await asyncio.to_thread(analysis_history.diff, base, target)
+    if diff is None:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    return diff
+
+
+@app.get("/api/history/trends")
+async def history_trends(
+    site: str | None = None,
+    since: float | None = None,
+    until: float | None = None,
+    bucket: Literal["hour", "day", "week"] = "day",
+    top: int = Query(10, ge=1, le=100),
+):
+    return await asyncio.to_thread(analysis_history.trends, site, since, until, HISTORY_BUCKETS[bucket], top)
+
+
+@app.get("/api/history/{analysis_id}")
+async def history_item(analysis_id: int, include_result: bool = True):
+    analysis = await asyncio.to_thread(analysis_history.get, analysis_id, include_result)
+    if analysis is None:
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    return analysis
+
+
+@app.get("/api/llm/models")
+async def llm_models():
+    return {
+        "models": model_chain.models,
+        "breakers": model_chain.breaker_states(),
+        "hedge_delay": model_chain.hedge_delay(),
+        "hedges": dict(model_chain.hedges),
+        "wins": dict(model_chain.wins),
+        "exhausted": model_chain.exhausted,
+    }
+
+
+@app.get("/api/rules")
+def rules_info():
+    rules = current_rules()
+    return {
+        "version": scoring_rules.version,
+        "path": scoring_rules.path,
+        "loaded_at": scoring_rules.loaded_at,
+        "facts": list(rules.fact_names),
+        "node_rules": [rule.name for rule in rules.node_rules],
+        "global_rules": [rule.name for rule in rules.global_rules],
+        "topology_rules": [rule.name for rule in rules.topology_rules],
+        "topology_rules_enabled": TOPOLOGY_RULES,
+    }
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return Response(metrics_registry.render(), media_type=metrics_registry.content_type)
 
 
 @app.get("/")
@@ -0,0 +1,260 @@
+import heapq
+import os
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+from pydantic import BaseModel, Field
+
+from rules import RuleSet
+from scoring import (
+    AnalysisRequest,
+    build_node_columns,
+    clamp,
+    columnar_adjustments,
+    current_rules,
+    evaluate_security_columnar,
+    is_quantum_threat,
+)
+
+# Per-node remediation items; "firewall_policy" documents a node's firewall type, the appliance is the global "firewall".
+REMEDIATION_NODE_CONTROLS = ("antivirus", "disk_encryption", "vpn", "mfa", "wifi_upgrade", "firewall_policy")
+# Global remediation items and the presence fact whose global rule each one satisfies.
+REMEDIATION_GLOBAL_CONTROLS = {
+    "firewall": "firewall",
+    "siem": "siem",
+    "backup_appliance": "backup_platform",
+    "pqc_gateway": "pq",
+}
+OPTIMIZER_EXACT_MAX_ITEMS = int(os.getenv("OPTIMIZER_EXACT_MAX_ITEMS", "40"))
+OPTIMIZER_MAX_CANDIDATES = int(os.getenv("OPTIMIZER_MAX_CANDIDATES", "200000"))
+
+
+class RemediationCosts(BaseModel):
+    antivirus: float = Field(default=150.0, ge=0)
+    disk_encryption: float = Field(default=100.0, ge=0)
+    vpn: float = Field(default=80.0, ge=0)
+    mfa: float = Field(default=60.0, ge=0)
+    wifi_upgrade: float = Field(default=400.0, ge=0)
+    firewall_policy: float = Field(default=200.0, ge=0)
+    firewall: float = Field(default=5000.0, ge=0)
+    siem: float = Field(default=20000.0, ge=0)
+    backup_appliance: float = Field(default=8000.0, ge=0)
+    pqc_gateway: float = Field(default=15000.0, ge=0)
+
+
+class RemediationRequest(AnalysisRequest):
+    costs: RemediationCosts = Field(default_factory=RemediationCosts)
+    budget: float | None = Field(default=None, ge=0)
+
+
+def remediation_table(columns: Dict[str, np.ndarray], rules: RuleSet) -> np.ndarray:
+    """Per-node adjustment for every subset of ``REMEDIATION_NODE_CONTROLS``.
+
+    Row ``i``, column ``mask`` holds the adjustment node ``i`` would get with
+    the controls whose bits are set in ``mask`` fixed, so re-scoring a
+    candidate plan is a table lookup per changed node.
+    """
+    table = np.empty(
+        (len(columns["weight"]), 1 << len(REMEDIATION_NODE_CONTROLS)),
+        dtype=np.int32 if rules.integral else np.float64,
+    )
+    for mask in range(table.shape[1]):
+        fixed = dict(columns)
+        av, disk, vpn, mfa, wifi, policy = ((mask >> bit) & 1 == 1 for bit in range(len(REMEDIATION_NODE_CONTROLS)))
+        fixed["antivirus"] = columns["antivirus"] | av
+        fixed["disk"] = columns["disk"] | disk
+        fixed["vpn"] = columns["vpn"] | vpn
+        fixed["mfa"] = columns["mfa"] | mfa
+        fixed["wifi_ok"] = columns["wifi_ok"] | wifi
+        fixed["firewall_typed"] = columns["firewall_typed"] | policy
+        fixed["pd_protected"] = columns["pd_protected"] | disk | wifi
+        table[:, mask] = columnar_adjustments(fixed, rules)
+    return table
+
+
+class RemediationSearch:
+    """Budgeted selection of remediation items over a remediation table.
+
+    Items are single controls on single nodes plus the global appliances.
+    Gains only interact within one node (both disk encryption and a Wi-Fi
+    upgrade can protect personal data), so standalone gains are an upper bound
+    on combined gains and the fractional-knapsack bound is admissible.
+    """
+
+    def __init__(self, table: np.ndarray, global_items: List[Tuple[str, float, int]], node_costs: List[float]):
+        self.table = table
+        self.candidates = 0
+        self.items: List[Tuple[str, int, int, float, int]] = []
+        gains = table[:, [1 << bit for bit in range(len(REMEDIATION_NODE_CONTROLS))]] - table[:, :1]
+        for node_index, bit in zip(*np.nonzero(gains > 0)):
+            self.items.append((
+                REMEDIATION_NODE_CONTROLS[bit],
+                int(node_index),
+                1 << int(bit),
+                node_costs[bit],
+                int(gains[node_index, bit]),
+            ))
+        for name, cost, gain in global_items:
+            self.items.append((name, -1, 0, cost, gain))
+
+    def marginal(self, masks: Dict[int, int], item: Tuple[str, int, int, float, int]) -> int:
+        self.candidates += 1
+        _, node_index, bit, _, gain = item
+        if node_index < 0:
+            return gain
+        mask = masks.get(node_index, 0)
+        return int(self.table[node_index, mask | bit] - self.table[node_index, mask])
+
+    def greedy(self, budget: float) -> Tuple[List[int], List[int]]:
+        heap = [(-ratio(gain, cost), -gain, index) for index, (_, _, _, cost, gain) in enumerate(self.items)]
+        heapq.heapify(heap)
+        masks: Dict[int, int] = {}
+        chosen: List[int] = []
+        gains: List[int] = []
+        remaining = budget
+        while heap and self.candidates < OPTIMIZER_MAX_CANDIDATES:
+            _, stale_gain, index = heapq.heappop(heap)
+            item = self.items[index]
+            if item[3] > remaining:
+                continue
+            gain = self.marginal(masks, item)
+            if gain <= 0:
+                continue
+            if gain != -stale_gain:
+                heapq.heappush(heap, (-ratio(gain, item[3]), -gain, index))
+                continue
+            chosen.append(index)
+            gains.append(gain)
+            remaining -= item[3]
+            if item[1] >= 0:
+                masks[item[1]] = masks.get(item[1], 0) | item[2]
+        return chosen, gains
+
+    def exact(self, budget: float) -> List[int]:
+        order = sorted(range(len(self.items)), key=lambda index: -ratio(self.items[index][4], self.items[index][3]))
+        greedy_chosen, greedy_gains = self.greedy(budget)
+        best = {"gain": sum(greedy_gains), "chosen": list(greedy_chosen)}
+
+        def bound(position: int, remaining: float) -> float:
+            total = 0.0
+            for index in order[position:]:
+                _, _, _, cost, gain = self.items[index]
+                if cost <= remaining:
+                    total += gain
+                    remaining -= cost
+                else:
+                    return total + gain * remaining / cost
+            return total
+
+        def search(position: int, remaining: float, gain: int, masks: Dict[int, int], chosen: List[int]) -> None:
+            if gain > best["gain"]:
+                best["gain"] = gain
+                best["chosen"] = list(chosen)
+            if position == len(order) or self.candidates >= OPTIMIZER_MAX_CANDIDATES:
+                return
+            if gain + bound(position, remaining) <= best["gain"]:
+                return
+            index = order[position]
+            item = self.items[index]
+            if item[3] <= remaining:
+                step = self.marginal(masks, item)
+                if step > 0:
+                    next_masks = masks
+                    if item[1] >= 0:
+                        next_masks = dict(masks)
+                        next_masks[item[1]] = masks.get(item[1], 0) | item[2]
+                    chosen.append(index)
+                    search(position + 1, remaining - item[3], gain + step, next_masks, chosen)
+                    chosen.pop()
+            search(position + 1, remaining, gain, masks, chosen)
+
+        search(0, budget, 0, {}, [])
+        return best["chosen"]
+
+
+def ratio(gain: float, cost: float) -> float:
+    return gain / cost if cost > 0 else gain * 1e12
+
+
+def optimize_remediation(request: RemediationRequest) -> Dict[str, Any]:
+    threat = request.threat_model
+    quantum_mode = is_quantum_threat(threat)
+    budget = request.budget if request.budget is not None else float(threat.budget_usd)
+    nodes = request.compact_nodes()
+    if not nodes:
+        return {"budget": budget, "spent": 0.0, "score_before": 0, "score_after": 0, "method": "none", "plan": []}
+
+    rules = current_rules(quantum_mode=quantum_mode)
+    metrics, _, unique_edges = evaluate_security_columnar(
+        nodes,
+        pd_sensitive=threat.has_large_pd_storage,
+        quantum_mode=quantum_mode,
+        with_details=False,
+        with_ideal=False,
+        rules=rules,
+    )
+    columns = build_node_columns(nodes, rules)
+    table = remediation_table(columns, rules)
+    costs = request.costs.model_dump()
+
+    global_gains = {rule.unless_any: -rule.points for rule in rules.active_global_rules(set())}
+    global_items: List[Tuple[str, float, int]] = []
+    for name, fact in REMEDIATION_GLOBAL_CONTROLS.items():
+        if fact in global_gains and not columns[fact].any():
+            global_items.append((name, costs[name], global_gains[fact]))
+
+    total_nodes = len(nodes)
+    max_edges = total_nodes * (total_nodes - 1) // 2
+    connection_ratio = 1.0 if max_edges == 0 else min(1.0, len(unique_edges) / max_edges)
+    weight_ratio = min(1.0, sum(columns["weight"].tolist()) / max(total_nodes * 10.0, 1.0))
+    adjustments = (
+        float(table[:, 0].sum())
+        - sum(gain for _, _, gain in global_items)
+        + metrics["topology_bonus"]
+        + metrics["topology"]["adjustment"]
+    )
+    unclamped = weight_ratio * 45.0 + connection_ratio * 25.0 + adjustments
+
+    search = RemediationSearch(table, global_items, [costs[name] for name in REMEDIATION_NODE_CONTROLS])
+    if len(search.items) <= OPTIMIZER_EXACT_MAX_ITEMS:
+        method = "branch_and_bound"
+        chosen = search.exact(budget)
+    else:
+        method = "greedy"
+        chosen, _ = search.greedy(budget)
+    chosen.sort(key=lambda index: -ratio(search.items[index][4], search.items[index][3]))
+
+    masks: Dict[int, int] = {}
+    plan: List[Dict[str, Any]] = []
+    spent = 0.0
+    current = unclamped
+    for index in chosen:
+        item = search.items[index]
+        name, node_index, bit, cost, _ = item
+        gain = search.marginal(masks, item)
+        if node_index >= 0:
+            masks[node_index] = masks.get(node_index, 0) | bit
+        spent += cost
+        current += gain
+        node = nodes[node_index] if node_index >= 0 else None
+        plan.append({
+            "control": name,
+            "node_id": node.id if node else None,
+            "node_name": node.name if node else None,
+            "cost": cost,
+            "gain": gain,
+            "cumulative_cost": spent,
+            "score_after": round(clamp(current)),
+        })
+
+    return {
+        "budget": budget,
+        "spent": spent,
+        "score_before": metrics["value"],
+        "score_after": round(clamp(current)),
+        "raw_gain": round(current - unclamped, 2),
+        "method": method,
+        "items_considered": len(search.items),
+        "candidates_evaluated": search.candidates,
+        "plan": plan,
+    }
@@ -0,0 +1,527 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Sequence, Set, Tuple
+
+import numpy as np
+
+from topology import SUMMARY_METRICS
+
+PROFILE_TAGS = ("quantum", "fstec")
+
+
+class KeywordMatcher:
+    """Aho–Corasick automaton over several keyword sets.
+
+    ``match(text)`` scans the lowercased text once and returns a bitmask with
+    bit ``i`` set when it contains any keyword of set ``i``. Results are
+    memoized per distinct string, since node attributes repeat heavily.
+    """
+
+    def __init__(self, keyword_sets: Sequence[Iterable[str]], memo_size: int = 65536):
+        goto: List[Dict[str, int]] = [{}]
+        output = [0]
+        for bit, words in enumerate(keyword_sets):
+            for word in words:
+                state = 0
+                for char in word.lower():
+                    following = goto[state].get(char)
+                    if following is None:
+                        goto.append({})
+                        output.append(0)
+                        following = goto[state][char] = len(goto) - 1
+                    state = following
+                output[state] |= 1 << bit
+
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, following in goto[state].items():
+                queue.append(following)
+                fallback = fail[state]
+                while fallback and char not in goto[fallback]:
+                    fallback = fail[fallback]
+                fail[following] = goto[fallback].get(char, 0)
+                output[following] |= output[fail[following]]
+
+        self._goto = goto
+        self._fail = fail
+        self._output = output
+        self._all = (1 << len(keyword_sets)) - 1
+        self._memo: Dict[str, int] = {}
+        self._memo_size = memo_size
+
+    def match_all(self, value: str | Iterable[str]) -> int:
+        if isinstance(value, str):
+            return self.match(value)
+        mask = 0
+        for item in value:
+            mask |= self.match(item)
+        return mask
+
+    def match(self, text: str) -> int:
+        mask = self._memo.get(text)
+        if mask is not None:
+            return mask
+        goto, fail, output = self._goto, self._fail, self._output
+        mask = output[0]
+        state = 0
+        for char in text.lower():
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            mask |= output[state]
+            if mask == self._all:
+                break
+        if len(self._memo) >= self._memo_size:
+            self._memo.clear()
+        self._memo[text] = mask
+        return mask
+
+
+class Case(NamedTuple):
+    points: float
+    label: str
+    text: str
+    finding: Tuple[str, str] | None
+    ideal: Tuple[Tuple[str, Any], ...]
+
+
+class NodeRule(NamedTuple):
+    name: str
+    when: int | None
+    check: int
+    cases: Dict[Any, Case]
+
+
+class GlobalRule(NamedTuple):
+    name: str
+    unless_any: str
+    requires: Tuple[str, ...]
+    points: float
+    detail: str | None
+    finding: Tuple[str, str] | None
+    support_node: Dict[str, Any] | None
+
+
+class TopologyRule(NamedTuple):
+    name: str
+    metric: str
+    above: float | None
+    below: float | None
+    min_nodes: int
+    points: float
+    detail: str | None
+    finding: Tuple[str, str] | None
+    # Further (metric, above, below) thresholds that must all be crossed as well.
+    when: Tuple[Tuple[str, float | None, float | None], ...] = ()
+
+
+class Outcome(NamedTuple):
+    adjustment: float
+    details: Tuple[Tuple[str, str], ...]
+    findings: Tuple[Tuple[str, str], ...]
+    ideal: Tuple[Tuple[str, Any], ...]
+
+
+def apply_variants(spec: Any, tags: Set[str]) -> Any:
+    if not isinstance(spec, dict) or "variants" not in spec:
+        return spec
+    merged = {key: value for key, value in spec.items() if key != "variants"}
+    for tag in PROFILE_TAGS:
+        if tag in tags and tag in spec["variants"]:
+            merged.update(spec["variants"][tag])
+    return merged
+
+
+def resolve_template(value: Any, context: Dict[str, Any]) -> Any:
+    """Replaces ``"$name"`` strings with ``context[name]``, recursively."""
+    if isinstance(value, str) and value.startswith("$"):
+        if value[1:] not in context:
+            raise ValueError(f"Unknown reference {value}")
+        return context[value[1:]]
+    if isinstance(value, list):
+        return [resolve_template(item, context) for item in value]
+    if isinstance(value, dict):
+        return {key: resolve_template(item, context) for key, item in value.items()}
+    return value
+
+
+def crossed(value: float, above: float | None, below: float | None) -> bool:
+    """Whether ``value`` is past one of the thresholds of a topology rule."""
+    return (above is not None and value > above) or (below is not None and value < below)
+
+
+def fresh(value: Any) -> Any:
+    if isinstance(value, list):
+        return [fresh(item) for item in value]
+    if isinstance(value, dict):
+        return {key: fresh(item) for key, item in value.items()}
+    return value
+
+
+class RuleSet:
+    """Scoring rules compiled for one profile (a set of ``PROFILE_TAGS``).
+
+    ``facts(node)`` evaluates the fact definitions into a tuple (booleans, or
+    choice indexes for ``choices`` facts). The definitions are translated into
+    the source of a single function, so extracting facts costs about as much
+    as hand-written attribute checks. Node rules only depend on that tuple, so
+    ``outcome(facts)`` is computed once per distinct fact vector and memoized.
+    """
+
+    def __init__(self, config: Dict[str, Any], tags: Set[str], matcher: KeywordMatcher, keyword_bits: Dict[str, int]):
+        self.tags = frozenset(tags)
+        profile = "_".join(tag for tag in PROFILE_TAGS if tag in tags) or "default"
+        if profile not in config["profiles"]:
+            raise ValueError(f"Profile {profile} is not defined")
+        self.controls: Dict[str, str] = dict(config["profiles"][profile])
+        self._matcher = matcher
+        self._keyword_bits = keyword_bits
+
+        self.fact_names: Tuple[str, ...] = ()
+        self.choices: Dict[str, Tuple[str, ...]] = {}
+        self._fact_index: Dict[str, int] = {}
+        self._namespace: Dict[str, Any] = {}
+        self._paths: Dict[str, str] = {}
+        self._path_lines: List[str] = []
+        self._keyword_locals: Set[str] = set()
+        expressions = []
+        for name, spec in config["facts"].items():
+            spec = apply_variants(spec, self.tags)
+            if isinstance(spec, dict) and "choices" in spec:
+                self.choices[name] = tuple(spec["choices"])
+            expressions.append(self._compile_fact(spec))
+            self._fact_index[name] = len(self.fact_names)
+            self.fact_names += (name,)
+        self.facts: Callable[[Any], Tuple[Any, ...]] = self._build_facts(expressions)
+
+        self.node_rules = [self._compile_rule(spec) for spec in config["node_rules"]]
+        self.global_rules = [self._compile_global(spec) for spec in config.get("global_rules", [])]
+        self.topology_rules = [self._compile_topology(spec) for spec in config.get("topology_rules", [])]
+        self.topology_metrics = frozenset(
+            metric
+            for rule in self.topology_rules
+            for metric in (rule.metric, *(condition[0] for condition in rule.when))
+        )
+        self.presence_facts = tuple(dict.fromkeys(rule.unless_any for rule in self.global_rules))
+        self._presence_index = [(name, self._fact_index[name]) for name in self.presence_facts]
+        self.integral = all(
+            float(case.points).is_integer() for rule in self.node_rules for case in rule.cases.values()
+        )
+        self._outcomes: Dict[Tuple[Any, ...], Outcome] = {}
+
+    def _fact(self, name: str) -> int:
+        if name not in self._fact_index:
+            raise ValueError(f"Unknown fact {name}")
+        return self._fact_index[name]
+
+    def _constant(self, value: Any) -> str:
+        name = f"c{len(self._namespace)}"
+        self._namespace[name] = value
+        return name
+
+    def _path(self, path: str) -> str:
+        """Name of a local holding ``node.<path>``, or None if any step is missing."""
+        if path in self._paths:
+            return self._paths[path]
+        parent, _, attribute = path.rpartition(".")
+        if not attribute.isidentifier():
+            raise ValueError(f"Invalid field {path!r}")
+        source = self._path(parent) if parent else "node"
+        local = self._paths[path] = f"p{len(self._paths)}"
+        if parent:
+            self._path_lines.append(f"{local} = getattr({source}, {attribute!r}, None) if {source} is not None else None")
+        else:
+            self._path_lines.append(f"{local} = getattr(node, {attribute!r}, None)")
+        return local
+
+    def _compile_fact(self, spec: Any) -> str:
+        """Python expression computing ``spec`` from the path locals and earlier facts."""
+        if isinstance(spec, str):
+            index = self._fact(spec)
+            return f"bool(v{index})" if spec in self.choices else f"v{index}"
+        if not isinstance(spec, dict):
+            raise ValueError(f"Invalid fact definition {spec!r}")
+        if "ref" in spec:
+            return self._compile_fact(spec["ref"])
+        if "any" in spec or "all" in spec:
+            parts = [self._compile_fact(part) for part in spec.get("any", spec.get("all"))]
+            if not parts:
+                return "False" if "any" in spec else "True"
+            return "(" + (" or " if "any" in spec else " and ").join(parts) + ")"
+        if "not" in spec:
+            return f"(not {self._compile_fact(spec['not'])})"
+
+        value = self._path(spec["field"])
+        if "choices" in spec:
+            index = self._constant({choice: position for position, choice in enumerate(spec["choices"])})
+            return f"({index}.get({value}.strip().lower(), 0) if {value} else 0)"
+        if "in" in spec:
+            return f"({value} in {self._constant(frozenset(spec['in']))})"
+        if "min_length" in spec:
+            return f"({value} is not None and len({value}) >= {int(spec['min_length'])})"
+        if "keywords" in spec:
+            if spec["keywords"] not in self._keyword_bits:
+                raise ValueError(f"Unknown keyword set {spec['keywords']}")
+            return f"bool({self._keyword_mask(value)} & {self._keyword_bits[spec['keywords']]})"
+        if spec.get("present", True):
+            return f"bool({value})"
+        return f"(not {value})"
+
+    def _keyword_mask(self, value: str) -> str:
+        """Local holding the keyword bitmask of a path local, computed once per node."""
+        local = f"k{value}"
+        if local not in self._keyword_locals:
+            self._keyword_locals.add(local)
+            self._namespace["keyword_mask"] = self._matcher.match_all
+            self._path_lines.append(f"{local} = keyword_mask({value}) if {value} else 0")
+        return local
+
+    def _build_facts(self, expressions: List[str]) -> Callable[[Any], Tuple[Any, ...]]:
+        lines = ["def facts(node):"]
+        lines += [f"    {line}" for line in self._path_lines]
+        lines += [f"    v{index} = {expression}" for index, expression in enumerate(expressions)]
+        lines.append("    return (" + "".join(f"v{index}, " for index in range(len(expressions))) + ")")
+        namespace = dict(self._namespace)
+        exec(compile("\n".join(lines), f"<rules:{'_'.join(sorted(self.tags)) or 'default'}>", "exec"), namespace)
+        return namespace["facts"]
+
+    def _compile_case(self, spec: Dict[str, Any], extra_ideal: Dict[str, Any]) -> Case:
+        points = spec.get("points", 0)
+        finding = (spec["finding"], spec["code"]) if "finding" in spec else None
+        ideal = {**extra_ideal, **spec.get("ideal", {})}
+        return Case(
+            points,
+            format(points, "+g"),
+            spec.get("detail", ""),
+            finding,
+            tuple((field, resolve_template(value, self.controls)) for field, value in ideal.items()),
+        )
+
+    def _compile_rule(self, spec: Dict[str, Any]) -> NodeRule:
+        spec = apply_variants(spec, self.tags)
+        check_name = spec["check"]
+        check = self._fact(check_name)
+        ideal = spec.get("ideal", {})
+        if check_name in self.choices:
+            options = self.choices[check_name]
+            unknown = set(spec["cases"]) - set(options)
+            if unknown:
+                raise ValueError(f"Rule {spec['id']}: unknown cases {sorted(unknown)}")
+            cases = {options.index(key): self._compile_case(case, ideal) for key, case in spec["cases"].items()}
+        else:
+            cases = {
+                True: self._compile_case(spec["pass"], ideal),
+                False: self._compile_case(spec["fail"], ideal),
+            }
+        when = self._fact(spec["when"]) if spec.get("when") else None
+        return NodeRule(spec["id"], when, check, cases)
+
+    def _compile_global(self, spec: Dict[str, Any]) -> GlobalRule:
+        spec = apply_variants(spec, self.tags)
+        self._fact(spec["unless_any"])
+        return GlobalRule(
+            spec["id"],
+            spec["unless_any"],
+            tuple(spec.get("requires", ())),
+            spec.get("points", 0),
+            spec.get("detail"),
+            (spec["finding"], spec["code"]) if "finding" in spec else None,
+            spec.get("support_node"),
+        )
+
+    def _compile_topology(self, spec: Dict[str, Any]) -> TopologyRule:
+        spec = apply_variants(spec, self.tags)
+        for condition in (spec, *spec.get("when", ())):
+            if condition["metric"] not in SUMMARY_METRICS:
+                raise ValueError(f"Rule {spec['id']}: unknown topology metric {condition['metric']}")
+            if "above" not in condition and "below" not in condition:
+                raise ValueError(f"Rule {spec['id']}: needs an above or below threshold for {condition['metric']}")
+        return TopologyRule(
+            spec["id"],
+            spec["metric"],
+            spec.get("above"),
+            spec.get("below"),
+            spec.get("min_nodes", 0),
+            spec.get("points", 0),
+            spec.get("detail"),
+            (spec["finding"], spec["code"]) if "finding" in spec else None,
+            tuple((condition["metric"], condition.get("above"), condition.get("below")) for condition in spec.get("when", ())),
+        )
+
+    def present(self, facts: Tuple[Any, ...]) -> List[str]:
+        return [name for name, index in self._presence_index if facts[index]]
+
+    def outcome(self, facts: Tuple[Any, ...]) -> Outcome:
+        outcome = self._outcomes.get(facts)
+        if outcome is not None:
+            return outcome
+        adjustment = 0.0
+        details: List[Tuple[str, str]] = []
+        findings: List[Tuple[str, str]] = []
+        ideal: List[Tuple[str, Any]] = []
+        for rule in self.node_rules:
+            if rule.when is not None and not facts[rule.when]:
+                continue
+            case = rule.cases.get(facts[rule.check])
+            if case is None:
+                continue
+            adjustment += case.points
+            details.append((case.label, case.text))
+            if case.finding:
+                findings.append(case.finding)
+            ideal.extend(case.ideal)
+        outcome = self._outcomes[facts] = Outcome(adjustment, tuple(details), tuple(findings), tuple(ideal))
+        return outcome
+
+    def columns(self, rows: List[Tuple[Any, ...]]) -> Dict[str, np.ndarray]:
+        """Fact rows as one NumPy column per fact (bool, or int8 choice indexes)."""
+        columns: Dict[str, np.ndarray] = {}
+        for index, name in enumerate(self.fact_names):
+            values = [row[index] for row in rows]
+            columns[name] = np.array(values, dtype=np.int8 if name in self.choices else bool)
+        return columns
+
+    def column_points(self, columns: Dict[str, np.ndarray], size: int) -> np.ndarray:
+        """Vectorized sum of node rule points for every row of ``columns``."""
+        dtype = np.int64 if self.integral else np.float64
+        total = np.zeros(size, dtype=dtype)
+        for rule in self.node_rules:
+            values = columns[self.fact_names[rule.check]].astype(np.int64)
+            table = np.zeros(max(2, len(self.choices.get(self.fact_names[rule.check], ()))), dtype=dtype)
+            for key, case in rule.cases.items():
+                table[int(key)] = case.points
+            points = table[values]
+            if rule.when is not None:
+                points = points * columns[self.fact_names[rule.when]]
+            total += points
+        return total
+
+    def column_findings(self, columns: Dict[str, np.ndarray]) -> List[Tuple[str, str]]:
+        findings: List[Tuple[str, str]] = []
+        for rule in self.node_rules:
+            values = columns[self.fact_names[rule.check]]
+            for key, case in rule.cases.items():
+                if case.finding is None:
+                    continue
+                mask = values == key
+                if rule.when is not None:
+                    mask = mask & columns[self.fact_names[rule.when]]
+                if mask.any():
+                    findings.append(case.finding)
+        return findings
+
+    def global_outcome(
+        self,
+        present: Set[str],
+        context: Set[str],
+        endpoint_ids: List[str],
+    ) -> Tuple[float, List[str], List[Tuple[str, str]], List[Dict[str, Any]]]:
+        adjustment = 0.0
+        details: List[str] = []
+        findings: List[Tuple[str, str]] = []
+        support_nodes: List[Dict[str, Any]] = []
+        references = dict(self.controls, endpoint_ids=endpoint_ids)
+        for rule in self.active_global_rules(context):
+            if rule.unless_any in present:
+                continue
+            adjustment += rule.points
+            if rule.detail:
+                details.append(f"{format(rule.points, '+g')} {rule.detail}")
+            if rule.finding:
+                findings.append(rule.finding)
+            if rule.support_node is not None:
+                support_nodes.append(resolve_template(rule.support_node, references))
+        return adjustment, details, findings, support_nodes
+
+    def topology_outcome(self, summary: Dict[str, Any]) -> Tuple[float, List[str], List[Tuple[str, str]]]:
+        """Rules on graph metrics (``topology.SUMMARY_METRICS``) that fire past their threshold."""
+        adjustment = 0.0
+        details: List[str] = []
+        findings: List[Tuple[str, str]] = []
+        for rule in self.topology_rules:
+            if summary["nodes"] < rule.min_nodes:
+                continue
+            conditions = ((rule.metric, rule.above, rule.below), *rule.when)
+            if not all(crossed(summary[metric], above, below) for metric, above, below in conditions):
+                continue
+            adjustment += rule.points
+            if rule.detail:
+                details.append(f"{format(rule.points, '+g')} {rule.detail}")
+            if rule.finding:
+                findings.append(rule.finding)
+        return adjustment, details, findings
+
+    def active_global_rules(self, context: Set[str]) -> List[GlobalRule]:
+        tags = self.tags | context
+        return [rule for rule in self.global_rules if all(tag in tags for tag in rule.requires)]
+
+
+class RuleBook:
+    """Rule configuration loaded from a JSON file and compiled per profile.
+
+    All profiles are compiled when the file is loaded, so an invalid file is
+    rejected as a whole and the previous rules stay active. ``maybe_reload``
+    re-reads the file when its modification time changed, checking at most
+    once per ``poll_interval`` seconds.
+    """
+
+    def __init__(self, path: str, poll_interval: float = 5.0):
+        self.path = path
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self.mtime = 0.0
+        self.version = ""
+        self.loaded_at = 0.0
+        self.profiles: Dict[frozenset, RuleSet] = {}
+        self.reload()
+
+    def reload(self) -> str:
+        with self._lock:
+            mtime = os.path.getmtime(self.path)
+            with open(self.path, "rb") as handle:
+                raw = handle.read()
+            self.profiles = compile_profiles(json.loads(raw))
+            self.version = hashlib.sha256(raw).hexdigest()[:12]
+            self.mtime = mtime
+            self.loaded_at = time.time()
+            self._checked_at = time.monotonic()
+            return self.version
+
+    def maybe_reload(self) -> bool:
+        now = time.monotonic()
+        if self.poll_interval <= 0 or now - self._checked_at < self.poll_interval:
+            return False
+        self._checked_at = now
+        mtime = os.path.getmtime(self.path)
+        if mtime == self.mtime:
+            return False
+        # Remember the new mtime first so a broken file is reported once, not on every poll.
+        self.mtime = mtime
+        self.reload()
+        return True
+
+    def profile(self, fstec_only: bool = False, quantum_mode: bool = False) -> RuleSet:
+        tags = frozenset(tag for tag, active in (("quantum", quantum_mode), ("fstec", fstec_only)) if active)
+        return self.profiles[tags]
+
+
+def compile_profiles(config: Dict[str, Any]) -> Dict[frozenset, RuleSet]:
+    try:
+        keyword_sets = config.get("keywords", {})
+        matcher = KeywordMatcher(list(keyword_sets.values()))
+        keyword_bits = {name: 1 << index for index, name in enumerate(keyword_sets)}
+        profiles = {}
+        for quantum in (False, True):
+            for fstec in (False, True):
+                tags = {tag for tag, active in (("quantum", quantum), ("fstec", fstec)) if active}
+                profiles[frozenset(tags)] = RuleSet(config, tags, matcher, keyword_bits)
+        return profiles
+    except (KeyError, TypeError, AttributeError) as e:
+        raise ValueError(f"Invalid scoring rules: {type(e).__name__}: {e}") from e
@@ -0,0 +1,1061 @@
+import logging
+import os
+import sys
+from collections import Counter
+from typing import Any, Dict, List, NamedTuple, Tuple
+
+import numpy as np
+from pydantic import BaseModel, Field, PrivateAttr
+
+from graph import CSRGraph, index_edges, trace_path
+from rules import RuleBook, RuleSet, fresh
+from topology import TopologyAnalysis
+
+logger = logging.getLogger(__name__)
+
+
+class PasswordPolicy(BaseModel):
+    min_length: int = 12
+    require_upper: bool = True
+    require_lower: bool = True
+    require_digits: bool = True
+    require_special: bool = True
+
+
+class WifiSettings(BaseModel):
+    password: str | None = None
+    encryption: str | None = None
+
+
+class SecurityPolicy(BaseModel):
+    password_hashed: bool | None = None
+    backup_frequency: str | None = None
+
+
+class PersonalData(BaseModel):
+    enabled: bool | None = None
+    count: int | None = None
+
+
+class NetworkNode(BaseModel):
+    id: str
+    type: str
+    name: str
+    weight: float | None = None
+    os: str | None = None
+    antivirus: str | None = None
+    encryption: List[str] = Field(default_factory=list)
+    vpn: str | None = None
+    wifi: WifiSettings | None = None
+    security_policy: SecurityPolicy | None = None
+    personal_data: PersonalData | None = None
+    professional_software: List[str] = Field(default_factory=list)
+    connections: List[str] = Field(default_factory=list)
+    auth_type: str | None = None
+    firewall_type: str | None = None
+    access_level: int | None = None
+    password_policy: PasswordPolicy | None = None
+
+
+class ThreatModel(BaseModel):
+    quantum_capability: str
+    budget_usd: int
+    has_error_correction: bool
+    is_fstec_compliant: bool = False
+    has_large_pd_storage: bool = False
+
+
+class AnalysisRequest(BaseModel):
+    nodes: List[NetworkNode]
+    threat_model: ThreatModel
+    # Groups analyses in the history store; not part of the cache key.
+    site: str | None = Field(default=None, min_length=1, max_length=200)
+    _compact: List["CompactNode"] | None = PrivateAttr(default=None)
+
+    def compact_nodes(self) -> List["CompactNode"]:
+        """``nodes`` as ``CompactNode`` objects, converted on first use."""
+        if self._compact is None:
+            self._compact = [CompactNode.from_model(node) for node in self.nodes]
+        return self._compact
+
+    def payload(self) -> Dict[str, Any]:
+        """JSON-ready dump of the request, equal to ``model_dump(mode="json")``."""
+        return {
+            "nodes": [node.as_dict() for node in self.compact_nodes()],
+            "threat_model": self.threat_model.model_dump(),
+            "site": self.site,
+        }
+
+
+class WifiView(NamedTuple):
+    password: str | None
+    encryption: str | None
+
+
+class SecurityPolicyView(NamedTuple):
+    password_hashed: bool | None
+    backup_frequency: str | None
+
+
+class PersonalDataView(NamedTuple):
+    enabled: bool | None
+    count: int | None
+
+
+class PasswordPolicyView(NamedTuple):
+    min_length: int
+    require_upper: bool
+    require_lower: bool
+    require_digits: bool
+    require_special: bool
+
+
+EMPTY_VIEWS = {
+    "wifi": WifiView(None, None),
+    "security_policy": SecurityPolicyView(None, None),
+    "personal_data": PersonalDataView(None, None),
+}
+
+
+def intern(value: str | None) -> str | None:
+    return sys.intern(value) if value is not None else None
+
+
+class CompactNode:
+    """Read-only scoring view of a validated ``NetworkNode``.
+
+    Requests are validated by pydantic once; scoring, prompt building, cache
+    keys and the history store then work on these slotted objects. Nested
+    settings are tuples and the low-cardinality strings are interned, so
+    repeated values share one object and hit the keyword memo by identity.
+    ``as_dict`` is a plain-Python equivalent of ``model_dump(mode="python")``.
+    Only ``connections`` is mutated after construction, by ``TopologySession``.
+    """
+
+    __slots__ = tuple(NetworkNode.model_fields)
+
+    @classmethod
+    def from_model(cls, node: NetworkNode) -> "CompactNode":
+        compact = cls.__new__(cls)
+        wifi, policy, personal, password = node.wifi, node.security_policy, node.personal_data, node.password_policy
+        compact.id = node.id
+        compact.type = intern(node.type)
+        compact.name = node.name
+        compact.weight = node.weight
+        compact.os = intern(node.os)
+        compact.antivirus = intern(node.antivirus)
+        compact.encryption = [sys.intern(value) for value in node.encryption]
+        compact.vpn = intern(node.vpn)
+        compact.wifi = WifiView(wifi.password, intern(wifi.encryption)) if wifi is not None else None
+        compact.security_policy = (
+            SecurityPolicyView(policy.password_hashed, intern(policy.backup_frequency)) if policy is not None else None
+        )
+        compact.personal_data = PersonalDataView(personal.enabled, personal.count) if personal is not None else None
+        compact.professional_software = [sys.intern(value) for value in node.professional_software]
+        compact.connections = list(node.connections)
+        compact.auth_type = intern(node.auth_type)
+        compact.firewall_type = intern(node.firewall_type)
+        compact.access_level = node.access_level
+        compact.password_policy = (
+            PasswordPolicyView(
+                password.min_length,
+                password.require_upper,
+                password.require_lower,
+                password.require_digits,
+                password.require_special,
+            )
+            if password is not None
+            else None
+        )
+        return compact
+
+    def copy(self) -> "CompactNode":
+        copy = CompactNode.__new__(CompactNode)
+        for slot in CompactNode.__slots__:
+            setattr(copy, slot, getattr(self, slot))
+        return copy
+
+    def renamed(self, name: str) -> "CompactNode":
+        copy = self.copy()
+        copy.name = name
+        return copy
+
+    def get(self, path: str) -> Any:
+        """Value at a dotted ``path`` such as ``security_policy.backup_frequency``; None if a parent is missing."""
+        value: Any = self
+        for attribute in path.split("."):
+            value = getattr(value, attribute)
+            if value is None:
+                return None
+        return value
+
+    def replaced(self, path: str, value: Any) -> "CompactNode":
+        """Copy with the value at ``path`` set; a missing settings view is created with every field None."""
+        copy = self.copy()
+        value = intern(value) if isinstance(value, str) else value
+        field, _, attribute = path.partition(".")
+        if attribute:
+            view = getattr(self, field) or EMPTY_VIEWS[field]
+            value = view._replace(**{attribute: value})
+        setattr(copy, field, value)
+        return copy
+
+    def as_dict(self) -> Dict[str, Any]:
+        wifi, policy, personal, password = self.wifi, self.security_policy, self.personal_data, self.password_policy
+        return {
+            "id": self.id,
+            "type": self.type,
+            "name": self.name,
+            "weight": self.weight,
+            "os": self.os,
+            "antivirus": self.antivirus,
+            "encryption": list(self.encryption),
+            "vpn": self.vpn,
+            "wifi": wifi._asdict() if wifi is not None else None,
+            "security_policy": policy._asdict() if policy is not None else None,
+            "personal_data": personal._asdict() if personal is not None else None,
+            "professional_software": list(self.professional_software),
+            "connections": list(self.connections),
+            "auth_type": self.auth_type,
+            "firewall_type": self.firewall_type,
+            "access_level": self.access_level,
+            "password_policy": password._asdict() if password is not None else None,
+        }
+
+    def __getstate__(self) -> Tuple[Any, ...]:
+        return tuple(getattr(self, slot) for slot in CompactNode.__slots__)
+
+    def __setstate__(self, state: Tuple[Any, ...]) -> None:
+        for slot, value in zip(CompactNode.__slots__, state):
+            setattr(self, slot, value)
+
+
+def check_compact_fields() -> None:
+    """Fails at import when ``CompactNode`` no longer mirrors the request models field for field.
+
+    The views and ``from_model``/``as_dict`` are written out by hand for
+    speed; a field missing from them would silently drop out of cache keys,
+    prompts and job payloads.
+    """
+    for view, model in (
+        (WifiView, WifiSettings),
+        (SecurityPolicyView, SecurityPolicy),
+        (PersonalDataView, PersonalData),
+        (PasswordPolicyView, PasswordPolicy),
+    ):
+        if view._fields != tuple(model.model_fields):
+            raise RuntimeError(f"{view.__name__} fields {view._fields} do not match {model.__name__}")
+    sample = NetworkNode(
+        id="n1",
+        type="pc",
+        name="sample",
+        wifi=WifiSettings(),
+        security_policy=SecurityPolicy(),
+        personal_data=PersonalData(),
+        password_policy=PasswordPolicy(),
+    )
+    try:
+        converted = CompactNode.from_model(sample).as_dict()
+    except AttributeError as e:
+        raise RuntimeError(f"CompactNode.from_model does not set every NetworkNode field: {e}")
+    if converted != sample.model_dump():
+        raise RuntimeError("CompactNode.as_dict does not match NetworkNode.model_dump")
+
+
+check_compact_fields()
+
+
+COLUMNAR_MIN_NODES = int(os.getenv("COLUMNAR_MIN_NODES", "2000"))
+# BFS pivots for the betweenness estimate; graphs up to this size get exact values.
+TOPOLOGY_BETWEENNESS_SAMPLES = int(os.getenv("TOPOLOGY_BETWEENNESS_SAMPLES", "16"))
+# The graph rules of the rule config (``topology_rules``) change scores, so stateless scoring applies them only
+# when enabled; sessions opt in per session.
+TOPOLOGY_RULES = os.getenv("TOPOLOGY_RULES", "false").lower() in ("1", "true", "yes")
+SCORING_RULES_PATH = os.getenv(
+    "SCORING_RULES_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "scoring_rules.json")
+)
+SCORING_RULES_POLL = float(os.getenv("SCORING_RULES_POLL", "5"))
+_rule_book: RuleBook | None = None
+
+
+def rule_book() -> RuleBook:
+    """The scoring rules, loaded from ``SCORING_RULES_PATH`` on first use."""
+    global _rule_book
+    if _rule_book is None:
+        _rule_book = RuleBook(SCORING_RULES_PATH, poll_interval=SCORING_RULES_POLL)
+    return _rule_book
+
+
+GENERAL_RECOMMENDATIONS = {
+    "antivirus_missing": "Install certified endpoint protection (EDR/antivirus) on every workstation.",
+    "disk_missing": "Encrypt disks on workstations and servers (full-disk AES-256).",
+    "vpn_missing": "Introduce secure VPN/Zero-Trust access for remote segments.",
+    "mfa_missing": "Protect privileged accounts with MFA or hardware tokens.",
+    "wifi_insecure": "Switch Wi-Fi to WPA3-Enterprise and set strong passwords.",
+    "wifi_quantum_weak": "For quantum-capable adversaries use WPA3-Enterprise (192-bit) and long random passphrases.",
+    "password_plain": "Hash stored passwords and forbid plaintext credential storage.",
+    "backup_missing": "Schedule daily offline backups stored in an isolated network.",
+    "firewall_unknown": "Deploy an NGFW/WAF and document traffic segmentation.",
+    "firewall_absent": "Add a perimeter firewall to separate internal segments.",
+    "siem_missing": "Deploy SIEM/SOC to aggregate logs from all systems.",
+    "personal_data_unprotected": "Encrypt personal data stores and restrict access to them.",
+    "pqc_missing": "Adopt hybrid post-quantum crypto (Kyber/Dilithium) for VPN and data at rest.",
+    "flat_network": "Split the flat network into firewall-separated segments to limit lateral movement.",
+    "single_points_of_failure": "Add redundant links or devices around nodes whose failure disconnects the network.",
+}
+FSTEK_RECOMMENDATIONS = {
+    "antivirus_missing": "Разверните Kaspersky Endpoint Security или другой сертифицированный ФСТЭК EDR.",
+    "disk_missing": "Зашифруйте рабочие станции с помощью ViPNet Client / Secret Disk (ФСТЭК).",
+    "vpn_missing": "Организуйте защищённый канал на ViPNet TLS или Континент.",
+    "mfa_missing": "Включите Rutoken/JaCarta для администраторов и критичных ролей.",
+    "wifi_insecure": "Настройте Wi-Fi в режиме WPA3-Enterprise с сертификатами ФСТЭК.",
+    "wifi_quantum_weak": "Для квантовых угроз переведите Wi‑Fi в WPA3-Enterprise (192-bit) и используйте длинные случайные ключи.",
+    "password_plain": "Храните пароли только в зашифрованном виде и контролируйте управление ключами.",
+    "backup_missing": "Настройте ежедневные оффлайн-копии с контролем ФСТЭК.",
+    "firewall_unknown": "Замените МЭ на ViPNet Coordinator NGFW или аналог, имеющий сертификат.",
+    "firewall_absent": "Добавьте сертифицированный ФСТЭК межсетевой экран между сегментами.",
+    "siem_missing": "Разверните ФСТЭК-сертифицированный SIEM/SOC (ОКБ САПР, РусГидро и т.д.).",
+    "personal_data_unprotected": "Защитите ПДн ViPNet-шифрованием и аппаратными токенами доступа.",
+    "pqc_missing": "Используйте гибридные ГОСТ+PQC профили в ViPNet TLS/Client для защиты трафика и хранилищ.",
+    "flat_network": "Разделите плоскую сеть на сегменты сертифицированными ФСТЭК межсетевыми экранами.",
+    "single_points_of_failure": "Зарезервируйте каналы и узлы, отказ которых разрывает сеть.",
+}
+
+
+def clamp(value: float, low: float = 0.0, high: float = 100.0) -> float:
+    return max(low, min(high, value))
+
+
+def extract_connections(nodes: List[CompactNode]) -> List[Tuple[str, str]]:
+    known_ids = {node.id for node in nodes}
+    result: set[Tuple[str, str]] = set()
+    for node in nodes:
+        for target in node.connections or []:
+            if target not in known_ids or target == node.id:
+                continue
+            result.add((node.id, target) if node.id < target else (target, node.id))
+    return sorted(result)
+
+
+def ensure_security_policy(node_dict: Dict[str, Any]) -> Dict[str, Any]:
+    node_dict["security_policy"] = {
+        "password_hashed": True,
+        "backup_frequency": "daily",
+    }
+    return node_dict
+
+
+def apply_ideal_defaults(node_dict: Dict[str, Any], controls: Dict[str, str]) -> Dict[str, Any]:
+    ideal = dict(node_dict)
+    ideal["weight"] = 10.0
+    ensure_security_policy(ideal)
+    ideal["wifi"] = {
+        "password": controls["wifi_password"],
+        "encryption": controls["wifi_encryption"],
+    }
+    return ideal
+
+
+def node_ideal(node: CompactNode, rules: RuleSet, ideal_updates: Tuple[Tuple[str, Any], ...]) -> Dict[str, Any]:
+    ideal = apply_ideal_defaults(node.as_dict(), rules.controls)
+    ideal.setdefault("professional_software", node.professional_software or [])
+    ideal.setdefault("connections", node.connections or [])
+    ideal.setdefault("encryption", node.encryption or [])
+    for field, value in ideal_updates:
+        ideal[field] = fresh(value)
+    return ideal
+
+
+def evaluate_node(
+    node: CompactNode,
+    rules: RuleSet,
+    with_ideal: bool = True,
+    facts: Tuple[Any, ...] | None = None,
+) -> Tuple[float, List[str], List[Tuple[str, str]], Dict[str, Any]]:
+    outcome = rules.outcome(rules.facts(node) if facts is None else facts)
+    name = node.name
+    details = [f"{label} {name}: {text}" for label, text in outcome.details]
+    ideal = node_ideal(node, rules, outcome.ideal) if with_ideal else {}
+    return outcome.adjustment, details, list(outcome.findings), ideal
+
+
+def current_rules(fstec_only: bool = False, quantum_mode: bool = False) -> RuleSet:
+    rules = rule_book()
+    try:
+        rules.maybe_reload()
+    except (OSError, ValueError):
+        logger.exception("Scoring rules reload failed, keeping version %s", rules.version)
+    return rules.profile(fstec_only, quantum_mode)
+
+
+def select_support_controls(fstec_only: bool = False, quantum_mode: bool = False) -> Dict[str, str]:
+    return current_rules(fstec_only, quantum_mode).controls
+
+
+def evaluate_security(
+    nodes: List[CompactNode],
+    fstec_only: bool = False,
+    pd_sensitive: bool = False,
+    quantum_mode: bool = False,
+) -> Tuple[Dict[str, Any], List[Dict[str, Any]], List[Tuple[str, str]]]:
+    if not nodes:
+        metrics = {
+            "value": 0,
+            "weight_ratio": 0.0,
+            "connection_ratio": 0.0,
+            "control_details": [],
+            "findings": [],
+            "finding_codes": [],
+            "topology": analyze_topology([], []).summary(centrality=False),
+        }
+        return metrics, [], []
+    if len(nodes) >= COLUMNAR_MIN_NODES:
+        return evaluate_security_columnar(nodes, fstec_only, pd_sensitive, quantum_mode)
+
+    unique_edges = extract_connections(nodes)
+    total_nodes = len(nodes)
+    max_edges = total_nodes * (total_nodes - 1) // 2
+    connection_ratio = 1.0 if max_edges == 0 else min(1.0, len(unique_edges) / max_edges)
+
+    total_weight = sum((node.weight if node.weight is not None else 5.0) for node in nodes)
+    max_weight = max(total_nodes * 10.0, 1.0)
+    weight_ratio = min(1.0, total_weight / max_weight)
+
+    base_weight_component = weight_ratio * 45.0
+    base_connection_component = connection_ratio * 25.0
+
+    control_adjustments = 0.0
+    control_details: List[str] = [
+        f"+{base_weight_component:.1f} from current node weights",
+        f"+{base_connection_component:.1f} from link density",
+    ]
+    finding_texts: set[str] = set()
+    finding_codes: set[str] = set()
+    ideal_nodes: List[Dict[str, Any]] = []
+    rules = current_rules(fstec_only, quantum_mode)
+    present: set[str] = set()
+
+    for node in nodes:
+        facts = rules.facts(node)
+        present.update(rules.present(facts))
+        adjustment, details, findings, ideal = evaluate_node(node, rules, facts=facts)
+        control_adjustments += adjustment
+        control_details.extend(details)
+        for text, code in findings:
+            finding_texts.add(text)
+            finding_codes.add(code)
+        ideal_nodes.append(ideal)
+
+    global_adjustment, global_details, global_findings, support_nodes = apply_global_controls(
+        rules, [node.id for node in nodes], present, pd_sensitive
+    )
+    control_adjustments += global_adjustment
+    control_details.extend(global_details)
+    for text, code in global_findings:
+        finding_texts.add(text)
+        finding_codes.add(code)
+    ideal_nodes.extend(support_nodes)
+
+    topology, topology_adjustment, topology_details, topology_findings = apply_topology_controls(
+        rules, nodes, unique_edges
+    )
+    control_adjustments += topology_adjustment
+    control_details.extend(topology_details)
+    for text, code in topology_findings:
+        finding_texts.add(text)
+        finding_codes.add(code)
+
+    metrics = summarize_security(
+        total_nodes,
+        weight_ratio,
+        connection_ratio,
+        control_adjustments,
+        control_details,
+        finding_texts,
+        finding_codes,
+        topology,
+    )
+    return metrics, ideal_nodes, unique_edges
+
+
+def apply_global_controls(
+    rules: RuleSet,
+    endpoint_ids: List[str],
+    present: set[str],
+    pd_sensitive: bool = False,
+) -> Tuple[float, List[str], List[Tuple[str, str]], List[Dict[str, Any]]]:
+    """Architecture-level rules for controls that no node in ``present`` provides."""
+    return rules.global_outcome(present, {"pd_sensitive"} if pd_sensitive else set(), endpoint_ids)
+
+
+def analyze_topology(nodes: List[CompactNode], connection_pairs: List[Tuple[str, str]]) -> TopologyAnalysis:
+    """Graph metrics of the topology, with firewalls as the segment boundaries."""
+    ids = [node.id for node in nodes]
+    _, edges = index_edges(ids, connection_pairs)
+    barriers = np.fromiter((node.type == "firewall" for node in nodes), dtype=bool, count=len(nodes))
+    return TopologyAnalysis(ids, edges, barriers, TOPOLOGY_BETWEENNESS_SAMPLES)
+
+
+def apply_topology_controls(
+    rules: RuleSet,
+    nodes: List[CompactNode],
+    connection_pairs: List[Tuple[str, str]],
+    centrality: bool = False,
+    analysis: TopologyAnalysis | None = None,
+    apply_rules: bool | None = None,
+) -> Tuple[Dict[str, Any], float, List[str], List[Tuple[str, str]]]:
+    """Segmentation and choke-point rules scored on the topology summary.
+
+    The rules are applied when ``apply_rules`` is true, by default when
+    ``TOPOLOGY_RULES`` is set; otherwise the summary is returned with a zero
+    adjustment. The sampled betweenness is the costliest metric, so it is
+    only computed when an applied rule tests it or ``centrality`` asks for
+    it; ``/api/topology`` returns the full summary. A precomputed
+    ``analysis`` of the same graph can be passed in.
+    """
+    apply_rules = TOPOLOGY_RULES if apply_rules is None else apply_rules
+    centrality = centrality or (apply_rules and "max_betweenness" in rules.topology_metrics)
+    analysis = analysis or analyze_topology(nodes, connection_pairs)
+    topology = analysis.summary(centrality=centrality)
+    adjustment, details, findings = rules.topology_outcome(topology) if apply_rules else (0.0, [], [])
+    topology["adjustment"] = adjustment
+    return topology, adjustment, details, findings
+
+
+def summarize_security(
+    total_nodes: int,
+    weight_ratio: float,
+    connection_ratio: float,
+    control_adjustments: float,
+    control_details: List[str],
+    finding_texts: set[str],
+    finding_codes: set[str],
+    topology: Dict[str, Any] | None = None,
+) -> Dict[str, Any]:
+    base_weight_component = weight_ratio * 45.0
+    base_connection_component = connection_ratio * 25.0
+
+    topology_bonus = 0.0
+    if total_nodes > 2:
+        if connection_ratio >= 0.6:
+            topology_bonus = 5.0
+        elif connection_ratio < 0.2:
+            topology_bonus = -5.0
+    if topology_bonus:
+        control_adjustments += topology_bonus
+        control_details.append(f"{topology_bonus:+} network topology factor")
+
+    total_score = clamp(base_weight_component + base_connection_component + control_adjustments)
+
+    return {
+        "value": round(total_score),
+        "weight_ratio": round(weight_ratio, 2),
+        "connection_ratio": round(connection_ratio, 2),
+        "control_details": control_details,
+        "topology_bonus": topology_bonus,
+        "findings": sorted(finding_texts),
+        "finding_codes": sorted(finding_codes),
+        "topology": topology,
+    }
+
+
+def build_node_columns(nodes: List[CompactNode], rules: RuleSet) -> Dict[str, np.ndarray]:
+    columns = rules.columns([rules.facts(node) for node in nodes])
+    columns["weight"] = np.array(
+        [node.weight if node.weight is not None else 5.0 for node in nodes], dtype=np.float64
+    )
+    return columns
+
+
+def columnar_adjustments(columns: Dict[str, np.ndarray], rules: RuleSet) -> np.ndarray:
+    return rules.column_points(columns, len(columns["weight"]))
+
+
+def column_facts(columns: Dict[str, np.ndarray], rules: RuleSet) -> List[Tuple[Any, ...]]:
+    return list(zip(*(columns[name].tolist() for name in rules.fact_names)))
+
+
+def columnar_control_details(
+    nodes: List[CompactNode],
+    columns: Dict[str, np.ndarray],
+    rules: RuleSet,
+) -> List[str]:
+    details: List[str] = []
+    for node, facts in zip(nodes, column_facts(columns, rules)):
+        name = node.name
+        details.extend(f"{label} {name}: {text}" for label, text in rules.outcome(facts).details)
+    return details
+
+
+def columnar_ideal_nodes(
+    nodes: List[CompactNode],
+    columns: Dict[str, np.ndarray],
+    rules: RuleSet,
+) -> List[Dict[str, Any]]:
+    return [
+        node_ideal(node, rules, rules.outcome(facts).ideal)
+        for node, facts in zip(nodes, column_facts(columns, rules))
+    ]
+
+
+def evaluate_security_columnar(
+    nodes: List[CompactNode],
+    fstec_only: bool = False,
+    pd_sensitive: bool = False,
+    quantum_mode: bool = False,
+    with_details: bool = True,
+    with_ideal: bool = True,
+    rules: RuleSet | None = None,
+) -> Tuple[Dict[str, Any], List[Dict[str, Any]], List[Tuple[str, str]]]:
+    """Vectorized equivalent of ``evaluate_security``.
+
+    Node attributes are flattened into NumPy columns once and all per-node
+    adjustments are computed as array expressions. With ``with_details=False``
+    the per-node ``control_details`` lines are skipped (only global lines are
+    kept; ``columnar_control_details`` can render them later), and with
+    ``with_ideal=False`` no ideal nodes are built.
+    """
+    if not nodes:
+        return evaluate_security(nodes, fstec_only, pd_sensitive, quantum_mode)
+
+    unique_edges = extract_connections(nodes)
+    total_nodes = len(nodes)
+    max_edges = total_nodes * (total_nodes - 1) // 2
+    connection_ratio = 1.0 if max_edges == 0 else min(1.0, len(unique_edges) / max_edges)
+
+    rules = rules or current_rules(fstec_only, quantum_mode)
+    columns = build_node_columns(nodes, rules)
+    total_weight = sum(columns["weight"].tolist())
+    weight_ratio = min(1.0, total_weight / max(total_nodes * 10.0, 1.0))
+
+    control_adjustments = float(columnar_adjustments(columns, rules).sum())
+    control_details = [
+        f"+{weight_ratio * 45.0:.1f} from current node weights",
+        f"+{connection_ratio * 25.0:.1f} from link density",
+    ]
+    if with_details:
+        control_details.extend(columnar_control_details(nodes, columns, rules))
+    node_findings = rules.column_findings(columns)
+
+    global_adjustment, global_details, global_findings, support_nodes = apply_global_controls(
+        rules,
+        [node.id for node in nodes],
+        {name for name in rules.presence_facts if columns[name].any()},
+        pd_sensitive,
+    )
+    control_adjustments += global_adjustment
+    control_details.extend(global_details)
+    topology, topology_adjustment, topology_details, topology_findings = apply_topology_controls(
+        rules, nodes, unique_edges
+    )
+    control_adjustments += topology_adjustment
+    control_details.extend(topology_details)
+    findings = node_findings + global_findings + topology_findings
+
+    ideal_nodes = columnar_ideal_nodes(nodes, columns, rules) if with_ideal else []
+    ideal_nodes.extend(support_nodes)
+
+    metrics = summarize_security(
+        total_nodes,
+        weight_ratio,
+        connection_ratio,
+        control_adjustments,
+        control_details,
+        {text for text, _ in findings},
+        {code for _, code in findings},
+        topology,
+    )
+    return metrics, ideal_nodes, unique_edges
+
+
+def scoring_fingerprint(node: CompactNode) -> Tuple[Any, ...]:
+    wifi = node.wifi
+    policy = node.security_policy
+    personal = node.personal_data
+    password_policy = node.password_policy
+    return (
+        node.type,
+        node.weight,
+        node.os,
+        node.antivirus,
+        tuple(node.encryption or ()),
+        node.vpn,
+        (wifi.password, wifi.encryption) if wifi else None,
+        (policy.password_hashed, policy.backup_frequency) if policy else None,
+        (personal.enabled, personal.count) if personal else None,
+        tuple(node.professional_software or ()),
+        node.auth_type,
+        node.firewall_type,
+        node.access_level,
+        tuple(password_policy) if password_policy else None,
+    )
+
+
+def evaluate_security_grouped(
+    nodes: List[CompactNode],
+    fstec_only: bool = False,
+    pd_sensitive: bool = False,
+    quantum_mode: bool = False,
+) -> Tuple[Dict[str, Any], List[Dict[str, Any]], List[Tuple[str, str]]]:
+    """``evaluate_security`` that scores each distinct node configuration once.
+
+    Nodes are bucketed by ``scoring_fingerprint`` and every class is evaluated
+    on its first member, with the result applied with multiplicity. The score
+    and findings match ``evaluate_security``; ``control_details`` holds one
+    "per-node points ×count" line per class and check, and ``ideal_nodes``
+    holds one template per class (with ``class_id``, ``count`` and
+    ``members``) followed by the support nodes.
+    """
+    if not nodes:
+        return evaluate_security(nodes, fstec_only, pd_sensitive, quantum_mode)
+    return GroupedEvaluation(nodes).evaluate(current_rules(fstec_only, quantum_mode), pd_sensitive)
+
+
+class ClassOutcome(NamedTuple):
+    adjustment: float
+    details: List[str]
+    findings: List[Tuple[str, str]]
+    templates: List[Dict[str, Any]]
+    present: set[str]
+
+
+class GroupedEvaluation:
+    """Profile-independent state of ``evaluate_security_grouped``.
+
+    Configuration classes, link density, weights and the topology analysis do
+    not depend on the rule profile, so one instance scores any number of
+    profiles: ``evaluate`` runs the node rules once per rule set and only the
+    global and topology rules per call.
+    """
+
+    def __init__(self, nodes: List[CompactNode]):
+        self.nodes = nodes
+        self.unique_edges = extract_connections(nodes)
+        total_nodes = len(nodes)
+        max_edges = total_nodes * (total_nodes - 1) // 2
+        self.connection_ratio = 1.0 if max_edges == 0 else min(1.0, len(self.unique_edges) / max_edges)
+        total_weight = sum((node.weight if node.weight is not None else 5.0) for node in nodes)
+        self.weight_ratio = min(1.0, total_weight / max(total_nodes * 10.0, 1.0))
+        self.classes: Dict[Tuple[Any, ...], List[CompactNode]] = {}
+        for node in nodes:
+            self.classes.setdefault(scoring_fingerprint(node), []).append(node)
+        self.analysis = analyze_topology(nodes, self.unique_edges)
+        self._outcomes: Dict[RuleSet, ClassOutcome] = {}
+
+    def class_outcome(self, rules: RuleSet) -> ClassOutcome:
+        outcome = self._outcomes.get(rules)
+        if outcome is not None:
+            return outcome
+        adjustment = 0.0
+        details: List[str] = []
+        findings: List[Tuple[str, str]] = []
+        templates: List[Dict[str, Any]] = []
+        present: set[str] = set()
+        type_counts: Counter[str] = Counter()
+        for members in self.classes.values():
+            representative = members[0]
+            count = len(members)
+            type_counts[representative.type] += 1
+            class_id = f"{representative.type}-{type_counts[representative.type]}"
+            label = f"class {class_id}"
+            facts = rules.facts(representative)
+            present.update(rules.present(facts))
+
+            node_adjustment, node_details, node_findings, ideal = evaluate_node(
+                representative.renamed(label), rules, facts=facts
+            )
+            adjustment += node_adjustment * count
+            for line in node_details:
+                points, _, rest = line.partition(" ")
+                details.append(f"{points} ×{count} {rest}")
+            findings.extend(node_findings)
+            for key in ("id", "name", "connections"):
+                ideal.pop(key, None)
+            templates.append({"class_id": class_id, "count": count, "members": [node.id for node in members], **ideal})
+        outcome = self._outcomes[rules] = ClassOutcome(adjustment, details, findings, templates, present)
+        return outcome
+
+    def evaluate(
+        self, rules: RuleSet, pd_sensitive: bool = False
+    ) -> Tuple[Dict[str, Any], List[Dict[str, Any]], List[Tuple[str, str]]]:
+        scored = self.class_outcome(rules)
+        control_adjustments = scored.adjustment
+        control_details = [
+            f"+{self.weight_ratio * 45.0:.1f} from current node weights",
+            f"+{self.connection_ratio * 25.0:.1f} from link density",
+            *scored.details,
+        ]
+        findings = list(scored.findings)
+        ideal_nodes = list(scored.templates)
+
+        global_adjustment, global_details, global_findings, support_nodes = apply_global_controls(
+            rules, [node.id for node in self.nodes], scored.present, pd_sensitive
+        )
+        control_adjustments += global_adjustment
+        control_details.extend(global_details)
+        findings.extend(global_findings)
+        ideal_nodes.extend(support_nodes)
+
+        topology, topology_adjustment, topology_details, topology_findings = apply_topology_controls(
+            rules, self.nodes, self.unique_edges, analysis=self.analysis
+        )
+        control_adjustments += topology_adjustment
+        control_details.extend(topology_details)
+        findings.extend(topology_findings)
+
+        metrics = summarize_security(
+            len(self.nodes),
+            self.weight_ratio,
+            self.connection_ratio,
+            control_adjustments,
+            control_details,
+            {text for text, _ in findings},
+            {code for _, code in findings},
+            topology,
+        )
+        metrics["node_classes"] = len(self.classes)
+        return metrics, ideal_nodes, self.unique_edges
+
+
+def sweep_profile_key(quantum_mode: bool, fstec_only: bool, pd_sensitive: bool) -> str:
+    tags = [tag for tag, active in (("quantum", quantum_mode), ("fstec", fstec_only), ("pd", pd_sensitive)) if active]
+    return "_".join(tags) or "default"
+
+
+def evaluate_security_sweep(nodes: List[CompactNode]) -> List[Dict[str, Any]]:
+    """``evaluate_security_grouped`` under every rule profile and ``has_large_pd_storage`` setting.
+
+    Node classes, link density and the topology analysis are shared by all
+    eight variants, the node rules run once per profile, and the PD setting
+    only re-runs the global rules.
+    """
+    evaluation = GroupedEvaluation(nodes) if nodes else None
+    variants: List[Dict[str, Any]] = []
+    for quantum_mode in (False, True):
+        for fstec_only in (False, True):
+            rules = current_rules(fstec_only, quantum_mode)
+            for pd_sensitive in (False, True):
+                if evaluation is None:
+                    metrics, ideal_nodes, _ = evaluate_security(nodes)
+                else:
+                    metrics, ideal_nodes, _ = evaluation.evaluate(rules, pd_sensitive)
+                variants.append({
+                    "profile": sweep_profile_key(quantum_mode, fstec_only, pd_sensitive),
+                    "quantum_mode": quantum_mode,
+                    "fstec_only": fstec_only,
+                    "pd_sensitive": pd_sensitive,
+                    "metrics": metrics,
+                    "ideal_nodes": ideal_nodes,
+                })
+    return variants
+
+
+def build_fstek_recommendations(finding_codes: List[str]) -> List[str]:
+    recs = [FSTEK_RECOMMENDATIONS[code] for code in finding_codes if code in FSTEK_RECOMMENDATIONS]
+    if not recs:
+        recs.append("Сохраняйте актуальные сертификаты ФСТЭК и подтверждайте соответствие ежегодно.")
+    return recs[:10]
+
+
+def build_general_recommendations(finding_codes: List[str]) -> List[str]:
+    seen: List[str] = []
+    for code in finding_codes:
+        text = GENERAL_RECOMMENDATIONS.get(code)
+        if text and text not in seen:
+            seen.append(text)
+    return seen
+
+
+def is_quantum_threat(threat: ThreatModel) -> bool:
+    return bool(threat.quantum_capability and threat.quantum_capability.lower().startswith("quantum"))
+
+
+def score_request(
+    request: AnalysisRequest,
+    group_classes: bool = False,
+) -> Tuple[Dict[str, Any], List[Dict[str, Any]], List[Tuple[str, str]]]:
+    return score_nodes(request.compact_nodes(), request.threat_model, group_classes)
+
+
+def score_nodes(
+    nodes: List[CompactNode],
+    threat: ThreatModel,
+    group_classes: bool = False,
+) -> Tuple[Dict[str, Any], List[Dict[str, Any]], List[Tuple[str, str]]]:
+    evaluate = evaluate_security_grouped if group_classes else evaluate_security
+    return evaluate(
+        nodes,
+        fstec_only=threat.is_fstec_compliant,
+        pd_sensitive=threat.has_large_pd_storage,
+        quantum_mode=is_quantum_threat(threat),
+    )
+
+
+def build_base_recommendations(metrics: Dict[str, Any], fstec_mode: bool) -> List[str]:
+    finding_codes = metrics.get("finding_codes", [])
+    if fstec_mode:
+        return build_fstek_recommendations(finding_codes)
+    return build_general_recommendations(finding_codes)
+
+
+def node_control_gaps(node: CompactNode, rules: RuleSet) -> List[str]:
+    return [code for _, code in rules.outcome(rules.facts(node)).findings]
+
+
+ENTRY_POINT_GAPS = ("wifi_insecure", "wifi_quantum_weak", "antivirus_missing", "mfa_missing")
+GAP_EXPLOIT_PROBABILITY = {
+    "antivirus_missing": 0.25,
+    "disk_missing": 0.05,
+    "vpn_missing": 0.1,
+    "mfa_missing": 0.2,
+    "wifi_insecure": 0.35,
+    "wifi_quantum_weak": 0.3,
+    "password_plain": 0.1,
+    "backup_missing": 0.02,
+    "firewall_unknown": 0.3,
+    "personal_data_unprotected": 0.1,
+}
+ATTACK_PATHS_K = int(os.getenv("ATTACK_PATHS_K", "5"))
+ATTACK_PATHS_YEN_MAX_EDGES = int(os.getenv("ATTACK_PATHS_YEN_MAX_EDGES", "200000"))
+
+
+def compromise_probability(gaps: List[str]) -> float:
+    return min(0.95, 0.05 + sum(GAP_EXPLOIT_PROBABILITY.get(gap, 0.0) for gap in gaps))
+
+
+def is_attack_target(node: CompactNode) -> bool:
+    return node.type == "firewall" or bool(node.personal_data and node.personal_data.enabled)
+
+
+def find_attack_paths(
+    nodes: List[CompactNode],
+    connection_pairs: List[Tuple[str, str]],
+    gaps: List[List[str]],
+    k: int = ATTACK_PATHS_K,
+) -> List[Tuple[float, List[int]]]:
+    """Most likely attack paths from exposed entry points to high-value targets.
+
+    Stepping onto a node costs ``-log(p)`` of its compromise probability, so the
+    cheapest path is the most likely one. A virtual source feeds all entry
+    points and all targets drain into a virtual sink; small graphs get exact
+    k-shortest paths (Yen), large ones the best path per target from a single
+    Dijkstra pass. Returns ``(likelihood, node indices)`` pairs, best first.
+    """
+    count = len(nodes)
+    cost = -np.log(np.array([compromise_probability(node_gaps) for node_gaps in gaps], dtype=np.float64))
+    entries = np.array(
+        [index for index, node_gaps in enumerate(gaps) if any(gap in ENTRY_POINT_GAPS for gap in node_gaps)],
+        dtype=np.int64,
+    )
+    targets = np.array([index for index, node in enumerate(nodes) if is_attack_target(node)], dtype=np.int64)
+    if not len(entries) or not len(targets):
+        return []
+
+    _, edges = index_edges([node.id for node in nodes], connection_pairs)
+    source, sink = count, count + 1
+    graph = CSRGraph(
+        count + 2,
+        np.concatenate([edges[:, 0], edges[:, 1], np.full(len(entries), source), targets]),
+        np.concatenate([edges[:, 1], edges[:, 0], entries, np.full(len(targets), sink)]),
+        np.concatenate([cost[edges[:, 1]], cost[edges[:, 0]], cost[entries], np.zeros(len(targets))]),
+    )
+
+    if graph.edge_count <= ATTACK_PATHS_YEN_MAX_EDGES:
+        ranked = graph.k_shortest_paths(source, sink, k)
+    else:
+        distance, predecessor = graph.dijkstra(source, set(targets.tolist()), stop_count=k)
+        reachable = sorted((distance[target], target) for target in targets.tolist() if distance[target] < float("inf"))
+        ranked = [(total, trace_path(predecessor, target) + [sink]) for total, target in reachable[:k]]
+
+    return [(float(np.exp(-total)), path[1:-1]) for total, path in ranked]
+
+
+def build_local_attack_graph(
+    nodes: List[CompactNode],
+    connection_pairs: List[Tuple[str, str]],
+    quantum_mode: bool = False,
+    k: int = ATTACK_PATHS_K,
+) -> Dict[str, Any]:
+    rules = current_rules(quantum_mode=quantum_mode)
+    gaps = [node_control_gaps(node, rules) for node in nodes]
+    ranked = find_attack_paths(nodes, connection_pairs, gaps, k)
+
+    attacker_label = "Quantum-capable adversary" if quantum_mode else "External attacker"
+    graph_nodes: List[Dict[str, Any]] = [{"id": "attacker", "data": {"label": attacker_label}, "type": "threat"}]
+    edges: List[Dict[str, Any]] = []
+    paths: List[Dict[str, Any]] = []
+    added_nodes: set[int] = set()
+    added_edges: set[Tuple[str, str]] = set()
+
+    for likelihood, path in ranked:
+        previous = "attacker"
+        for index in path:
+            node = nodes[index]
+            node_gaps = gaps[index]
+            if index not in added_nodes:
+                added_nodes.add(index)
+                graph_nodes.append({
+                    "id": node.id,
+                    "data": {"label": f"{node.name}: {', '.join(node_gaps)}" if node_gaps else node.name},
+                    "type": "vulnerable" if node_gaps else "control",
+                })
+            if (previous, node.id) not in added_edges:
+                added_edges.add((previous, node.id))
+                if previous == "attacker":
+                    label = next(gap for gap in node_gaps if gap in ENTRY_POINT_GAPS)
+                else:
+                    label = node_gaps[0] if node_gaps else "lateral movement"
+                edges.append({"id": f"e{len(edges) + 1}", "source": previous, "target": node.id, "label": label})
+            previous = node.id
+        paths.append({
+            "nodes": [nodes[index].id for index in path],
+            "target": nodes[path[-1]].id,
+            "likelihood": round(likelihood, 6),
+        })
+
+    return {"nodes": graph_nodes, "edges": edges, "paths": paths}
+
+
+def build_local_result(
+    request: AnalysisRequest,
+    local: Tuple[Dict[str, Any], List[Dict[str, Any]], List[Tuple[str, str]]],
+) -> Dict[str, Any]:
+    return local_result(request.compact_nodes(), request.threat_model, local)
+
+
+def local_result(
+    nodes: List[CompactNode],
+    threat: ThreatModel,
+    local: Tuple[Dict[str, Any], List[Dict[str, Any]], List[Tuple[str, str]]],
+) -> Dict[str, Any]:
+    metrics, ideal_nodes, connection_pairs = local
+    findings = metrics.get("findings", [])
+    summary = f"Local assessment: {metrics['value']}/100 for {len(nodes)} nodes."
+    if findings:
+        summary += " Main gaps: " + "; ".join(findings[:5]) + "."
+    return {
+        "score": metrics["value"],
+        "summary": summary,
+        "recommendations": build_base_recommendations(metrics, threat.is_fstec_compliant)[:10],
+        "attack_graph": build_local_attack_graph(nodes, connection_pairs, quantum_mode=is_quantum_threat(threat)),
+        "local_score": metrics,
+        "ideal_nodes": ideal_nodes,
+        "threat_model": threat.model_dump(),
+        "mode": "local",
+    }
+
+
+def score_in_worker(
+    nodes: List[CompactNode],
+    threat: ThreatModel,
+    group_classes: bool,
+    with_result: bool,
+) -> Tuple[Tuple[Dict[str, Any], List[Dict[str, Any]], List[Tuple[str, str]]], Dict[str, Any] | None]:
+    """Local scoring of a job, executed in a ``job_executor`` worker process.
+
+    The nodes arrive pickled as validated ``CompactNode`` objects, so the
+    worker does not validate the request again. Workers import only this
+    module, which opens no databases or clients when imported.
+    """
+    local = score_nodes(nodes, threat, group_classes)
+    return local, local_result(nodes, threat, local) if with_result else None
@@ -0,0 +1,240 @@
+import time
+import uuid
+from collections import Counter, OrderedDict, defaultdict
+from typing import Any, Dict, List, Tuple
+
+from scoring import (
+    AnalysisRequest,
+    CompactNode,
+    NetworkNode,
+    ThreatModel,
+    apply_global_controls,
+    apply_topology_controls,
+    current_rules,
+    evaluate_node,
+    evaluate_security,
+    is_quantum_threat,
+    summarize_security,
+)
+
+
+class TopologySession:
+    """Topology held in memory whose score is maintained edit by edit.
+
+    Per-node adjustments and findings are cached, declared links are kept as
+    reference-counted undirected pairs and the global presence flags
+    (firewall/SIEM/backup platform/PD/PQC) as counters, so every edit only
+    touches the changed nodes and their incident links.
+
+    Topology rules are opt-in (``topology_rules``): they need whole-graph
+    traversals after every graph edit, about a second at 100k nodes. Without
+    them the score equals ``/api/score`` with the topology rules left out.
+    """
+
+    def __init__(self, threat_model: ThreatModel, topology_rules: bool = False):
+        self.threat_model = threat_model
+        self.topology_rules = topology_rules
+        self.quantum_mode = is_quantum_threat(threat_model)
+        self.rules = current_rules(threat_model.is_fstec_compliant, self.quantum_mode)
+        self.nodes: Dict[str, CompactNode] = {}
+        self.contributions: Dict[str, Tuple[float, List[str], List[Tuple[str, str]]]] = {}
+        self.total_weight = 0.0
+        self.adjustment_total = 0.0
+        self.finding_counts: Counter[Tuple[str, str]] = Counter()
+        self.flag_counts: Counter[str] = Counter()
+        self.pair_refs: Counter[Tuple[str, str]] = Counter()
+        self.incident: Dict[str, set[Tuple[str, str]]] = defaultdict(set)
+        self.edges: set[Tuple[str, str]] = set()
+        self.graph_version = 0
+        self._topology: Tuple[int, Tuple[Dict[str, Any], float, List[str], List[Tuple[str, str]]]] | None = None
+        self.touched_at = time.monotonic()
+
+    def node_flags(self, node: CompactNode) -> List[str]:
+        return self.rules.present(self.rules.facts(node))
+
+    def add_node(self, node: NetworkNode | CompactNode) -> None:
+        if node.id in self.nodes:
+            raise ValueError(f"Node {node.id} already exists")
+        if isinstance(node, NetworkNode):
+            node = CompactNode.from_model(node)
+        self.graph_version += 1
+        self.nodes[node.id] = node
+        for target in self._declared(node):
+            self._link(node.id, target, 1)
+        for pair in self.incident[node.id]:
+            self._refresh(pair)
+
+        facts = self.rules.facts(node)
+        adjustment, details, findings, _ = evaluate_node(node, self.rules, with_ideal=False, facts=facts)
+        self.contributions[node.id] = (adjustment, details, findings)
+        self.adjustment_total += adjustment
+        self.finding_counts.update(findings)
+        self.flag_counts.update(self.rules.present(facts))
+        self.total_weight += node.weight if node.weight is not None else 5.0
+
+    def remove_node(self, node_id: str) -> CompactNode:
+        node = self.nodes.pop(node_id, None)
+        if node is None:
+            raise KeyError(node_id)
+        self.graph_version += 1
+        for target in self._declared(node):
+            self._link(node_id, target, -1)
+        for pair in list(self.incident[node_id]):
+            self._refresh(pair)
+
+        adjustment, _, findings = self.contributions.pop(node_id)
+        self.adjustment_total -= adjustment
+        self.finding_counts.subtract(findings)
+        self.flag_counts.subtract(self.node_flags(node))
+        self.total_weight -= node.weight if node.weight is not None else 5.0
+        return node
+
+    def update_node(self, node: NetworkNode) -> None:
+        self.remove_node(node.id)
+        self.add_node(node)
+
+    def add_connection(self, source: str, target: str) -> None:
+        node = self.nodes[source]
+        if target not in self.nodes:
+            raise KeyError(target)
+        if target != source and target not in node.connections:
+            node.connections.append(target)
+            self._link(source, target, 1)
+            self._refresh(self._pair(source, target))
+
+    def remove_connection(self, source: str, target: str) -> None:
+        for a, b in ((source, target), (target, source)):
+            node = self.nodes.get(a)
+            if node is not None and b in node.connections:
+                node.connections[:] = [value for value in node.connections if value != b]
+                self._link(a, b, -1)
+        self._refresh(self._pair(source, target))
+
+    def metrics(self, with_details: bool = False) -> Dict[str, Any]:
+        total_nodes = len(self.nodes)
+        if not total_nodes:
+            return evaluate_security([])[0]
+        max_edges = total_nodes * (total_nodes - 1) // 2
+        connection_ratio = 1.0 if max_edges == 0 else min(1.0, len(self.edges) / max_edges)
+        weight_ratio = min(1.0, self.total_weight / max(total_nodes * 10.0, 1.0))
+
+        control_details: List[str] = []
+        if with_details:
+            control_details = [
+                f"+{weight_ratio * 45.0:.1f} from current node weights",
+                f"+{connection_ratio * 25.0:.1f} from link density",
+            ]
+            for _, details, _ in self.contributions.values():
+                control_details.extend(details)
+
+        # Support nodes are not needed here, so no endpoint ids are passed.
+        global_adjustment, global_details, global_findings, _ = apply_global_controls(
+            self.rules,
+            [],
+            {name for name, count in self.flag_counts.items() if count > 0},
+            self.threat_model.has_large_pd_storage,
+        )
+        topology, topology_adjustment, topology_details, topology_findings = self.topology()
+        if with_details:
+            control_details.extend(global_details)
+            control_details.extend(topology_details)
+        findings = [pair for pair, count in self.finding_counts.items() if count > 0] + global_findings
+        findings += topology_findings
+
+        return summarize_security(
+            total_nodes,
+            weight_ratio,
+            connection_ratio,
+            self.adjustment_total + global_adjustment + topology_adjustment,
+            control_details,
+            {text for text, _ in findings},
+            {code for _, code in findings},
+            topology,
+        )
+
+    def topology(self) -> Tuple[Dict[str, Any] | None, float, List[str], List[Tuple[str, str]]]:
+        """Topology rules for the current graph, recomputed (in linear time) only after a change.
+
+        Sessions skip the sampled betweenness unless a rule needs it, so the
+        summary has no centrality entries. Without ``topology_rules`` nothing
+        is computed and the summary is None.
+        """
+        if not self.topology_rules:
+            return None, 0.0, [], []
+        if self._topology is None or self._topology[0] != self.graph_version:
+            outcome = apply_topology_controls(
+                self.rules, list(self.nodes.values()), list(self.edges), apply_rules=True
+            )
+            self._topology = (self.graph_version, outcome)
+        return self._topology[1]
+
+    def to_request(self) -> AnalysisRequest:
+        return AnalysisRequest(nodes=[node.as_dict() for node in self.nodes.values()], threat_model=self.threat_model)
+
+    @staticmethod
+    def _pair(a: str, b: str) -> Tuple[str, str]:
+        return (a, b) if a < b else (b, a)
+
+    @staticmethod
+    def _declared(node: CompactNode) -> set[str]:
+        return set(node.connections or []) - {node.id}
+
+    def _link(self, source: str, target: str, delta: int) -> None:
+        self.graph_version += 1
+        pair = self._pair(source, target)
+        self.pair_refs[pair] += delta
+        if self.pair_refs[pair] > 0:
+            self.incident[source].add(pair)
+            self.incident[target].add(pair)
+
+    def _refresh(self, pair: Tuple[str, str]) -> None:
+        if self.pair_refs[pair] > 0 and pair[0] in self.nodes and pair[1] in self.nodes:
+            self.edges.add(pair)
+            return
+        self.edges.discard(pair)
+        if self.pair_refs[pair] <= 0:
+            del self.pair_refs[pair]
+            for node_id in pair:
+                self.incident[node_id].discard(pair)
+                if not self.incident[node_id]:
+                    del self.incident[node_id]
+
+
+class SessionStore:
+    """Sessions by id, least recently used first.
+
+    Sessions unused for ``ttl_seconds`` are dropped when the store is next
+    read, and adding one beyond ``max_sessions`` drops the least recently
+    used.
+    """
+
+    def __init__(self, ttl_seconds: float = 3600.0, max_sessions: int = 256):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self._sessions: OrderedDict[str, TopologySession] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def add(self, session: TopologySession) -> str:
+        session_id = uuid.uuid4().hex
+        self._sessions[session_id] = session
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+        return session_id
+
+    def get(self, session_id: str) -> TopologySession | None:
+        now = time.monotonic()
+        while self._sessions:
+            oldest_id, oldest = next(iter(self._sessions.items()))
+            if now - oldest.touched_at < self.ttl_seconds:
+                break
+            del self._sessions[oldest_id]
+        session = self._sessions.get(session_id)
+        if session is not None:
+            session.touched_at = now
+            self._sessions.move_to_end(session_id)
+        return session
+
+    def remove(self, session_id: str) -> bool:
+        return self._sessions.pop(session_id, None) is not None
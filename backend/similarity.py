@@ -0,0 +1,82 @@
+import threading
+from typing import Any, Dict, Hashable, List, Tuple
+
+import numpy as np
+
+
+class SimilarityIndex:
+    """Bounded nearest-neighbour index over fixed-length feature vectors.
+
+    Vectors live in one preallocated matrix and ``nearest`` is an exact
+    brute-force search: for a few thousand entries of under a hundred
+    dimensions that is a single pass over the matrix, well under a
+    millisecond, with nothing to build or tune. Every entry belongs to a
+    ``group`` (the site) and only answers queries of the same group. Adding
+    under an existing group and key replaces that entry; when the index is
+    full the oldest entry is overwritten. ``record`` counts the callers' reuse decisions, so the
+    reuse rate can be reported next to the index size.
+    """
+
+    def __init__(self, dimensions: int, capacity: int = 2048):
+        self.dimensions = dimensions
+        self.capacity = max(capacity, 0)
+        self._vectors = np.zeros((self.capacity, dimensions), dtype=np.float64)
+        self._keys: List[Tuple[Hashable, str] | None] = [None] * self.capacity
+        self._groups = np.empty(self.capacity, dtype=object)
+        self._payloads: List[Any] = [None] * self.capacity
+        self._slots: Dict[Tuple[Hashable, str], int] = {}
+        self._next = 0
+        self._size = 0
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.reuses = 0
+
+    def add(self, key: str, vector: np.ndarray, payload: Any, group: Hashable = None) -> None:
+        if not self.capacity:
+            return
+        key = (group, key)
+        with self._lock:
+            slot = self._slots.get(key)
+            if slot is None:
+                slot = self._next
+                self._next = (slot + 1) % self.capacity
+                previous = self._keys[slot]
+                if previous is not None:
+                    del self._slots[previous]
+                self._size = min(self._size + 1, self.capacity)
+                self._slots[key] = slot
+                self._keys[slot] = key
+                self._groups[slot] = group
+            self._vectors[slot] = vector
+            self._payloads[slot] = payload
+
+    def nearest(self, vector: np.ndarray, group: Hashable = None) -> Tuple[float, str, Any] | None:
+        """Euclidean distance, key and payload of the closest entry of ``group``, or None if it has none."""
+        with self._lock:
+            if not self._size:
+                return None
+            differences = self._vectors[:self._size] - vector
+            distances = np.einsum("ij,ij->i", differences, differences)
+            distances[self._groups[:self._size] != group] = np.inf
+            slot = int(distances.argmin())
+            if distances[slot] == np.inf:
+                return None
+            return float(np.sqrt(distances[slot])), self._keys[slot][1], self._payloads[slot]
+
+    def record(self, reused: bool) -> None:
+        with self._lock:
+            self.lookups += 1
+            self.reuses += reused
+
+    def reuse_rate(self) -> float:
+        return self.reuses / self.lookups if self.lookups else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": self._size,
+                "capacity": self.capacity,
+                "lookups": self.lookups,
+                "reuses": self.reuses,
+                "reuse_rate": round(self.reuse_rate(), 4),
+            }
@@ -0,0 +1,318 @@
+import math
+import sys
+import threading
+import time
+from collections import Counter as TallyCounter
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"] + self.samples()
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{format_labels(self.labelnames, key)} {format_value(value)}" for key, value in items]
+
+
+class CallbackMetric(Metric):
+    """Counter or gauge read from ``function`` at render time.
+
+    ``function`` returns a number, or a mapping from label value tuples to numbers.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        kind: str,
+        function: Callable[[], Any],
+        labelnames: Sequence[str] = (),
+    ):
+        super().__init__(name, help_text, labelnames)
+        self.kind = kind
+        self.function = function
+
+    def samples(self) -> List[str]:
+        values = self.function()
+        items = sorted(values.items()) if isinstance(values, dict) else [((), values)]
+        return [f"{self.name}{format_labels(self.labelnames, key)} {format_value(value)}" for key, value in items]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            # Per-bucket counts, then the running sum and total count.
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        lines = []
+        for key, series in items:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-2] + [series[-1] - sum(series[:-2])]):
+                cumulative += count
+                le = f'le="{format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{format_labels(self.labelnames, key, le)} {format_value(cumulative)}")
+            labels = format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {format_value(series[-2])}")
+            lines.append(f"{self.name}_count{labels} {format_value(series[-1])}")
+        return lines
+
+
+class MetricsRegistry:
+    """Small in-process metrics registry rendered in the Prometheus text format."""
+
+    content_type = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Any:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labelnames))
+
+    def callback(
+        self,
+        name: str,
+        help_text: str,
+        kind: str,
+        function: Callable[[], Any],
+        labelnames: Sequence[str] = (),
+    ) -> CallbackMetric:
+        return self.register(CallbackMetric(name, help_text, kind, function, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class StageTimer:
+    """Collects wall-clock durations of named processing stages.
+
+    Every finished stage is kept in ``timings`` (milliseconds) and, when a
+    histogram is given, observed in it (seconds) with a ``stage`` label.
+    """
+
+    def __init__(self, histogram: Histogram | None = None, **labels: str):
+        self.histogram = histogram
+        self.labels = labels
+        self.timings: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def record(self, name: str, seconds: float) -> None:
+        self.timings[name] = round(self.timings.get(name, 0.0) + seconds * 1000, 3)
+        if self.histogram is not None:
+            self.histogram.observe(seconds, stage=name, **self.labels)
+
+    def server_timing(self) -> str:
+        return ", ".join(f"{name};dur={duration}" for name, duration in self.timings.items())
+
+
+class SamplingProfiler:
+    """Statistical profiler for a single thread.
+
+    A background thread snapshots the target thread's stack every ``interval``
+    seconds via ``sys._current_frames``. For code running on the event loop the
+    samples also include other requests served concurrently, and time spent
+    awaiting I/O shows up as the loop's selector wait.
+    """
+
+    def __init__(self, interval: float = 0.001, max_depth: int = 64, thread_id: int | None = None):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.thread_id = thread_id
+        self.samples = 0
+        self.elapsed = 0.0
+        self._stacks: TallyCounter[Tuple[str, ...]] = TallyCounter()
+        self._stop = threading.Event()
+        self._worker: threading.Thread | None = None
+        self._started = 0.0
+
+    def __enter__(self) -> "SamplingProfiler":
+        self.start()
+        return self
+
+    def __exit__(self, *_: Any) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        if self.thread_id is None:
+            self.thread_id = threading.get_ident()
+        self._started = time.perf_counter()
+        self._worker = threading.Thread(target=self._sample, name="sampling-profiler", daemon=True)
+        self._worker.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._worker is not None:
+            self._worker.join()
+            self._worker = None
+        self.elapsed = time.perf_counter() - self._started
+
+    def _sample(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                code = frame.f_code
+                stack.append(f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                stack.reverse()
+                self._stacks[tuple(stack)] += 1
+                self.samples += 1
+
+    def report(self, limit: int = 30) -> Dict[str, Any]:
+        own: TallyCounter[str] = TallyCounter()
+        inclusive: TallyCounter[str] = TallyCounter()
+        for stack, count in self._stacks.items():
+            own[stack[-1]] += count
+            for function in set(stack):
+                inclusive[function] += count
+        return {
+            "interval_ms": self.interval * 1000,
+            "elapsed_ms": round(self.elapsed * 1000, 3),
+            "samples": self.samples,
+            "functions": [
+                {"function": function, "self": count, "total": inclusive[function]}
+                for function, count in own.most_common(limit)
+            ],
+            "stacks": [
+                {"stack": ";".join(stack), "count": count}
+                for stack, count in self._stacks.most_common(limit)
+            ],
+        }
+
+
+class TimingMiddleware:
+    """ASGI middleware observing request latency per route template and status.
+
+    The arrival time is stored in ``scope["received_at"]`` so handlers can
+    attribute the time spent reading and validating the body.
+    """
+
+    def __init__(self, app: Any, histogram: Histogram):
+        self.app = app
+        self.histogram = histogram
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = scope["received_at"] = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_wrapper(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            self.histogram.observe(
+                time.perf_counter() - started,
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=str(status["code"]),
+            )
@@ -0,0 +1,107 @@
+import asyncio
+import importlib
+
+import pytest
+
+from admission import AdmissionRejected, SingleFlight, TokenBucketLimiter
+
+
+def test_concurrent_callers_share_one_flight():
+    async def scenario():
+        flights, calls = SingleFlight(), []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return {"score": 1}
+
+        results = await asyncio.gather(*(flights.run("k", compute) for _ in range(5)))
+        assert len(flights) == 0
+        again = await flights.run("k", compute)
+        return results, again, calls, flights
+
+    results, again, calls, flights = asyncio.run(scenario())
+    assert [shared for _, shared in results] == [False, True, True, True, True]
+    assert all(result is results[0][0] for result, _ in results)
+    assert again == ({"score": 1}, False)
+    assert len(calls) == 2
+    assert (flights.started, flights.shared) == (2, 4)
+
+
+def test_flight_survives_a_cancelled_caller_and_shares_its_exception():
+    async def scenario():
+        flights, release = SingleFlight(), asyncio.Event()
+
+        async def compute():
+            await release.wait()
+            raise ValueError("upstream down")
+
+        first = asyncio.create_task(flights.run("k", compute))
+        second = asyncio.create_task(flights.run("k", compute))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        with pytest.raises(ValueError, match="upstream down"):
+            await second
+        assert first.cancelled()
+        assert "k" not in flights
+
+    asyncio.run(scenario())
+
+
+def test_limiter_rejects_with_the_wait_until_admission():
+    async def scenario():
+        limiter = TokenBucketLimiter(rate=1.0, burst=2.0, max_wait=0.5)
+        assert await limiter.acquire("a") == 0.0
+        assert await limiter.acquire("a") == 0.0
+        with pytest.raises(AdmissionRejected) as rejected:
+            await limiter.acquire("a")
+        assert 0.9 < rejected.value.retry_after <= 1.0
+        assert await limiter.acquire("b") == 0.0
+        return limiter.stats()
+
+    stats = asyncio.run(scenario())
+    assert (stats["admitted"], stats["rejected"], stats["clients"]) == (3, 1, 2)
+
+
+def test_limiter_refund_on_cancellation_is_capped_at_the_burst(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr("admission.time.monotonic", lambda: now[0])
+
+    async def scenario():
+        limiter = TokenBucketLimiter(rate=1.0, burst=2.0, max_wait=10.0)
+        await limiter.acquire("a", 2.0)
+        waiter = asyncio.create_task(limiter.acquire("a", 2.0))
+        await asyncio.sleep(0)
+        assert limiter.waiting == 1
+        # The cancelled request has been queued long enough for its own tokens to accrue.
+        now[0] = 100.0
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        return limiter
+
+    limiter = asyncio.run(scenario())
+    assert limiter.waiting == 0
+    assert limiter._buckets["a"] == (2.0, 100.0)
+
+
+def test_analyze_answers_429_with_retry_after(tmp_path, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("OPENROUTER_API_KEY", "test")
+    main = importlib.import_module("main")
+    limiter = TokenBucketLimiter(rate=0.25, burst=1.0, max_wait=0.0)
+    monkeypatch.setattr(main, "admission", limiter)
+    asyncio.run(limiter.acquire("testclient"))
+
+    payload = {
+        "nodes": [{"id": "a", "type": "pc", "name": "A"}],
+        "threat_model": {"quantum_capability": "none", "budget_usd": 1, "has_error_correction": False},
+    }
+    response = TestClient(main.app).post("/api/analyze", json=payload)
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "4"
+    assert limiter.stats()["rejected"] == 1
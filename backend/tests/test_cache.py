@@ -0,0 +1,83 @@
+import pytest
+
+from cache import AnalysisCache, canonical_request_key
+
+THREAT = {"quantum_capability": "none", "budget_usd": 1, "has_error_correction": False}
+NODES = [
+    {"id": "a", "type": "pc", "name": "A", "connections": ["b", "c"]},
+    {"id": "b", "type": "server", "name": "B", "connections": ["a"]},
+    {"id": "c", "type": "router", "name": "C"},
+]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("cache.time.time", lambda: now[0])
+    return now
+
+
+def test_key_ignores_node_and_connection_order():
+    reordered = [
+        {"name": "C", "type": "router", "id": "c"},
+        {"id": "b", "type": "server", "name": "B", "connections": ["a", "a"]},
+        {"id": "a", "type": "pc", "name": "A", "connections": ["c", "b"]},
+    ]
+    key = canonical_request_key(NODES, THREAT)
+    assert canonical_request_key(reordered, dict(reversed(list(THREAT.items())))) == key
+    assert canonical_request_key(NODES, THREAT, salt="v2") != key
+    changed = [dict(NODES[0], connections=["b"]), *NODES[1:]]
+    assert canonical_request_key(changed, THREAT) != key
+
+
+def test_memory_tier_evicts_the_least_recently_used():
+    cache = AnalysisCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.stats()["evictions"] == 1
+
+
+def test_entries_survive_a_restart_through_sqlite(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = AnalysisCache(db_path=path)
+    cache.set("k", {"score": 42, "summary": "ок"})
+    cache.close()
+
+    restarted = AnalysisCache(db_path=path)
+    assert restarted.get("k") == {"score": 42, "summary": "ок"}
+    stats = restarted.stats()
+    assert (stats["disk_hits"], stats["memory_hits"]) == (1, 0)
+    restarted.get("k")
+    assert restarted.stats()["memory_hits"] == 1
+    restarted.close()
+
+
+def test_disk_tier_keeps_the_most_recently_used(tmp_path, clock):
+    path = str(tmp_path / "cache.db")
+    cache = AnalysisCache(max_entries=1, db_path=path, max_disk_entries=2)
+    for key in ("a", "b"):
+        cache.set(key, key)
+        clock[0] += 1
+    assert cache.get("a") == "a"  # from disk, which refreshes its access time
+    clock[0] += 1
+    cache.set("c", "c")
+    cache.close()
+    restarted = AnalysisCache(db_path=path)
+    assert [restarted.get(key) for key in ("a", "b", "c")] == ["a", None, "c"]
+    restarted.close()
+
+
+def test_entries_expire_after_the_ttl(tmp_path, clock):
+    path = str(tmp_path / "cache.db")
+    cache = AnalysisCache(ttl_seconds=60, db_path=path)
+    cache.set("k", 1)
+    clock[0] += 59
+    assert cache.get("k") == 1
+    clock[0] += 1
+    assert cache.get("k") is None
+    cache.close()
+    assert AnalysisCache(ttl_seconds=60, db_path=path).get("k") is None
@@ -0,0 +1,177 @@
+import asyncio
+
+import pytest
+
+import scoring
+from importers import CSV_COLUMNS, ImportLimitExceeded, TopologyImporter, format_records
+
+NMAP_REPORT = b"""<?xml version="1.0"?>
+<nmaprun scanner="nmap">
+  <host>
+    <status state="up"/>
+    <address addr="10.0.0.1" addrtype="ipv4"/>
+    <hostnames><hostname name="gw.local"/></hostnames>
+    <ports>
+      <port protocol="udp" portid="500"><state state="open"/><service name="isakmp"/></port>
+      <port protocol="tcp" portid="443"><state state="open"/><service name="http" tunnel="ssl" product="nginx" version="1.24"/></port>
+    </ports>
+    <os><osmatch name="FortiOS 7"><osclass type="firewall"/></osmatch></os>
+  </host>
+  <host>
+    <status state="down"/>
+    <address addr="10.0.0.9" addrtype="ipv4"/>
+  </host>
+  <host>
+    <status state="up"/>
+    <address addr="10.0.0.20" addrtype="ipv4"/>
+    <address addr="AA:BB:CC:DD:EE:FF" addrtype="mac"/>
+    <ports>
+      <port protocol="tcp" portid="22"><state state="open"/><service name="ssh" product="OpenSSH"/></port>
+      <port protocol="tcp" portid="80"><state state="closed"/><service name="http" product="Apache"/></port>
+    </ports>
+    <trace><hop ipaddr="10.0.0.1"/><hop ipaddr="10.0.0.20"/></trace>
+  </host>
+</nmaprun>
+"""
+
+
+async def chunked(data: bytes, size: int):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def read(fmt: str, data: bytes, chunk_size: int = 7, max_line_bytes: int = 4096):
+    async def collect():
+        return [item async for item in format_records(fmt, chunked(data, chunk_size), max_line_bytes)]
+
+    return asyncio.run(collect())
+
+
+def import_records(records):
+    importer = TopologyImporter(scoring.NetworkNode.model_validate, max_nodes=100)
+    for location, record in records:
+        importer.add(location, record)
+    return {node.id: node for node in importer.finish()}, importer.stats()
+
+
+def test_csv_quoted_newlines_and_header_aliases():
+    data = (
+        "\ufeffId,Type,Name,IP,Software,Password_Hashed,Backup_Frequency,Personal_Data_Count,Connections\r\n"
+        'pc1,pc,"Accounting\nworkstation",10.0.0.5,"1C; Office",true,daily,120,srv\r\n'
+        'srv,server,"File ""main"" server",10.0.0.6|srv.local,,false,weekly,,\r\n'
+    ).encode()
+    for chunk_size in (1, 7, len(data)):
+        records = read("csv", data, chunk_size)
+        assert [location for location, _ in records] == ["line 2", "line 4"]
+    first, second = (record for _, record in records)
+    assert first == {
+        "id": "pc1", "type": "pc", "name": "Accounting\nworkstation", "aliases": ["10.0.0.5"],
+        "professional_software": ["1C", "Office"], "connections": ["srv"],
+        "security_policy": {"password_hashed": "true", "backup_frequency": "daily"},
+        "personal_data": {"count": "120"},
+    }
+    assert second["name"] == 'File "main" server'
+    assert second["aliases"] == ["10.0.0.6", "srv.local"]
+    nodes, stats = import_records(records)
+    assert nodes["pc1"].connections == ["srv"]
+    assert nodes["pc1"].security_policy.password_hashed is True
+    assert stats["rejected"] == 0
+
+
+@pytest.mark.parametrize("column", sorted(CSV_COLUMNS))
+def test_every_csv_header_alias_maps_to_its_field(column):
+    value = "2" if column == "personal_data_count" else "x"
+    records = read("csv", f"id,{column}\nn1,{value}\n".encode())
+    record = records[0][1]
+    *parents, leaf = CSV_COLUMNS[column].split(".")
+    for parent in parents:
+        record = record[parent]
+    assert record[leaf] in (value, [value])
+
+
+def test_csv_rejects_extra_fields_and_unterminated_quotes():
+    records = read("csv", b'id,name\na,A,extra\nb,"B\n')
+    assert isinstance(records[0][1], ValueError)
+    assert records[1] == ("line 3", records[1][1])
+    assert "unterminated" in str(records[1][1])
+
+
+def ndjson(*lines: str) -> bytes:
+    return "\n".join(lines).encode()
+
+
+def test_forward_and_ambiguous_alias_references():
+    records = read("ndjson", ndjson(
+        '{"id": "a", "type": "pc", "name": "Desk", "connections": ["core-sw", "Printer", "10.0.0.3", "nowhere"]}',
+        '{"id": "b", "type": "printer", "name": "Printer", "aliases": ["10.0.0.3"]}',
+        '{"id": "c", "type": "printer", "name": "Printer"}',
+        '{"id": "d", "type": "switch", "name": "Core", "aliases": ["core-sw"], "connections": ["Desk", "d", "a"]}',
+    ))
+    nodes, stats = import_records(records)
+    assert nodes["a"].connections == ["d", "b"]
+    assert nodes["d"].connections == ["a"]
+    assert stats["unresolved_connections"] == 2
+    assert stats["unresolved_samples"] == ["a -> Printer", "a -> nowhere"]
+
+
+def test_duplicate_ids_keep_the_first_node():
+    records = read("ndjson", ndjson(
+        '{"id": "a", "type": "pc", "name": "First"}',
+        '[1, 2]',
+        '{"id": "a", "type": "server", "name": "Second"}',
+        '{"id": "b", "type": "pc"}',
+        '{"threat_model": {"quantum_capability": "none", "budget_usd": 1, "has_error_correction": false}}',
+    ))
+    importer = TopologyImporter(scoring.NetworkNode.model_validate, max_nodes=100)
+    for location, record in records:
+        importer.add(location, record)
+    nodes = importer.finish()
+    stats = importer.stats()
+    assert [(node.id, node.name) for node in nodes] == [("a", "First")]
+    assert (stats["records"], stats["rejected"], stats["duplicates"]) == (5, 3, 1)
+    assert [error["location"] for error in stats["errors"]] == ["line 2", "line 3", "line 4"]
+    assert importer.threat_model["budget_usd"] == 1
+
+
+def test_node_limit_is_enforced():
+    importer = TopologyImporter(scoring.NetworkNode.model_validate, max_nodes=1)
+    importer.add("line 1", {"id": "a", "type": "pc", "name": "A"})
+    with pytest.raises(ImportLimitExceeded):
+        importer.add("line 2", {"id": "b", "type": "pc", "name": "B"})
+
+
+@pytest.mark.parametrize("fmt", ["ndjson", "csv"])
+def test_line_over_max_line_bytes_is_refused(fmt):
+    header = "" if fmt == "ndjson" else "id,name\n"
+    long_line = '{"id": "a", "name": "' + "x" * 200 + '"}' if fmt == "ndjson" else "a," + "x" * 200
+    with pytest.raises(ImportLimitExceeded):
+        read(fmt, (header + long_line + "\n").encode(), chunk_size=16, max_line_bytes=64)
+    assert len(read(fmt, (header + long_line + "\n").encode(), chunk_size=16, max_line_bytes=4096)) == 1
+
+
+def test_quoted_csv_row_spanning_lines_is_bounded():
+    data = b'id,name\na,"' + b"x\n" * 100 + b'"\n'
+    with pytest.raises(ImportLimitExceeded):
+        read("csv", data, max_line_bytes=64)
+
+
+def test_nmap_report():
+    for chunk_size in (13, len(NMAP_REPORT)):
+        records = read("nmap", NMAP_REPORT, chunk_size)
+        assert [location for location, _ in records] == ["host 1", "host 3"]
+    gateway, host = (record for _, record in records)
+    assert gateway == {
+        "id": "10.0.0.1", "name": "gw.local", "type": "firewall", "aliases": ["gw.local"], "os": "FortiOS 7",
+        "vpn": "IPsec VPN", "encryption": ["TLS"], "professional_software": ["nginx 1.24"],
+    }
+    assert host["aliases"] == ["AA:BB:CC:DD:EE:FF"]
+    assert (host["type"], host["encryption"], host["professional_software"]) == ("pc", ["SSH"], ["OpenSSH"])
+    assert host["connections"] == ["10.0.0.1"]
+    nodes, stats = import_records(records)
+    assert nodes["10.0.0.20"].connections == ["10.0.0.1"]
+    assert stats["rejected"] == 0
+
+
+def test_invalid_nmap_xml_is_a_value_error():
+    with pytest.raises(ValueError, match="invalid nmap XML"):
+        read("nmap", b"<nmaprun><host></nmaprun>")
@@ -0,0 +1,49 @@
+import sqlite3
+
+from jobs import JobStore
+
+
+def run(store: JobStore, key: str, **finish):
+    job, created = store.submit(key, {"request": key})
+    assert created
+    assert store.claim()["id"] == job["id"]
+    store.finish(job["id"], {"score": 1}, **finish)
+    return job
+
+
+def test_finished_job_is_reused_for_the_same_key(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"))
+    job = run(store, "k")
+    reused, created = store.submit("k", {"request": "k"})
+    assert not created and reused["id"] == job["id"]
+    assert store.get(job["id"])["result"] == {"score": 1}
+
+
+def test_degraded_and_failed_jobs_are_not_reused(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"))
+    degraded = run(store, "k", reusable=False)
+    _, created = store.submit("k", {"request": "k"})
+    assert created
+    assert store.get(degraded["id"])["status"] == JobStore.DONE
+
+    store = JobStore(str(tmp_path / "failed.db"))
+    failed, _ = store.submit("f", {"request": "f"})
+    store.claim()
+    store.fail(failed["id"], "boom")
+    _, created = store.submit("f", {"request": "f"})
+    assert created
+
+
+def test_existing_database_gains_the_reusable_column(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    db = sqlite3.connect(path)
+    db.execute(
+        "CREATE TABLE jobs (id TEXT PRIMARY KEY, key TEXT NOT NULL, status TEXT NOT NULL, "
+        "payload TEXT NOT NULL, result TEXT, error TEXT, attempts INTEGER NOT NULL DEFAULT 0, "
+        "created_at REAL NOT NULL, started_at REAL, finished_at REAL)"
+    )
+    db.execute("INSERT INTO jobs (id, key, status, payload, created_at) VALUES ('a', 'k', 'queued', '{}', 1e12)")
+    db.commit()
+    db.close()
+    _, created = JobStore(path).submit("k", {})
+    assert not created
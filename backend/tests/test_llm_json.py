@@ -0,0 +1,105 @@
+import json
+
+import pytest
+
+from llm_json import IncrementalObjectParser, extract_json_object, iter_object_spans, repair_json
+
+KEYS = ("score", "summary", "recommendations", "attack_graph")
+REPLY = (
+    "Here is the analysis {as requested}:\n```json\n"
+    '{"score": 42, "summary": "segments {a} and [b] \\"quoted\\"", '
+    '"recommendations": ["Enable MFA", "Use WPA3"], '
+    '"attack_graph": {"nodes": [{"id": "n1", "data": {"label": "PC"}}], "edges": []}}\n'
+    "```\nLet me know if you need more {details}."
+)
+
+
+def test_prose_and_stray_braces_around_the_object_are_skipped():
+    value, repairs = extract_json_object(REPLY, KEYS)
+    assert value["score"] == 42
+    assert value["summary"] == 'segments {a} and [b] "quoted"'
+    assert value["attack_graph"]["nodes"][0]["data"] == {"label": "PC"}
+    assert repairs == []
+
+
+def test_braces_inside_strings_do_not_end_the_span():
+    text = 'x {"summary": "a } b { c", "score": 1} y'
+    assert [(start, end, closed) for start, end, closed in iter_object_spans(text)] == [(2, len(text) - 2, True)]
+    assert extract_json_object(text, KEYS) == ({"summary": "a } b { c", "score": 1}, [])
+
+
+def test_preferred_keys_pick_the_analysis_object():
+    text = '{"note": 1} then {"score": 2}'
+    assert extract_json_object(text, KEYS) == ({"score": 2}, [])
+    assert extract_json_object(text) == ({"note": 1}, [])
+
+
+def test_trailing_commas_are_removed():
+    assert extract_json_object('{"recommendations": ["a", "b",], "score": 3,}', KEYS) == (
+        {"recommendations": ["a", "b"], "score": 3},
+        ["trailing_comma"],
+    )
+
+
+def test_code_fence_after_a_truncated_object():
+    value, repairs = extract_json_object('```json\n{"score": 1, "recommendations": ["a", "b"]\n```', KEYS)
+    assert value == {"score": 1, "recommendations": ["a", "b"]}
+    assert repairs == ["code_fence", "truncated"]
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ('{"score": 7, "recommendations": ["a", "b', {"score": 7, "recommendations": ["a"]}),
+        ('{"score": 7, "recommendations": ["a", ', {"score": 7, "recommendations": ["a"]}),
+        ('{"score": 7, "summary": "half a sente', {"score": 7}),
+        ('{"score": 7, "summary"', {"score": 7}),
+        ('{"score": 7, "attack_graph": {"nodes": [{"id": "n1"}', {"score": 7, "attack_graph": {"nodes": [{"id": "n1"}]}}),
+    ],
+)
+def test_truncated_arrays_and_strings_are_cut_back_and_closed(text, expected):
+    assert extract_json_object(text, KEYS) == (expected, ["truncated"])
+
+
+def test_repair_leaves_valid_json_alone():
+    text = '{"a": [1, {"b": "c,]"}], "d": null}'
+    assert repair_json(text) == (text, [])
+
+
+@pytest.mark.parametrize("text", ["", "no json here", "[1, 2, 3]", '"just a string"', "42", '{"score" 1}', "{ oops }"])
+def test_non_object_or_unrecoverable_input_returns_none(text):
+    assert extract_json_object(text, KEYS) == (None, [])
+
+
+def feed_all(chunks):
+    parser = IncrementalObjectParser()
+    fields = []
+    for chunk in chunks:
+        fields.extend(parser.feed(chunk))
+    return fields, parser
+
+
+def test_incremental_fields_match_the_one_shot_parse_at_every_split():
+    expected, _ = extract_json_object(REPLY, KEYS)
+    whole, _ = feed_all([REPLY])
+    assert dict(whole) == expected
+    for split in range(len(REPLY) + 1):
+        fields, parser = feed_all([REPLY[:split], REPLY[split:]])
+        assert fields == whole, split
+        assert parser.done
+        assert json.loads(parser.object_text) == expected
+
+
+def test_incremental_parse_one_character_at_a_time():
+    fields, parser = feed_all(REPLY)
+    assert dict(fields) == extract_json_object(REPLY, KEYS)[0]
+    assert [key for key, _ in fields] == list(KEYS)
+
+
+def test_incremental_parse_reports_fields_as_they_complete():
+    parser = IncrementalObjectParser()
+    assert parser.feed('{"score": 4') == []
+    assert parser.feed('2, "summary": "a, b"') == [("score", 42)]
+    assert parser.feed("}") == [("summary", "a, b")]
+    assert parser.done
+    assert parser.feed('{"score": 1}') == []
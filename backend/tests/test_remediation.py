@@ -0,0 +1,81 @@
+import itertools
+import random
+
+import pytest
+
+import remediation
+import scoring
+from benchmarks.topology import generate_topology
+from remediation import REMEDIATION_NODE_CONTROLS, RemediationRequest, RemediationSearch, optimize_remediation
+
+
+def request(size: int, seed: int, budget: float, **extra) -> RemediationRequest:
+    payload = generate_topology(size, seed=seed, coverage=0.4, type_mix={"pc": 0.5, "firewall": 0.2, "server": 0.3})
+    return RemediationRequest(**payload, budget=budget, **extra)
+
+
+def search_for(req: RemediationRequest) -> RemediationSearch:
+    rules = scoring.current_rules(quantum_mode=scoring.is_quantum_threat(req.threat_model))
+    columns = scoring.build_node_columns(req.compact_nodes(), rules)
+    costs = req.costs.model_dump()
+    gains = {rule.unless_any: -rule.points for rule in rules.active_global_rules(set())}
+    global_items = [
+        (name, costs[name], gains[fact])
+        for name, fact in remediation.REMEDIATION_GLOBAL_CONTROLS.items()
+        if fact in gains and not columns[fact].any()
+    ]
+    table = remediation.remediation_table(columns, rules)
+    return RemediationSearch(table, global_items, [costs[name] for name in REMEDIATION_NODE_CONTROLS])
+
+
+def plan_gain(search: RemediationSearch, chosen) -> int:
+    masks, total = {}, 0
+    for index in chosen:
+        item = search.items[index]
+        total += search.marginal(masks, item)
+        if item[1] >= 0:
+            masks[item[1]] = masks.get(item[1], 0) | item[2]
+    return total
+
+
+@pytest.mark.parametrize("seed", range(12))
+def test_plan_stays_within_budget(seed):
+    budget = random.Random(seed).choice([0, 150, 700, 6000, 50000])
+    result = optimize_remediation(request(12, seed, budget))
+    assert result["spent"] <= budget
+    assert sum(step["cost"] for step in result["plan"]) == result["spent"]
+    assert all(step["gain"] > 0 for step in result["plan"])
+    assert result["score_after"] >= result["score_before"]
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_branch_and_bound_matches_brute_force(seed):
+    budget = random.Random(seed).choice([100, 300, 1000, 30000])
+    req = request(3, seed, budget)
+    search = search_for(req)
+    assert len(search.items) <= 14
+    best = 0
+    for size in range(len(search.items) + 1):
+        for chosen in itertools.combinations(range(len(search.items)), size):
+            if sum(search.items[index][3] for index in chosen) <= budget:
+                best = max(best, plan_gain(search, chosen))
+    result = optimize_remediation(req)
+    assert result["method"] == "branch_and_bound"
+    assert result["raw_gain"] == best
+
+
+def test_firewall_classification_is_costed_apart_from_the_appliance():
+    nodes = [
+        {"id": "fw", "type": "firewall", "name": "Edge FW", "connections": ["pc"]},
+        {
+            "id": "pc", "type": "pc", "name": "PC", "antivirus": "EDR", "encryption": ["AES-256"], "vpn": "WireGuard",
+            "auth_type": "FIDO2 token", "security_policy": {"password_hashed": True, "backup_frequency": "daily"},
+        },
+    ]
+    threat = {"quantum_capability": "CRQC 2035+", "budget_usd": 10**6, "has_error_correction": True}
+    req = RemediationRequest(nodes=nodes, threat_model=threat, budget=1000, costs={"firewall_policy": 123})
+    plan = optimize_remediation(req)["plan"]
+    policy = [step for step in plan if step["control"] == "firewall_policy"]
+    assert [(step["node_id"], step["cost"]) for step in policy] == [("fw", 123.0)]
+    # A firewall node is present, so the appliance is not offered.
+    assert all(step["control"] != "firewall" for step in plan)
@@ -0,0 +1,86 @@
+import hashlib
+import json
+import os
+import shutil
+
+import pytest
+
+import scoring
+from rules import RuleBook
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RULES_PATH = os.path.join(BACKEND, "scoring_rules.json")
+# Recorded from the hard-coded scoring that the rule config replaced; ideal nodes are pinned by digest.
+with open(os.path.join(BACKEND, "tests", "baseline_scores.json"), encoding="utf-8") as handle:
+    BASELINE_CASES = json.load(handle)["cases"]
+
+
+def digest(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+
+def compact(nodes):
+    return [scoring.CompactNode.from_model(scoring.NetworkNode.model_validate(node)) for node in nodes]
+
+
+@pytest.mark.parametrize("case", BASELINE_CASES)
+def test_rule_config_reproduces_the_hard_coded_scoring(case, monkeypatch):
+    monkeypatch.setattr(scoring, "TOPOLOGY_RULES", False)
+    nodes = compact(case["nodes"])
+    profiles = {(p["fstec_only"], p["pd_sensitive"], p["quantum_mode"]) for p in case["profiles"]}
+    assert len(profiles) == 8
+    for expected in case["profiles"]:
+        metrics, ideal_nodes, _ = scoring.evaluate_security(
+            nodes, expected["fstec_only"], expected["pd_sensitive"], expected["quantum_mode"]
+        )
+        assert metrics["value"] == expected["value"]
+        assert metrics["control_details"] == expected["control_details"]
+        assert metrics["finding_codes"] == expected["finding_codes"]
+        assert digest(json.loads(json.dumps(ideal_nodes))) == expected["ideal_nodes"]
+
+
+def node(**fields):
+    return compact([{"id": "n1", "type": "pc", "name": "PC", **fields}])
+
+
+def write_rules(path, text):
+    previous = os.stat(path).st_mtime_ns if os.path.exists(path) else 0
+    with open(path, "w", encoding="utf-8") as handle:
+        handle.write(text)
+    # Coarse filesystem clocks can leave the mtime unchanged between two quick writes.
+    os.utime(path, ns=(previous + 1_000_000_000, previous + 1_000_000_000))
+
+
+def test_changed_file_is_reloaded_and_a_broken_one_keeps_the_previous_rules(tmp_path):
+    path = str(tmp_path / "rules.json")
+    shutil.copy(RULES_PATH, path)
+    book = RuleBook(path, poll_interval=1e-9)
+    version = book.version
+    assert book.maybe_reload() is False
+
+    with open(path, encoding="utf-8") as handle:
+        config = json.load(handle)
+    antivirus = next(rule for rule in config["node_rules"] if rule["id"] == "antivirus")
+    antivirus["fail"]["points"] = -30
+    write_rules(path, json.dumps(config))
+    assert book.maybe_reload() is True
+    assert book.version != version
+    rules = book.profile()
+    assert ("-30", "antivirus missing") in rules.outcome(rules.facts(node()[0])).details
+
+    reloaded = book.version
+    write_rules(path, "{ broken")
+    with pytest.raises(ValueError):
+        book.maybe_reload()
+    assert book.version == reloaded
+    assert book.maybe_reload() is False
+
+
+def test_invalid_rule_config_is_rejected_as_a_whole(tmp_path):
+    path = str(tmp_path / "rules.json")
+    with open(RULES_PATH, encoding="utf-8") as handle:
+        config = json.load(handle)
+    config["node_rules"][0]["check"] = "no_such_fact"
+    write_rules(path, json.dumps(config))
+    with pytest.raises(ValueError):
+        RuleBook(path)
@@ -0,0 +1,82 @@
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+import scoring
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Scores recorded from the hard-coded scoring that predates the rule config and the topology rules.
+with open(os.path.join(BACKEND, "tests", "baseline_scores.json"), encoding="utf-8") as handle:
+    BASELINE_CASES = json.load(handle)["cases"]
+
+
+def sample_request() -> scoring.AnalysisRequest:
+    return scoring.AnalysisRequest.model_validate({
+        "nodes": [
+            {"id": "a", "type": "pc", "name": "A", "connections": ["b"]},
+            {"id": "b", "type": "server", "name": "B", "antivirus": "EDR"},
+        ],
+        "threat_model": {"quantum_capability": "CRQC 2035+", "budget_usd": 1, "has_error_correction": True},
+    })
+
+
+def test_import_has_no_side_effects(tmp_path):
+    code = (
+        "import sys, scoring\n"
+        "print(sorted(name for name in ('main', 'openai', 'jobs', 'history', 'cache') if name in sys.modules))\n"
+        "print(scoring._rule_book is None)\n"
+    )
+    env = {**os.environ, "PYTHONPATH": BACKEND}
+    output = subprocess.run(
+        [sys.executable, "-c", code], cwd=tmp_path, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    assert output.split() == ["[]", "True"]
+    assert os.listdir(tmp_path) == []
+
+
+def test_score_in_worker_matches_in_process_scoring():
+    request = sample_request()
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(1, mp_context=context) as executor:
+        local, result = executor.submit(
+            scoring.score_in_worker, request.compact_nodes(), request.threat_model, False, True
+        ).result()
+    assert local == scoring.score_request(request)
+    assert result == scoring.local_result(request.compact_nodes(), request.threat_model, local)
+
+
+def compact(nodes):
+    return [scoring.CompactNode.from_model(scoring.NetworkNode.model_validate(node)) for node in nodes]
+
+
+@pytest.mark.parametrize("case", BASELINE_CASES)
+def test_scores_match_baseline_without_topology_rules(case, monkeypatch):
+    monkeypatch.setattr(scoring, "TOPOLOGY_RULES", False)
+    nodes = compact(case["nodes"])
+    for expected in case["profiles"]:
+        flags = (expected["fstec_only"], expected["pd_sensitive"], expected["quantum_mode"])
+        for evaluate in (scoring.evaluate_security, scoring.evaluate_security_columnar, scoring.evaluate_security_grouped):
+            metrics = evaluate(nodes, *flags)[0]
+            assert (metrics["value"], metrics["finding_codes"]) == (expected["value"], expected["finding_codes"])
+            assert metrics["topology"]["adjustment"] == 0.0
+
+
+def test_topology_rules_apply_only_when_enabled(monkeypatch):
+    # Ten unsegmented workstations in a chain: flat, and every inner node is a single point of failure.
+    nodes = compact([
+        {"id": f"n{index}", "type": "pc", "name": f"PC {index}", "connections": [f"n{index + 1}"] if index < 9 else []}
+        for index in range(10)
+    ])
+    monkeypatch.setattr(scoring, "TOPOLOGY_RULES", False)
+    disabled = scoring.evaluate_security(nodes)[0]
+    monkeypatch.setattr(scoring, "TOPOLOGY_RULES", True)
+    enabled = scoring.evaluate_security(nodes)[0]
+    assert {"flat_network", "single_points_of_failure"} <= set(enabled["finding_codes"])
+    assert not {"flat_network", "single_points_of_failure"} & set(disabled["finding_codes"])
+    assert enabled["topology"]["adjustment"] == -9.0
+    assert disabled["topology"]["adjustment"] == 0.0
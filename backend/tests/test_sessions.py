@@ -0,0 +1,81 @@
+import random
+
+import pytest
+
+import scoring
+from benchmarks.topology import generate_topology
+from sessions import SessionStore, TopologySession
+
+TYPE_MIX = {"pc": 0.5, "firewall": 0.1, "server": 0.3, "router": 0.1}
+THREAT = scoring.ThreatModel(quantum_capability="none", budget_usd=1, has_error_correction=False)
+
+
+def reference(session: TopologySession) -> dict:
+    request = session.to_request()
+    model = request.threat_model
+    return scoring.evaluate_security(
+        request.compact_nodes(), model.is_fstec_compliant, model.has_large_pd_storage, scoring.is_quantum_threat(model)
+    )[0]
+
+
+def edit_randomly(session: TopologySession, rnd: random.Random, pool: list, step: int) -> None:
+    ids = list(session.nodes)
+    roll = rnd.random()
+    if roll < 0.3 or len(ids) < 2:
+        node = dict(rnd.choice(pool), id=f"x{step}")
+        node["connections"] = rnd.sample(ids + ["ghost"], min(3, len(ids)))
+        session.add_node(scoring.NetworkNode.model_validate(node))
+    elif roll < 0.45:
+        session.remove_node(rnd.choice(ids))
+    elif roll < 0.65:
+        node = dict(rnd.choice(pool), id=rnd.choice(ids))
+        node["connections"] = rnd.sample(ids, min(2, len(ids)))
+        session.update_node(scoring.NetworkNode.model_validate(node))
+    elif roll < 0.85:
+        session.add_connection(*rnd.sample(ids, 2))
+    else:
+        session.remove_connection(*rnd.sample(ids, 2))
+
+
+@pytest.mark.parametrize("topology_rules", [False, True])
+@pytest.mark.parametrize("seed", range(8))
+def test_edit_sequence_matches_full_evaluation(seed, topology_rules, monkeypatch):
+    monkeypatch.setattr(scoring, "TOPOLOGY_RULES", topology_rules)
+    rnd = random.Random(seed)
+    payload = generate_topology(12, seed=seed, coverage=0.5, type_mix=TYPE_MIX, quantum=seed % 2 == 0, fstec=seed % 3 == 0)
+    pool = generate_topology(30, seed=seed + 1000, coverage=0.5, type_mix=TYPE_MIX)["nodes"]
+    request = scoring.AnalysisRequest.model_validate(payload)
+    session = TopologySession(request.threat_model, topology_rules)
+    for node in request.compact_nodes():
+        session.add_node(node)
+    for step in range(40):
+        edit_randomly(session, rnd, pool, step)
+        expected, actual = reference(session), session.metrics(with_details=True)
+        assert (actual["value"], actual["finding_codes"]) == (expected["value"], expected["finding_codes"]), step
+        assert sorted(actual["control_details"]) == sorted(expected["control_details"]), step
+
+
+def test_removing_every_node_gives_the_empty_score():
+    session = TopologySession(THREAT)
+    session.add_node(scoring.NetworkNode(id="a", type="pc", name="A", connections=["b"]))
+    session.add_node(scoring.NetworkNode(id="b", type="server", name="B"))
+    session.remove_node("a")
+    session.remove_node("b")
+    assert session.metrics() == scoring.evaluate_security([])[0]
+
+
+def test_store_evicts_the_least_recently_used_and_expired_sessions(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr("sessions.time.monotonic", lambda: now[0])
+    store = SessionStore(ttl_seconds=10, max_sessions=2)
+    first = store.add(TopologySession(THREAT))
+    second = store.add(TopologySession(THREAT))
+    now[0] = 5
+    assert store.get(first) is not None
+    store.add(TopologySession(THREAT))
+    assert store.get(second) is None and len(store) == 2
+    now[0] = 14
+    assert store.get(first) is not None
+    now[0] = 30
+    assert store.get(first) is None and len(store) == 0
+    assert store.remove(first) is False
@@ -0,0 +1,21 @@
+import numpy as np
+
+from similarity import SimilarityIndex
+
+
+def test_nearest_only_matches_the_same_group():
+    index = SimilarityIndex(2, capacity=4)
+    index.add("a", np.array([0.0, 0.0]), "site-a payload", group="site-a")
+    index.add("b", np.array([5.0, 5.0]), "site-b payload", group="site-b")
+    assert index.nearest(np.array([0.1, 0.0]), "site-b")[1:] == ("b", "site-b payload")
+    assert index.nearest(np.array([0.1, 0.0]), "site-c") is None
+
+
+def test_same_key_is_kept_per_group_and_oldest_entry_is_overwritten():
+    index = SimilarityIndex(1, capacity=2)
+    index.add("k", np.array([0.0]), 1, group="a")
+    index.add("k", np.array([0.0]), 2, group="b")
+    assert index.nearest(np.array([0.0]), "a")[2] == 1
+    index.add("k2", np.array([1.0]), 3, group="a")
+    assert index.nearest(np.array([0.0]), "a")[1:] == ("k2", 3)
+    assert index.stats()["entries"] == 2
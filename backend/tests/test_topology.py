@@ -0,0 +1,91 @@
+import os
+
+import numpy as np
+import pytest
+
+from rules import RuleBook
+from topology import TopologyAnalysis
+
+RULES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scoring_rules.json")
+SEGMENTATION = "firewalls split the network into small segments"
+
+
+def graph(size, edges, barriers=()):
+    mask = np.zeros(size, dtype=bool)
+    mask[list(barriers)] = True
+    return TopologyAnalysis([f"v{i}" for i in range(size)], np.array(edges, dtype=np.int64).reshape(-1, 2), mask)
+
+
+@pytest.fixture(scope="module")
+def rules():
+    return RuleBook(RULES_PATH).profile()
+
+
+def test_isolated_nodes_get_no_segmentation_bonus(rules):
+    summary = graph(10, []).summary(centrality=False)
+    assert summary["max_blast_ratio"] == 0.0
+    assert summary["segmented_ratio"] == 0.0
+    _, details, _ = rules.topology_outcome(summary)
+    assert not any(SEGMENTATION in detail for detail in details)
+
+
+def test_firewall_split_network_gets_segmentation_bonus(rules):
+    # A firewall (v0) in front of four chains of three nodes each.
+    edges = []
+    for start in (1, 4, 7, 10):
+        edges += [(0, start), (start, start + 1), (start + 1, start + 2)]
+    summary = graph(13, edges, barriers=[0]).summary(centrality=False)
+    assert summary["segments"] == 4
+    assert summary["segmented_ratio"] == 1.0
+    _, details, _ = rules.topology_outcome(summary)
+    assert any(SEGMENTATION in detail for detail in details)
+
+
+def test_components_and_isolated_vertices():
+    # Two triangles, a single edge and an isolated vertex.
+    analysis = graph(9, [(0, 1), (1, 2), (2, 0), (3, 4), (4, 5), (5, 3), (6, 7)])
+    labels, sizes = analysis.components
+    assert labels.tolist() == [0, 0, 0, 1, 1, 1, 2, 2, 3]
+    assert sizes.tolist() == [3, 3, 2, 1]
+    summary = analysis.summary(centrality=False)
+    assert summary["components"] == 4
+    assert summary["isolated"] == 1
+    assert "max_betweenness" not in summary
+
+
+def test_components_are_joined_through_barriers():
+    # v2 is a firewall between two pairs; it splits the segments but not the component.
+    analysis = graph(5, [(0, 1), (1, 2), (2, 3), (3, 4)], barriers=[2])
+    assert analysis.components[1].tolist() == [5]
+    segment_labels, segment_sizes = analysis.segments
+    assert segment_labels.tolist() == [0, 0, -1, 1, 1]
+    assert segment_sizes.tolist() == [2, 2]
+    assert analysis.blast_radius.tolist() == [1, 1, 4, 1, 1]
+
+
+def test_articulation_points_and_bridges():
+    # Triangle 0-1-2 with a tail 2-3-4 and a second triangle 4-5-6.
+    analysis = graph(7, [(0, 1), (1, 2), (2, 0), (2, 3), (3, 4), (4, 5), (5, 6), (6, 4)])
+    articulation, _ = analysis.cut_structure
+    assert np.flatnonzero(articulation).tolist() == [2, 3, 4]
+    assert sorted(analysis.bridge_ids()) == [("v2", "v3"), ("v3", "v4")]
+
+
+def test_cycle_has_no_cut_vertices_and_parallel_edges_are_not_bridges():
+    cycle = graph(4, [(0, 1), (1, 2), (2, 3), (3, 0)])
+    assert not cycle.cut_structure[0].any()
+    assert cycle.bridge_ids() == []
+    doubled = graph(2, [(0, 1), (1, 0)])
+    assert doubled.bridge_ids() == []
+
+
+def test_normalized_betweenness():
+    # Path v0-v1-v2-v3: v1 lies on the shortest paths v0-v2 and v0-v3, out of 3 pairs not involving it.
+    path = graph(4, [(0, 1), (1, 2), (2, 3)])
+    assert path.betweenness.tolist() == pytest.approx([0.0, 2 / 3, 2 / 3, 0.0])
+    # Diamond v0-{v1,v2}-v3: v1 carries half of the two shortest paths v0-v3.
+    diamond = graph(4, [(0, 1), (0, 2), (1, 3), (2, 3)])
+    assert diamond.betweenness.tolist() == pytest.approx([1 / 6, 1 / 6, 1 / 6, 1 / 6])
+    # Star: the centre is on every path between leaves.
+    star = graph(5, [(0, 1), (0, 2), (0, 3), (0, 4)])
+    assert star.betweenness.tolist() == pytest.approx([1.0, 0.0, 0.0, 0.0, 0.0])
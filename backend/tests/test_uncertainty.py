@@ -0,0 +1,99 @@
+import pytest
+
+import scoring
+from benchmarks.topology import generate_topology
+from uncertainty import UNCERTAINTY_DEFAULT_PRIORS, UncertaintyRequest, analyze_uncertainty
+
+THREAT = {"quantum_capability": "none", "budget_usd": 1, "has_error_correction": False}
+NO_DEFAULTS = {path: None for path in UNCERTAINTY_DEFAULT_PRIORS}
+# Inside 0..100 after the global rules, so no sample is clamped.
+FIREWALL = {"type": "firewall", "firewall_type": "NGFW"}
+
+
+def hardened(node_id: str, **fields) -> dict:
+    return {
+        "id": node_id, "type": "pc", "name": node_id.upper(), "os": "Linux", "antivirus": "EDR",
+        "vpn": "WireGuard", "auth_type": "FIDO2 token", "weight": 5.0,
+        "security_policy": {"password_hashed": True, "backup_frequency": "daily"}, **fields,
+    }
+
+
+def test_degenerate_priors_give_the_point_score():
+    # Every default prior pinned to one value: each sample is the score of the topology with those values filled in.
+    pinned = {"weight": 8.0, "auth_type": "otp", "security_policy.password_hashed": False,
+              "security_policy.backup_frequency": "weekly"}
+    nodes = [{"id": "a", "type": "pc", "name": "A", "connections": ["b"]}, {"id": "b", "type": "server", "name": "B"}]
+    request = UncertaintyRequest(
+        nodes=nodes, threat_model=THREAT, samples=200,
+        priors={path: {"values": [value]} for path, value in pinned.items()},
+    )
+    result = analyze_uncertainty(request)
+    filled = [
+        {**node, "weight": 8.0, "auth_type": "otp", "security_policy": {"password_hashed": False, "backup_frequency": "weekly"}}
+        for node in nodes
+    ]
+    point = scoring.score_request(scoring.AnalysisRequest(nodes=filled, threat_model=THREAT))[0]["value"]
+    distribution = result["distribution"]
+    assert distribution["std"] == 0
+    assert distribution["min"] == distribution["max"] == distribution["mean"]
+    assert round(distribution["mean"]) == point
+    assert result["nodes"] == []
+
+
+def test_known_topology_has_no_uncertainty():
+    request = UncertaintyRequest(nodes=[hardened("a"), hardened("fw", **FIREWALL)], threat_model=THREAT, samples=100)
+    result = analyze_uncertainty(request)
+    assert result["uncertain_nodes"] == 0
+    assert result["distribution"]["std"] == 0
+    assert round(result["distribution"]["mean"]) == result["baseline"]
+
+
+@pytest.mark.parametrize("seed", range(6))
+def test_intervals_are_bounded_and_ordered(seed):
+    payload = generate_topology(25, seed=seed, coverage=0.3, quantum=seed % 2 == 1)
+    result = analyze_uncertainty(UncertaintyRequest(**payload, samples=2000, seed=seed))
+    distribution = result["distribution"]
+    percentiles = [distribution["percentiles"][f"p{q}"] for q in (5, 25, 50, 75, 95)]
+    assert 0 <= distribution["min"] <= percentiles[0]
+    assert percentiles == sorted(percentiles)
+    assert percentiles[-1] <= distribution["max"] <= 100
+    assert distribution["min"] <= distribution["mean"] <= distribution["max"]
+    assert sum(distribution["histogram"]) == 2000
+    assert all(0 <= node["variance_share"] <= 1 for node in result["nodes"])
+    assert 0 <= result["first_order_total"] <= 1.05
+
+
+def test_same_seed_gives_the_same_distribution():
+    payload = generate_topology(15, seed=3, coverage=0.3)
+    first = analyze_uncertainty(UncertaintyRequest(**payload, samples=500, seed=7))
+    assert analyze_uncertainty(UncertaintyRequest(**payload, samples=500, seed=7)) == first
+
+
+def test_single_uncertain_attribute_takes_the_whole_variance():
+    nodes = [hardened("a"), hardened("b", antivirus=None), hardened("c"), hardened("fw", **FIREWALL)]
+    request = UncertaintyRequest(
+        nodes=nodes, threat_model=THREAT, samples=4000, priors=NO_DEFAULTS,
+        node_priors={"b": {"antivirus": {"values": ["EDR", None]}}},
+    )
+    result = analyze_uncertainty(request)
+    assert result["uncertain_nodes"] == 1
+    assert [node["id"] for node in result["nodes"]] == ["b"]
+    assert result["nodes"][0]["variance_share"] == pytest.approx(1.0, abs=0.01)
+    assert [entry["attribute"] for entry in result["attributes"]] == ["antivirus"]
+
+
+def test_sensitivity_ranks_the_larger_effect_first():
+    # Antivirus on "b" moves the score by more points than the backup schedule on "c".
+    nodes = [hardened("a"), hardened("b", antivirus=None), hardened("c"), hardened("fw", **FIREWALL)]
+    request = UncertaintyRequest(
+        nodes=nodes, threat_model=THREAT, samples=4000, priors=NO_DEFAULTS,
+        node_priors={
+            "b": {"antivirus": {"values": ["EDR", None]}},
+            "c": {"security_policy.backup_frequency": {"values": ["daily", "weekly"]}},
+        },
+    )
+    result = analyze_uncertainty(request)
+    ranked = result["nodes"]
+    assert [node["id"] for node in ranked] == ["b", "c"]
+    assert ranked[0]["variance_share"] > 10 * ranked[1]["variance_share"] > 0
+    assert [entry["attribute"] for entry in result["attributes"]] == ["antivirus", "security_policy.backup_frequency"]
@@ -0,0 +1,326 @@
+import zlib
+from functools import cached_property
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+# Keys of ``TopologyAnalysis.summary()`` that scoring rules may test.
+SUMMARY_METRICS = (
+    "nodes",
+    "edges",
+    "components",
+    "largest_component_ratio",
+    "isolated",
+    "articulation_points",
+    "articulation_ratio",
+    "bridges",
+    "segments",
+    "largest_segment_ratio",
+    "segmented_ratio",
+    "max_blast_ratio",
+    "mean_blast_ratio",
+    "max_degree",
+    "mean_degree",
+    "max_betweenness",
+)
+
+
+class TopologyAnalysis:
+    """Structural metrics of an undirected graph given as an ``(m, 2)`` edge array.
+
+    The graph is stored once as a symmetric CSR adjacency. Vertices flagged in
+    ``barriers`` (firewalls) split the graph into segments: lateral movement
+    inside a segment is unrestricted, crossing a barrier is not. Segments,
+    articulation points and bridges are linear-time traversals, components
+    are the segments joined through the barrier edges;
+    betweenness is Brandes' algorithm run from ``betweenness_samples`` pivots
+    (all vertices on small graphs), with each BFS level expanded as array
+    operations. Pivots are the vertices with the smallest CRC32 of their id,
+    so results do not depend on the input order.
+    """
+
+    def __init__(
+        self,
+        ids: Sequence[str],
+        edges: np.ndarray,
+        barriers: np.ndarray | None = None,
+        betweenness_samples: int = 32,
+    ):
+        self.ids = list(ids)
+        self.size = size = len(self.ids)
+        self.edges = edges.reshape(-1, 2).astype(np.int64)
+        self.barriers = np.zeros(size, dtype=bool) if barriers is None else barriers.astype(bool)
+        self.betweenness_samples = betweenness_samples
+        sources = np.concatenate([self.edges[:, 0], self.edges[:, 1]])
+        targets = np.concatenate([self.edges[:, 1], self.edges[:, 0]])
+        order = np.argsort(sources, kind="stable")
+        self.indices = targets[order]
+        self.degree = np.bincount(sources, minlength=size).astype(np.int64)
+        self.indptr = np.zeros(size + 1, dtype=np.int64)
+        np.cumsum(self.degree, out=self.indptr[1:])
+        self._indptr = self.indptr.tolist()
+        self._indices = self.indices.tolist()
+
+    def _label(self, skip: List[bool]) -> Tuple[np.ndarray, np.ndarray]:
+        """Labels the components of the graph without the ``skip`` vertices (label -1); returns labels and sizes."""
+        indptr, indices = self._indptr, self._indices
+        labels = [-1] * self.size
+        sizes: List[int] = []
+        for start in range(self.size):
+            if labels[start] != -1 or skip[start]:
+                continue
+            label = len(sizes)
+            labels[start] = label
+            stack = [start]
+            count = 0
+            while stack:
+                vertex = stack.pop()
+                count += 1
+                for offset in range(indptr[vertex], indptr[vertex + 1]):
+                    neighbour = indices[offset]
+                    if labels[neighbour] == -1 and not skip[neighbour]:
+                        labels[neighbour] = label
+                        stack.append(neighbour)
+            sizes.append(count)
+        return np.array(labels, dtype=np.int64), np.array(sizes, dtype=np.int64)
+
+    @cached_property
+    def components(self) -> Tuple[np.ndarray, np.ndarray]:
+        segment_labels, segment_sizes = self.segments
+        barrier_ids = np.flatnonzero(self.barriers)
+        if not len(barrier_ids):
+            return segment_labels, segment_sizes
+        # Union-find over the segments (0..s-1) and the barriers (s..), merged along barrier edges only.
+        groups = segment_labels.copy()
+        groups[barrier_ids] = len(segment_sizes) + np.arange(len(barrier_ids))
+        parent = list(range(len(segment_sizes) + len(barrier_ids)))
+
+        def find(item: int) -> int:
+            while parent[item] != item:
+                parent[item] = parent[parent[item]]
+                item = parent[item]
+            return item
+
+        crossing = self.barriers[self.edges[:, 0]] | self.barriers[self.edges[:, 1]]
+        for a, b in groups[self.edges[crossing]].tolist():
+            root_a, root_b = find(a), find(b)
+            if root_a != root_b:
+                parent[root_b] = root_a
+        roots = np.array([find(item) for item in range(len(parent))], dtype=np.int64)[groups]
+        # Labels are numbered by their first vertex, as a traversal in vertex order would number them.
+        _, first, inverse = np.unique(roots, return_index=True, return_inverse=True)
+        rank = np.empty(len(first), dtype=np.int64)
+        rank[np.argsort(first, kind="stable")] = np.arange(len(first))
+        labels = rank[inverse.reshape(-1)]
+        return labels, np.bincount(labels, minlength=len(first)).astype(np.int64)
+
+    @cached_property
+    def segments(self) -> Tuple[np.ndarray, np.ndarray]:
+        return self._label(self.barriers.tolist())
+
+    @cached_property
+    def segmented(self) -> np.ndarray:
+        """Mask of the vertices in components that barriers split into two or more segments."""
+        component_labels, component_sizes = self.components
+        segment_labels, _ = self.segments
+        inside = segment_labels >= 0
+        pairs = np.unique(np.stack([component_labels[inside], segment_labels[inside]]), axis=1)
+        return np.bincount(pairs[0], minlength=len(component_sizes))[component_labels] >= 2
+
+    @cached_property
+    def cut_structure(self) -> Tuple[np.ndarray, List[Tuple[int, int]]]:
+        """Articulation points (as a bool mask) and bridges, by an iterative Tarjan DFS."""
+        indptr, indices = self._indptr, self._indices
+        order = [-1] * self.size
+        low = [0] * self.size
+        articulation = [False] * self.size
+        bridges: List[Tuple[int, int]] = []
+        counter = 0
+        for root in range(self.size):
+            if order[root] != -1:
+                continue
+            order[root] = low[root] = counter
+            counter += 1
+            root_children = 0
+            # Frames are [vertex, parent, next adjacency offset, parent edge skipped]; the edge to
+            # the parent is skipped once, so a parallel edge still counts as a back edge.
+            stack = [[root, -1, indptr[root], False]]
+            while stack:
+                frame = stack[-1]
+                vertex, parent, offset, parent_skipped = frame
+                if offset < indptr[vertex + 1]:
+                    frame[2] = offset + 1
+                    neighbour = indices[offset]
+                    if neighbour == parent and not parent_skipped:
+                        frame[3] = True
+                        continue
+                    if order[neighbour] == -1:
+                        order[neighbour] = low[neighbour] = counter
+                        counter += 1
+                        stack.append([neighbour, vertex, indptr[neighbour], False])
+                    elif order[neighbour] < low[vertex]:
+                        low[vertex] = order[neighbour]
+                    continue
+                stack.pop()
+                if parent == -1:
+                    continue
+                if low[vertex] < low[parent]:
+                    low[parent] = low[vertex]
+                if low[vertex] > order[parent]:
+                    bridges.append((parent, vertex) if parent < vertex else (vertex, parent))
+                if parent == root:
+                    root_children += 1
+                elif low[vertex] >= order[parent]:
+                    articulation[parent] = True
+            if root_children > 1:
+                articulation[root] = True
+        return np.array(articulation, dtype=bool), bridges
+
+    @cached_property
+    def blast_radius(self) -> np.ndarray:
+        """Vertices an attacker reaches from each vertex without crossing a barrier.
+
+        A regular vertex reaches the rest of its segment; a compromised barrier
+        opens every segment it is attached to.
+        """
+        labels, sizes = self.segments
+        radius = np.zeros(self.size, dtype=np.int64)
+        inside = labels >= 0
+        radius[inside] = sizes[labels[inside]] - 1
+        barrier_ids = np.flatnonzero(self.barriers)
+        if len(barrier_ids):
+            for vertex in barrier_ids.tolist():
+                attached = labels[self.indices[self.indptr[vertex]:self.indptr[vertex + 1]]]
+                radius[vertex] = int(sizes[np.unique(attached[attached >= 0])].sum())
+        return radius
+
+    def pivots(self) -> np.ndarray:
+        if self.size <= self.betweenness_samples:
+            return np.arange(self.size)
+        keys = np.fromiter((zlib.crc32(node_id.encode("utf-8")) for node_id in self.ids), dtype=np.int64, count=self.size)
+        return np.sort(np.argsort(keys, kind="stable")[:self.betweenness_samples])
+
+    @cached_property
+    def betweenness(self) -> np.ndarray:
+        """Normalized betweenness centrality, estimated from the pivot BFS trees."""
+        size = self.size
+        centrality = np.zeros(size, dtype=np.float64)
+        if size < 3 or not len(self.indices):
+            return centrality
+        indptr, indices = self.indptr, self.indices
+        pivots = self.pivots()
+        for source in pivots.tolist():
+            distance = np.full(size, -1, dtype=np.int64)
+            sigma = np.zeros(size, dtype=np.float64)
+            distance[source] = 0
+            sigma[source] = 1.0
+            frontier = np.array([source], dtype=np.int64)
+            levels: List[Tuple[np.ndarray, np.ndarray]] = []
+            depth = 0
+            while len(frontier):
+                starts = indptr[frontier]
+                counts = indptr[frontier + 1] - starts
+                total = int(counts.sum())
+                if not total:
+                    break
+                # Adjacency offsets of all frontier vertices, concatenated.
+                offsets = np.arange(total) + np.repeat(starts - (np.cumsum(counts) - counts), counts)
+                parents = np.repeat(frontier, counts)
+                children = indices[offsets]
+                unseen = distance[children] == -1
+                distance[children[unseen]] = depth + 1
+                tree = distance[children] == depth + 1
+                parents, children = parents[tree], children[tree]
+                # Sums are taken over the level only, not over a full-size bincount per level.
+                frontier, slots = np.unique(children, return_inverse=True)
+                sigma[frontier] = np.bincount(slots, weights=sigma[parents])
+                levels.append((parents, children))
+                depth += 1
+            delta = np.zeros(size, dtype=np.float64)
+            for parents, children in reversed(levels):
+                owners, slots = np.unique(parents, return_inverse=True)
+                delta[owners] += np.bincount(slots, weights=sigma[parents] / sigma[children] * (1.0 + delta[children]))
+            delta[source] = 0.0
+            centrality += delta
+        # Every unordered pair is counted from both ends; scale the sample up to all sources.
+        return centrality * (size / len(pivots)) / ((size - 1) * (size - 2))
+
+    def top(self, values: np.ndarray, limit: int, key: str) -> List[Dict[str, Any]]:
+        if not self.size or limit <= 0:
+            return []
+        order = np.lexsort((np.arange(self.size), -values))[:limit]
+        return [
+            {"id": self.ids[index], key: round(values[index].item(), 4)}
+            for index in order.tolist()
+            if values[index] > 0
+        ]
+
+    def summary(self, top: int = 5, centrality: bool = True) -> Dict[str, Any]:
+        """Graph-level metrics and the ``top`` nodes by betweenness and blast radius.
+
+        With ``centrality=False`` the betweenness entries are left out, which
+        keeps the summary linear-time; choke points are then ranked by degree.
+        """
+        size = self.size
+        if not size:
+            return {name: 0 for name in SUMMARY_METRICS if centrality or name != "max_betweenness"}
+        component_labels, component_sizes = self.components
+        segment_labels, segment_sizes = self.segments
+        articulation, bridges = self.cut_structure
+        blast = self.blast_radius
+        rank = self.betweenness + 1e-12 if centrality else self.degree
+        others = max(size - 1, 1)
+        inside = segment_labels >= 0
+        summary = {
+            "nodes": size,
+            "edges": len(self.edges),
+            "components": len(component_sizes),
+            "largest_component_ratio": round(float(component_sizes.max()) / size, 4),
+            "isolated": int((self.degree == 0).sum()),
+            "articulation_points": int(articulation.sum()),
+            "articulation_ratio": round(float(articulation.sum()) / size, 4),
+            "bridges": len(bridges),
+            "segments": len(segment_sizes),
+            "largest_segment_ratio": round(float(segment_sizes.max(initial=0)) / size, 4),
+            "segmented_ratio": round(float(self.segmented.sum()) / size, 4),
+            "max_blast_ratio": round(float(blast[inside].max(initial=0)) / others, 4),
+            "mean_blast_ratio": round(float(blast[inside].mean()) / others, 4) if inside.any() else 0.0,
+            "max_degree": int(self.degree.max()),
+            "mean_degree": round(float(self.degree.mean()), 2),
+            "choke_points": [item["id"] for item in self.top(np.where(articulation, rank, 0), top, "rank")],
+            "top_blast_radius": self.top(blast, top, "blast_radius"),
+        }
+        if centrality:
+            summary["max_betweenness"] = round(float(self.betweenness.max()), 4)
+            summary["betweenness_sampled"] = len(self.pivots()) < size
+            summary["top_betweenness"] = self.top(self.betweenness, top, "betweenness")
+        return summary
+
+    def node_metrics(self) -> List[Dict[str, Any]]:
+        component_labels, _ = self.components
+        segment_labels, _ = self.segments
+        articulation, _ = self.cut_structure
+        rows = zip(
+            self.ids,
+            self.degree.tolist(),
+            np.round(self.betweenness, 6).tolist(),
+            self.blast_radius.tolist(),
+            articulation.tolist(),
+            component_labels.tolist(),
+            segment_labels.tolist(),
+        )
+        return [
+            {
+                "id": node_id,
+                "degree": degree,
+                "betweenness": betweenness,
+                "blast_radius": blast,
+                "articulation_point": cut,
+                "component": component,
+                "segment": segment if segment >= 0 else None,
+            }
+            for node_id, degree, betweenness, blast, cut, component, segment in rows
+        ]
+
+    def bridge_ids(self) -> List[Tuple[str, str]]:
+        return [(self.ids[a], self.ids[b]) for a, b in self.cut_structure[1]]
@@ -0,0 +1,414 @@
+import itertools
+import math
+import os
+from typing import Any, Dict, List, NamedTuple, Tuple
+
+import numpy as np
+from pydantic import BaseModel, Field, field_validator
+
+from importers import describe_error
+from rules import RuleSet
+from scoring import (
+    AnalysisRequest,
+    CompactNode,
+    NetworkNode,
+    apply_global_controls,
+    current_rules,
+    is_quantum_threat,
+    score_request,
+    scoring_fingerprint,
+)
+
+
+UNCERTAINTY_PATHS = (
+    "weight",
+    "os",
+    "antivirus",
+    "vpn",
+    "auth_type",
+    "firewall_type",
+    "access_level",
+    "security_policy.password_hashed",
+    "security_policy.backup_frequency",
+    "personal_data.enabled",
+)
+# Sampled on every node where the attribute is missing, unless the request overrides or disables them.
+UNCERTAINTY_DEFAULT_PRIORS = {
+    "weight": {"values": [2.0, 5.0, 8.0], "probabilities": [0.25, 0.5, 0.25]},
+    "auth_type": {"values": ["password", "otp"], "probabilities": [0.7, 0.3]},
+    "security_policy.password_hashed": {"values": [True, False]},
+    "security_policy.backup_frequency": {"values": ["none", "monthly", "weekly", "daily"]},
+}
+UNCERTAINTY_MAX_SAMPLES = int(os.getenv("UNCERTAINTY_MAX_SAMPLES", "100000"))
+# Upper bound on the (sample, input) cells drawn at once; samples are processed in chunks below it.
+UNCERTAINTY_CHUNK_CELLS = int(os.getenv("UNCERTAINTY_CHUNK_CELLS", "1000000"))
+# Upper bound on the value combinations tabulated for one node, the product of its priors' sizes.
+UNCERTAINTY_MAX_TABLE_CELLS = int(os.getenv("UNCERTAINTY_MAX_TABLE_CELLS", "16384"))
+UNCERTAINTY_PERCENTILES = (5, 25, 50, 75, 95)
+
+
+def check_uncertainty_path(path: str) -> str:
+    if path not in UNCERTAINTY_PATHS:
+        raise ValueError(f"Unsupported attribute {path}; expected one of {', '.join(UNCERTAINTY_PATHS)}")
+    return path
+
+
+class AttributePrior(BaseModel):
+    """Categorical distribution of an attribute; ``probabilities`` default to uniform."""
+
+    values: List[Any] = Field(min_length=1, max_length=64)
+    probabilities: List[float] | None = None
+
+    @field_validator("probabilities")
+    @classmethod
+    def check_probabilities(cls, probabilities: List[float] | None, info: Any) -> List[float] | None:
+        if probabilities is None:
+            return None
+        if len(probabilities) != len(info.data.get("values", ())):
+            raise ValueError("probabilities must have one entry per value")
+        if any(p < 0 for p in probabilities) or sum(probabilities) <= 0:
+            raise ValueError("probabilities must be non-negative with a positive sum")
+        return probabilities
+
+
+class UncertaintyRequest(AnalysisRequest):
+    samples: int = Field(default=10000, ge=100, le=UNCERTAINTY_MAX_SAMPLES)
+    seed: int = 0
+    # Merged over UNCERTAINTY_DEFAULT_PRIORS; null disables a default.
+    priors: Dict[str, AttributePrior | None] = Field(default_factory=dict)
+    # Per node id; these attributes are sampled even where the node sets them.
+    node_priors: Dict[str, Dict[str, AttributePrior]] = Field(default_factory=dict)
+    top: int = Field(default=10, ge=1, le=1000)
+
+    @field_validator("priors")
+    @classmethod
+    def check_priors(cls, priors: Dict[str, AttributePrior | None]) -> Dict[str, AttributePrior | None]:
+        for path in priors:
+            check_uncertainty_path(path)
+        return priors
+
+    @field_validator("node_priors")
+    @classmethod
+    def check_node_priors(cls, node_priors: Dict[str, Dict[str, AttributePrior]]) -> Dict[str, Dict[str, AttributePrior]]:
+        for priors in node_priors.values():
+            for path in priors:
+                check_uncertainty_path(path)
+        return node_priors
+
+
+class CategoricalPrior(NamedTuple):
+    values: Tuple[Any, ...]
+    cumulative: Tuple[float, ...]
+
+
+def categorical_prior(path: str, prior: AttributePrior) -> CategoricalPrior:
+    """``prior`` with each value validated as the node attribute at ``path``."""
+    field, _, attribute = path.partition(".")
+    values = []
+    for value in prior.values:
+        record = {"id": "prior", "type": "prior", "name": "prior", field: {attribute: value} if attribute else value}
+        try:
+            values.append(CompactNode.from_model(NetworkNode.model_validate(record)).get(path))
+        except ValueError as e:
+            raise ValueError(f"Invalid value {value!r} for {path}: {describe_error(e)}") from e
+    weights = np.array(prior.probabilities or [1.0] * len(values), dtype=np.float64)
+    return CategoricalPrior(tuple(values), tuple(np.cumsum(weights / weights.sum()).tolist()))
+
+
+class ConditionalMoments:
+    """Count, sum and sum of squares of a sampled output per level of its inputs.
+
+    Levels are the values of discrete inputs, numbered consecutively, and
+    ``groups[level]`` is the input a level belongs to. ``first_order``
+    estimates the first-order sensitivity index Var(E[Y | X]) / Var(Y) of
+    every input from the level means, minus the (levels - 1) / n bias the
+    between-level variance has on a finite sample.
+    """
+
+    def __init__(self, groups: np.ndarray):
+        self.groups = groups
+        self.count = np.zeros(len(groups), dtype=np.float64)
+        self.total = np.zeros(len(groups), dtype=np.float64)
+        self.squares = np.zeros(len(groups), dtype=np.float64)
+
+    def add(self, levels: np.ndarray, values: np.ndarray) -> None:
+        """Adds samples; row ``i`` of ``levels`` holds the level of every input in sample ``i``."""
+        flat = levels.ravel()
+        repeated = np.repeat(values, levels.shape[1])
+        size = len(self.groups)
+        self.count += np.bincount(flat, minlength=size)
+        self.total += np.bincount(flat, weights=repeated, minlength=size)
+        self.squares += np.bincount(flat, weights=repeated * repeated, minlength=size)
+
+    def first_order(self, samples: int, mean: float, variance: float) -> np.ndarray:
+        inputs = int(self.groups.max()) + 1 if len(self.groups) else 0
+        if variance <= 0:
+            return np.zeros(inputs)
+        seen = self.count > 0
+        level_mean = np.divide(self.total, self.count, out=np.zeros_like(self.total), where=seen)
+        between = np.bincount(self.groups, weights=self.count * (level_mean - mean) ** 2, minlength=inputs)
+        within = np.bincount(
+            self.groups, weights=np.maximum(self.squares - self.count * level_mean ** 2, 0.0), minlength=inputs
+        )
+        levels = np.bincount(self.groups, weights=seen, minlength=inputs)
+        return np.maximum(between - (levels - 1) * within / samples, 0.0) / (samples * variance)
+
+
+class UncertaintyModel:
+    """Monte Carlo model of the score over uncertain node attributes.
+
+    Every (node, attribute) pair with a prior is an input. A node's rule
+    points, weight and presence facts depend only on its own inputs, so they
+    are tabulated once per node configuration for every combination of input
+    values, refused above ``UNCERTAINTY_MAX_TABLE_CELLS``; a batch of samples
+    is then one table lookup per uncertain node, and the global rules are
+    resolved once per distinct presence mask. Nodes without inputs fold into
+    constants. ``constant`` holds the score terms
+    that do not depend on node attributes (link density and the topology
+    rules and bonus).
+    """
+
+    def __init__(
+        self,
+        nodes: List[CompactNode],
+        rules: RuleSet,
+        pd_sensitive: bool,
+        constant: float,
+        priors: Dict[str, CategoricalPrior],
+        node_priors: Dict[str, Dict[str, CategoricalPrior]],
+    ):
+        self.rules = rules
+        self.pd_sensitive = pd_sensitive
+        self.constant = constant
+        self.max_weight = max(len(nodes) * 10.0, 1.0)
+        self.presence_bits = {name: 1 << bit for bit, name in enumerate(rules.presence_facts)}
+        self.fixed_points = 0.0
+        self.fixed_weight = 0.0
+        self.fixed_presence = 0
+        self.nodes: List[CompactNode] = []
+        self.node_paths: List[List[str]] = []
+        self.inputs: List[Tuple[int, str, CategoricalPrior]] = []
+        self._global_points: Dict[int, float] = {}
+
+        tables: Dict[Tuple[Any, ...], Tuple[List[float], List[float], List[int]]] = {}
+        points: List[float] = []
+        weights: List[float] = []
+        presence: List[int] = []
+        strides: List[int] = []
+        starts: List[int] = []
+        offsets: List[int] = []
+        for node in nodes:
+            own = node_priors.get(node.id, {})
+            paths = sorted(
+                [(path, prior) for path, prior in priors.items() if path not in own and node.get(path) is None]
+                + list(own.items())
+            )
+            if not paths:
+                facts = rules.facts(node)
+                self.fixed_points += rules.outcome(facts).adjustment
+                self.fixed_weight += node.weight if node.weight is not None else 5.0
+                self.fixed_presence |= self.presence_mask(facts)
+                continue
+            cells = math.prod(len(prior.values) for _, prior in paths)
+            if cells > UNCERTAINTY_MAX_TABLE_CELLS:
+                raise ValueError(
+                    f"Node {node.id}: {cells} combinations of uncertain attributes exceed the limit of "
+                    f"{UNCERTAINTY_MAX_TABLE_CELLS}; use fewer or smaller priors"
+                )
+            key = (scoring_fingerprint(node), tuple(paths))
+            table = tables.get(key)
+            if table is None:
+                table = tables[key] = self.tabulate(node, paths)
+            position = len(self.nodes)
+            self.nodes.append(node)
+            self.node_paths.append([path for path, _ in paths])
+            starts.append(len(self.inputs))
+            offsets.append(len(points))
+            stride = len(table[0])
+            for path, prior in paths:
+                stride //= len(prior.values)
+                strides.append(stride)
+                self.inputs.append((position, path, prior))
+            points.extend(table[0])
+            weights.extend(table[1])
+            presence.extend(table[2])
+
+        sizes = np.array([len(prior.values) for _, _, prior in self.inputs], dtype=np.int64)
+        self.points = np.array(points, dtype=np.float64)
+        self.weights = np.array(weights, dtype=np.float64)
+        self.presence = np.array(presence, dtype=np.int64)
+        self.strides = np.array(strides, dtype=np.int64)
+        self.starts = np.array(starts, dtype=np.int64)
+        self.offsets = np.array(offsets, dtype=np.int64)
+        self.limits = sizes - 1
+        self.levels = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.int64) if len(sizes) else sizes
+        self.level_inputs = np.repeat(np.arange(len(sizes)), sizes)
+        self.cell_nodes = np.repeat(np.arange(len(self.nodes)), np.diff(np.append(self.offsets, len(points))))
+        self.prior_columns: Dict[CategoricalPrior, List[int]] = {}
+        for column, (_, _, prior) in enumerate(self.inputs):
+            self.prior_columns.setdefault(prior, []).append(column)
+
+    def presence_mask(self, facts: Tuple[Any, ...]) -> int:
+        mask = 0
+        for name in self.rules.present(facts):
+            mask |= self.presence_bits[name]
+        return mask
+
+    def tabulate(
+        self, node: CompactNode, paths: List[Tuple[str, CategoricalPrior]]
+    ) -> Tuple[List[float], List[float], List[int]]:
+        """Rule points, weight and presence mask of ``node`` for every combination of its input values."""
+        points: List[float] = []
+        weights: List[float] = []
+        presence: List[int] = []
+        for combination in itertools.product(*(prior.values for _, prior in paths)):
+            variant = node
+            for (path, _), value in zip(paths, combination):
+                variant = variant.replaced(path, value)
+            facts = self.rules.facts(variant)
+            points.append(self.rules.outcome(facts).adjustment)
+            weights.append(variant.weight if variant.weight is not None else 5.0)
+            presence.append(self.presence_mask(facts))
+        return points, weights, presence
+
+    def global_points(self, mask: int) -> float:
+        points = self._global_points.get(mask)
+        if points is None:
+            present = {name for name, bit in self.presence_bits.items() if mask & bit}
+            points = self._global_points[mask] = apply_global_controls(self.rules, [], present, self.pd_sensitive)[0]
+        return points
+
+    def sample(self, rng: np.random.Generator, count: int) -> np.ndarray:
+        """Value index of every input in ``count`` samples, shape ``(count, inputs)``."""
+        indexes = np.empty((count, len(self.inputs)), dtype=np.int64)
+        for prior, columns in self.prior_columns.items():
+            draws = rng.random((count, len(columns)))
+            indexes[:, columns] = np.searchsorted(np.array(prior.cumulative), draws, side="right")
+        return np.minimum(indexes, self.limits)
+
+    def evaluate(self, indexes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Scores of sampled input ``indexes``, and the table cell each uncertain node used."""
+        count = len(indexes)
+        if self.inputs:
+            cells = np.add.reduceat(indexes * self.strides, self.starts, axis=1) + self.offsets
+            points = self.points[cells].sum(axis=1)
+            weights = self.weights[cells].sum(axis=1)
+            presence = np.bitwise_or.reduce(self.presence[cells], axis=1) | self.fixed_presence
+        else:
+            cells = np.empty((count, 0), dtype=np.int64)
+            points = weights = np.zeros(count)
+            presence = np.full(count, self.fixed_presence, dtype=np.int64)
+        masks, inverse = np.unique(presence, return_inverse=True)
+        global_points = np.array([self.global_points(mask) for mask in masks.tolist()])[inverse.ravel()]
+        weight_ratio = np.minimum(1.0, (self.fixed_weight + weights) / self.max_weight)
+        scores = weight_ratio * 45.0 + self.constant + self.fixed_points + points + global_points
+        return np.clip(scores, 0.0, 100.0), cells
+
+    def run(self, samples: int, seed: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Sampled scores with the first-order sensitivity index of every input and every uncertain node."""
+        rng = np.random.default_rng(seed)
+        chunk = max(1, UNCERTAINTY_CHUNK_CELLS // max(len(self.inputs), 1))
+        scores = np.empty(samples, dtype=np.float64)
+        by_input = ConditionalMoments(self.level_inputs)
+        by_node = ConditionalMoments(self.cell_nodes)
+        for start in range(0, samples, chunk):
+            indexes = self.sample(rng, min(chunk, samples - start))
+            values, cells = self.evaluate(indexes)
+            scores[start:start + len(values)] = values
+            by_input.add(indexes + self.levels, values)
+            by_node.add(cells, values)
+        mean, variance = float(scores.mean()), float(scores.var())
+        return scores, by_input.first_order(samples, mean, variance), by_node.first_order(samples, mean, variance)
+
+
+def analyze_uncertainty(request: UncertaintyRequest) -> Dict[str, Any]:
+    """Score distribution over the priors and the nodes and attributes that drive its variance.
+
+    ``variance_share`` is a first-order sensitivity index: the fraction of
+    the score variance removed by knowing that node's (or, summed over nodes,
+    that attribute's) true values. ``first_order_total`` below 1 means the
+    clamp to 0..100 or global rules make the inputs interact.
+    """
+    nodes = request.compact_nodes()
+    unknown = sorted(set(request.node_priors) - {node.id for node in nodes})
+    if unknown:
+        raise ValueError(f"Unknown node ids in node_priors: {', '.join(unknown[:10])}")
+    selected = {path: AttributePrior(**spec) for path, spec in UNCERTAINTY_DEFAULT_PRIORS.items()}
+    selected.update(request.priors)
+    priors = {path: categorical_prior(path, prior) for path, prior in selected.items() if prior is not None}
+    node_priors = {
+        node_id: {path: categorical_prior(path, prior) for path, prior in own.items()}
+        for node_id, own in request.node_priors.items()
+    }
+
+    metrics, _, unique_edges = score_request(request)
+    if not nodes:
+        return {
+            "samples": 0,
+            "seed": request.seed,
+            "baseline": metrics["value"],
+            "uncertain_nodes": 0,
+            "uncertain_inputs": 0,
+            "distribution": None,
+            "first_order_total": 0.0,
+            "attributes": [],
+            "nodes": [],
+        }
+    total_nodes = len(nodes)
+    max_edges = total_nodes * (total_nodes - 1) // 2
+    connection_ratio = 1.0 if max_edges == 0 else min(1.0, len(unique_edges) / max_edges)
+    threat = request.threat_model
+    model = UncertaintyModel(
+        nodes,
+        current_rules(threat.is_fstec_compliant, is_quantum_threat(threat)),
+        threat.has_large_pd_storage,
+        connection_ratio * 25.0 + metrics["topology_bonus"] + metrics["topology"]["adjustment"],
+        priors,
+        node_priors,
+    )
+    scores, input_shares, node_shares = model.run(request.samples, request.seed)
+
+    attributes: Dict[str, List[float]] = {}
+    for (_, path, _), share in zip(model.inputs, input_shares.tolist()):
+        entry = attributes.setdefault(path, [0, 0.0])
+        entry[0] += 1
+        entry[1] += share
+    ranked_nodes = []
+    for position in np.argsort(-node_shares, kind="stable")[:request.top].tolist():
+        if node_shares[position] <= 0:
+            break
+        node = model.nodes[position]
+        table = model.points[model.cell_nodes == position]
+        ranked_nodes.append({
+            "id": node.id,
+            "name": node.name,
+            "attributes": model.node_paths[position],
+            "variance_share": round(float(node_shares[position]), 4),
+            "points_range": [float(table.min()), float(table.max())],
+        })
+
+    return {
+        "samples": request.samples,
+        "seed": request.seed,
+        "baseline": metrics["value"],
+        "uncertain_nodes": len(model.nodes),
+        "uncertain_inputs": len(model.inputs),
+        "distribution": {
+            "mean": round(float(scores.mean()), 2),
+            "std": round(float(scores.std()), 2),
+            "min": round(float(scores.min()), 2),
+            "max": round(float(scores.max()), 2),
+            "percentiles": {
+                f"p{q}": round(value, 2)
+                for q, value in zip(UNCERTAINTY_PERCENTILES, np.percentile(scores, UNCERTAINTY_PERCENTILES).tolist())
+            },
+            # Samples per 10-point score band, 0-10 through 90-100.
+            "histogram": np.bincount(np.minimum(scores // 10, 9).astype(np.int64), minlength=10).tolist(),
+        },
+        "first_order_total": round(float(node_shares.sum()), 4),
+        "attributes": [
+            {"attribute": path, "nodes": int(count), "variance_share": round(share, 4)}
+            for path, (count, share) in sorted(attributes.items(), key=lambda item: -item[1][1])
+        ],
+        "nodes": ranked_nodes,
+    }